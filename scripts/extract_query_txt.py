@@ -1,7 +1,14 @@
-import sys
+import argparse
+import os
+import re
+from typing import Dict, Iterable, List, Tuple
 
 INPUT_FILE = "data/TPC-H_v3.0.1.txt"
+OUTPUT_DIR = "data"
 QUERY_HEADER = "Query Definitions"
+QUERY_PATTERN = r"Q(\d+)"
+QUERY_END_MARKER = "General Requirements for Refresh functions"
+NUM_QUERIES = 22
 
 
 def remove_preamble(
@@ -33,23 +40,205 @@ def trim(
     return text[query_beginning_index:query_ending_index]
 
 
-if __name__ == "__main__":
+def build_boundary_index(
+    text: str,
+    pattern: str = QUERY_PATTERN
+) -> Dict[str, int]:
+    """
+    Scan the text once and map every section id to the offset of its
+    first occurrence. The id is the first capture group of the pattern
+    (or the whole match if the pattern has no groups).
+    """
+    boundary_re = re.compile(pattern)
+    index: Dict[str, int] = {}
+    for match in boundary_re.finditer(text):
+        section_id = match.group(1) if boundary_re.groups else match.group(0)
+        if section_id not in index:
+            index[section_id] = match.start()
+    return index
+
+
+def segment(
+    text: str,
+    index: Dict[str, int],
+    end_marker: str = None,
+    order: str = "id"
+) -> List[Tuple[str, str]]:
+    """
+    Split the text into (section_id, section_text) pairs.
+
+    With order="id" (default) section n runs up to the first occurrence
+    of the next id, exactly like the single query mode, so a forward
+    mention (e.g. "see Q17") never moves a boundary. This requires
+    numeric ids; otherwise sections run up to the next boundary in
+    offset order (order="position").
+    The last section runs up to the end marker (or the end of the text).
+    """
+    if not index:
+        return []
+    if order == "id" and all(section_id.isdigit() for section_id in index):
+        boundaries = sorted(index.items(), key=lambda item: int(item[0]))
+    else:
+        boundaries = sorted(index.items(), key=lambda item: item[1])
+
+    text_end = len(text)
+    if end_marker is not None:
+        end_index = text.find(end_marker)
+        if end_index == -1:
+            raise ValueError(f"Could not find the end marker: {end_marker}")
+        text_end = end_index
 
-    if len(sys.argv) < 2:
-        raise ValueError("Please provide a query_id as a command line argument.")
+    sections = []
+    for k, (section_id, start) in enumerate(boundaries):
+        end = boundaries[k + 1][1] if k + 1 < len(boundaries) else text_end
+        sections.append((section_id, text[start:end]))
+    return sections
 
-    query_id: str = sys.argv[1]
-    output_file = f"data/q{query_id}.txt"
 
-    with open(INPUT_FILE, "r") as f:
+def write_sections(
+    sections: Iterable[Tuple[str, str]],
+    output_dir: str = OUTPUT_DIR,
+    name_template: str = "q{id}.txt",
+    section_ids: Iterable[str] = None
+) -> List[str]:
+
+    wanted = set(section_ids) if section_ids is not None else None
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for section_id, section_text in sections:
+        if wanted is not None and section_id not in wanted:
+            continue
+        output_file = os.path.join(output_dir, name_template.format(id=section_id))
+        with open(output_file, "w") as f:
+            f.write(section_text)
+        written.append(output_file)
+
+    if wanted is not None:
+        found = {section_id for section_id, _ in sections}
+        missing = sorted(wanted - found)
+        if missing:
+            raise ValueError(f"Could not find sections: {', '.join(missing)}")
+    return written
+
+
+def extract_sections(
+    input_file: str = INPUT_FILE,
+    output_dir: str = OUTPUT_DIR,
+    pattern: str = QUERY_PATTERN,
+    header: str = QUERY_HEADER,
+    end_marker: str = QUERY_END_MARKER,
+    name_template: str = "q{id}.txt",
+    section_ids: Iterable[str] = None,
+    order: str = "id"
+) -> List[str]:
+    """Read the document once and write every (or every requested) section."""
+    with open(input_file, "r") as f:
+        text = f.read()
+    if header:
+        text = remove_preamble(text, header)
+    index = build_boundary_index(text, pattern)
+    sections = segment(text, index, end_marker, order)
+    return write_sections(sections, output_dir, name_template, section_ids)
+
+
+def extract_query(
+    query_id: str,
+    input_file: str = INPUT_FILE,
+    output_dir: str = OUTPUT_DIR
+) -> str:
+    """Single-query mode, kept for backwards compatibility."""
+    output_file = os.path.join(output_dir, f"q{query_id}.txt")
+
+    with open(input_file, "r") as f:
         text = f.read()
     text = remove_preamble(text)
     query_beginning = f"Q{query_id}"
-    if int(query_id) < 22:
+    if int(query_id) < NUM_QUERIES:
         query_ending = f"Q{int(query_id) + 1}"
     else:
-        query_ending = "General Requirements for Refresh functions"
+        query_ending = QUERY_END_MARKER
 
     trimmed_text = trim(text, query_beginning, query_ending)
     with open(output_file, "w") as f:
         f.write(trimmed_text)
+    return output_file
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description=(
+            "Extract TPC-H queries (or any sections delimited by a boundary "
+            "pattern) from a specification text file."
+        )
+    )
+    parser.add_argument(
+        "query_id",
+        nargs="?",
+        default=None,
+        help="Extract a single query (legacy mode)."
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Extract every section found in a single pass."
+    )
+    parser.add_argument(
+        "--ids",
+        nargs="+",
+        default=None,
+        help="Extract only these section ids in a single pass."
+    )
+    parser.add_argument("--input", type=str, default=INPUT_FILE)
+    parser.add_argument("--output_dir", type=str, default=OUTPUT_DIR)
+    parser.add_argument(
+        "--pattern",
+        type=str,
+        default=QUERY_PATTERN,
+        help="Regex marking section boundaries; group 1 is the section id."
+    )
+    parser.add_argument(
+        "--header",
+        type=str,
+        default=QUERY_HEADER,
+        help="Text before the first occurrence of this header is dropped."
+    )
+    parser.add_argument(
+        "--end_marker",
+        type=str,
+        default=QUERY_END_MARKER,
+        help="The last section ends at this marker."
+    )
+    parser.add_argument(
+        "--name_template",
+        type=str,
+        default="q{id}.txt",
+        help="Output file name, {id} is replaced by the section id."
+    )
+    parser.add_argument(
+        "--order",
+        choices=["id", "position"],
+        default="id",
+        help=(
+            "End each section at the next numeric id (default) or at the "
+            "next boundary in the text."
+        )
+    )
+    args = parser.parse_args()
+
+    if args.all or args.ids:
+        written = extract_sections(
+            input_file=args.input,
+            output_dir=args.output_dir,
+            pattern=args.pattern,
+            header=args.header,
+            end_marker=args.end_marker or None,
+            name_template=args.name_template,
+            section_ids=args.ids,
+            order=args.order
+        )
+        print(f"Wrote {len(written)} sections to {args.output_dir}.")
+    elif args.query_id is not None:
+        extract_query(args.query_id, args.input, args.output_dir)
+    else:
+        raise ValueError("Please provide a query_id, --ids or --all.")
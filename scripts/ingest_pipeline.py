@@ -0,0 +1,352 @@
+"""
+End-to-end ingestion of reference documents.
+
+Chains the steps that used to be run by hand:
+1) PDF extraction (pdf_to_txt.py), only for .pdf inputs
+2) Preprocessing (preprocess_txt.py)
+3) Optional segmentation of the preprocessed text into sections
+   (extract_query_txt.py), written with its name template
+4) Reference indexing: a MinHash sketch of every reference
+   (long_form_metrics.MinHasher), next to it as .sketch.json, which
+   PreScreen can load instead of sketching the reference again
+
+Every stage records the content hash of its inputs and outputs in a
+per-document manifest, keyed by the full path of the source, so
+re-running the pipeline only rebuilds the artifacts whose inputs
+changed. Each reference is indexed as its own stage, so editing one
+section only re-sketches that section. Outputs of a previous run that a
+rebuild no longer produces are removed. Independent documents run in
+parallel; their artifacts are named after the document, so two sources
+with the same file name cannot share an output directory.
+
+Usage:
+    PYTHONPATH=src python3 scripts/ingest_pipeline.py data/frankenstein.txt
+    PYTHONPATH=src python3 scripts/ingest_pipeline.py data/TPC-H_v3.0.1.pdf \
+        --segment_pattern "Q(\\d+)" --segment_header "Query Definitions" \
+        --segment_end_marker "General Requirements for Refresh functions"
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from extract_query_txt import (
+    build_boundary_index,
+    remove_preamble,
+    segment,
+    write_sections
+)
+from preprocess_txt import preprocess_text
+
+MANIFEST_SUFFIX = ".manifest.json"
+SKETCH_SUFFIX = ".sketch.json"
+DEFAULT_SEGMENT_NAME_TEMPLATE = "{stem}_q{id}.txt"
+INDEX_STAGE_PREFIX = "index:"
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def params_sha256(params: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+class Manifest:
+    """Stage records of a single document, persisted as JSON."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stages: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.stages = json.load(f)
+
+    def is_fresh(
+        self,
+        stage: str,
+        inputs: List[str],
+        params: dict
+    ) -> bool:
+        record = self.stages.get(stage)
+        if record is None:
+            return False
+        if record["params"] != params_sha256(params):
+            return False
+        if record["inputs"] != {p: file_sha256(p) for p in inputs}:
+            return False
+        for output, sha in record["outputs"].items():
+            if not os.path.exists(output) or file_sha256(output) != sha:
+                return False
+        return True
+
+    def record(
+        self,
+        stage: str,
+        inputs: List[str],
+        outputs: List[str],
+        params: dict
+    ):
+        self.stages[stage] = {
+            "params": params_sha256(params),
+            "inputs": {p: file_sha256(p) for p in inputs},
+            "outputs": {p: file_sha256(p) for p in outputs},
+        }
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.stages, f, indent=2)
+
+
+def _write_text(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def stage_pdf(source: str, out_dir: str, stem: str) -> List[str]:
+    # fitz is only needed for PDF inputs
+    from pdf_to_txt import extract_text_from_pdf
+    from pdf_to_txt import remove_preamble as remove_pdf_preamble
+
+    txt_path = os.path.join(out_dir, f"{stem}.txt")
+    text = remove_pdf_preamble(extract_text_from_pdf(source))
+    _write_text(txt_path, text)
+    return [txt_path]
+
+
+def stage_preprocess(txt_path: str, out_dir: str, stem: str) -> List[str]:
+    output_path = os.path.join(out_dir, f"{stem}_preprocessed.txt")
+    with open(txt_path, "r") as f:
+        text = f.read()
+    _write_text(output_path, preprocess_text(text))
+    return [output_path]
+
+
+def stage_segment(
+    preprocessed_path: str,
+    out_dir: str,
+    stem: str,
+    pattern: str,
+    header: str,
+    end_marker: str,
+    name_template: str
+) -> List[str]:
+    with open(preprocessed_path, "r") as f:
+        text = f.read()
+    if header:
+        text = remove_preamble(text, header)
+    index = build_boundary_index(text, pattern)
+    return write_sections(
+        segment(text, index, end_marker),
+        out_dir,
+        name_template.replace("{stem}", stem)
+    )
+
+
+def stage_index(reference_path: str, num_perm: int, shingle_words: int) -> List[str]:
+    from long_form_metrics import MinHasher, text_to_words
+
+    hasher = MinHasher(num_perm=num_perm, shingle_words=shingle_words)
+    with open(reference_path, "r", encoding="utf-8") as f:
+        words = text_to_words(f.read(), lower=hasher.lower)
+    sketch_path = os.path.splitext(reference_path)[0] + SKETCH_SUFFIX
+    with open(sketch_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "reference": reference_path,
+            "hasher": list(hasher.params),
+            "num_words": len(words),
+            **hasher.sketch(words).to_dict(),
+        }, f)
+    return [sketch_path]
+
+
+def manifest_path(source: str, out_dir: str) -> str:
+    """Manifest of a source, keyed by its full path."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    key = hashlib.sha256(os.path.abspath(source).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(out_dir, f"{stem}.{key}{MANIFEST_SUFFIX}")
+
+
+def run_document(
+    source: str,
+    out_dir: str,
+    segment_pattern: str = None,
+    segment_header: str = None,
+    segment_end_marker: str = None,
+    segment_name_template: str = DEFAULT_SEGMENT_NAME_TEMPLATE,
+    index: bool = True,
+    sketch_num_perm: int = 256,
+    sketch_shingle_words: int = 5,
+    force: bool = False
+) -> dict:
+    """Run every stage for one document, skipping the fresh ones."""
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    manifest = Manifest(manifest_path(source, out_dir))
+    rebuilt = []
+
+    def drop_stage(name):
+        for output in manifest.stages.pop(name)["outputs"]:
+            if os.path.exists(output):
+                os.remove(output)
+        manifest.save()
+
+    def run_stage(name, inputs, params, build):
+        if not force and manifest.is_fresh(name, inputs, params):
+            return list(manifest.stages[name]["outputs"])
+        previous = manifest.stages.get(name, {}).get("outputs", {})
+        outputs = build()
+        for stale in set(previous) - set(outputs):
+            if os.path.exists(stale):
+                os.remove(stale)
+        manifest.record(name, inputs, outputs, params)
+        manifest.save()
+        # One entry for all the index stages of the document
+        label = name.split(":")[0]
+        if label not in rebuilt:
+            rebuilt.append(label)
+        return outputs
+
+    if source.lower().endswith(".pdf"):
+        txt_path, = run_stage(
+            "pdf", [source], {},
+            lambda: stage_pdf(source, out_dir, stem)
+        )
+    else:
+        txt_path = source
+
+    preprocessed_path, = run_stage(
+        "preprocess", [txt_path], {},
+        lambda: stage_preprocess(txt_path, out_dir, stem)
+    )
+    references = [preprocessed_path]
+
+    if segment_pattern:
+        segment_params = {
+            "pattern": segment_pattern,
+            "header": segment_header,
+            "end_marker": segment_end_marker,
+            "name_template": segment_name_template,
+        }
+        references = run_stage(
+            "segment", [preprocessed_path], segment_params,
+            lambda: stage_segment(
+                preprocessed_path, out_dir, stem,
+                segment_pattern, segment_header, segment_end_marker,
+                segment_name_template
+            )
+        )
+
+    indexes = []
+    index_stages = set()
+    if index:
+        index_params = {
+            "num_perm": sketch_num_perm,
+            "shingle_words": sketch_shingle_words,
+        }
+        for reference in references:
+            name = INDEX_STAGE_PREFIX + reference
+            index_stages.add(name)
+            indexes += run_stage(
+                name, [reference], index_params,
+                lambda reference=reference: stage_index(
+                    reference, sketch_num_perm, sketch_shingle_words
+                )
+            )
+    # Sketches of references that are gone (or of a disabled index)
+    for name in list(manifest.stages):
+        if name.startswith(INDEX_STAGE_PREFIX) and name not in index_stages:
+            drop_stage(name)
+
+    return {
+        "source": source,
+        "references": references,
+        "indexes": indexes,
+        "rebuilt": rebuilt,
+    }
+
+
+def run_pipeline(
+    sources: List[str],
+    out_dir: str,
+    workers: int = None,
+    **kwargs
+) -> List[dict]:
+    stems = [os.path.splitext(os.path.basename(source))[0] for source in sources]
+    duplicates = sorted({stem for stem in stems if stems.count(stem) > 1})
+    if duplicates:
+        raise ValueError(
+            f"Sources with the same name would share artifacts in {out_dir}: "
+            + ", ".join(duplicates)
+        )
+    if len(sources) == 1 or workers == 1:
+        return [run_document(source, out_dir, **kwargs) for source in sources]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_document, source, out_dir, **kwargs)
+            for source in sources
+        ]
+        return [future.result() for future in futures]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Build preprocessed and indexed reference texts from PDF/TXT documents."
+    )
+    parser.add_argument("sources", nargs="+", help="Input .pdf or .txt files.")
+    parser.add_argument("--out_dir", type=str, default="data")
+    parser.add_argument(
+        "--segment_pattern",
+        type=str,
+        default=None,
+        help="Regex marking section boundaries; enables segmentation."
+    )
+    parser.add_argument("--segment_header", type=str, default=None)
+    parser.add_argument("--segment_end_marker", type=str, default=None)
+    parser.add_argument(
+        "--segment_name_template",
+        type=str,
+        default=DEFAULT_SEGMENT_NAME_TEMPLATE,
+        help="Section file name; {id} is the section id, {stem} the document name."
+    )
+    parser.add_argument(
+        "--no_index",
+        action="store_true",
+        help="Skip the MinHash sketches of the references."
+    )
+    parser.add_argument("--sketch_num_perm", type=int, default=256)
+    parser.add_argument("--sketch_shingle_words", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild every artifact even if it is up to date."
+    )
+    args = parser.parse_args()
+
+    results = run_pipeline(
+        args.sources,
+        args.out_dir,
+        workers=args.workers,
+        segment_pattern=args.segment_pattern,
+        segment_header=args.segment_header,
+        segment_end_marker=args.segment_end_marker,
+        segment_name_template=args.segment_name_template,
+        index=not args.no_index,
+        sketch_num_perm=args.sketch_num_perm,
+        sketch_shingle_words=args.sketch_shingle_words,
+        force=args.force
+    )
+    for result in results:
+        rebuilt = ", ".join(result["rebuilt"]) or "nothing (up to date)"
+        print(f"{result['source']}: rebuilt {rebuilt}")
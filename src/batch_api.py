@@ -0,0 +1,351 @@
+"""
+Provider batch APIs.
+
+Latency-tolerant workloads (BoN attempts, sweeps) can send many
+conversations as one asynchronous batch job instead of one synchronous
+request each; batches are billed at a discount and have their own,
+larger quota.
+
+- OpenAI/Moonshot: JSONL file uploaded to /files, job on /batches,
+  results in the output file
+- Anthropic:       /v1/messages/batches, results as JSONL
+- Google:          models/<model>:batchGenerateContent with inlined
+                   requests, results inlined in the finished operation
+
+Request bodies and responses are exactly those of the synchronous path
+(llm_chat.*_payload / parse_*_completion), so batch results go through
+the same response cache. Providers without a batch API (DeepSeek, the
+synthetic model) and requests a batch did not answer are sent through
+get_completion instead, including every request of a batch that failed
+or did not finish within its timeout (which is then cancelled).
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import json
+import time
+from typing import Dict, List, Optional, Union
+
+import requests
+
+from config import MODEL_TO_PROVIDER, Model, Provider
+from key_pool import PoolEntry
+from llm_chat import (
+    DEFAULT_GENERATION,
+    Completion,
+    GenerationConfig,
+    Usage,
+    anthropic_headers,
+    anthropic_payload,
+    get_completion,
+    google_payload,
+    openai_headers,
+    openai_payload,
+    parse_anthropic_completion,
+    parse_google_completion,
+    parse_openai_completion,
+    with_key_pool
+)
+from response_cache import ResponseCache
+from tracing import annotate, span
+
+
+BATCH_PROVIDERS = (Provider.OPENAI, Provider.MOONSHOT, Provider.CLAUDE, Provider.GOOGLE)
+
+# Seconds between two status checks of a batch job
+DEFAULT_POLL_INTERVAL = 30.0
+# Seconds to wait for a batch job, the providers' completion window
+DEFAULT_BATCH_TIMEOUT = 24 * 3600.0
+
+
+class BatchError(RuntimeError):
+    pass
+
+
+class BatchTimeout(BatchError):
+    pass
+
+
+@dataclass
+class BatchJob:
+    provider: Provider
+    model: Model
+    id: str
+    # The job (and its results) belong to the key that created it
+    entry: PoolEntry
+    custom_ids: List[str]
+    status: str = "submitted"
+    result_location: Optional[str] = None
+    inlined_results: Optional[list] = field(default=None, repr=False)
+
+
+def supports_batch(model: Model) -> bool:
+    return MODEL_TO_PROVIDER.get(model) in BATCH_PROVIDERS
+
+
+def _check(response: requests.Response) -> dict:
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        print("Batch API error:", response.text)
+        raise
+    return response.json()
+
+
+def submit_batch(
+    model: Model,
+    conversations: List[list],
+    generation: GenerationConfig,
+    entry: PoolEntry
+) -> BatchJob:
+    """Create one batch job answering every conversation."""
+    provider = MODEL_TO_PROVIDER[model]
+    custom_ids = [f"request-{i}" for i in range(len(conversations))]
+
+    if provider in (Provider.OPENAI, Provider.MOONSHOT):
+        lines = [
+            json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": openai_payload(model, messages, generation),
+            })
+            for custom_id, messages in zip(custom_ids, conversations)
+        ]
+        upload = _check(requests.post(
+            f"{entry.base_url}/files",
+            headers={"Authorization": f"Bearer {entry.api_key}"},
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", "\n".join(lines).encode("utf-8"))}
+        ))
+        data = _check(requests.post(
+            f"{entry.base_url}/batches",
+            headers=openai_headers(entry.api_key),
+            json={
+                "input_file_id": upload["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+            }
+        ))
+        job_id = data["id"]
+    elif provider == Provider.CLAUDE:
+        data = _check(requests.post(
+            f"{entry.base_url}/v1/messages/batches",
+            headers=anthropic_headers(entry.api_key),
+            json={"requests": [
+                {"custom_id": custom_id, "params": anthropic_payload(model, messages, generation)}
+                for custom_id, messages in zip(custom_ids, conversations)
+            ]}
+        ))
+        job_id = data["id"]
+    elif provider == Provider.GOOGLE:
+        data = _check(requests.post(
+            f"{entry.base_url}/v1beta/models/{model.value}:batchGenerateContent"
+            f"?key={entry.api_key}",
+            json={"batch": {
+                "display_name": f"memorization-{model.value}",
+                "input_config": {"requests": {"requests": [
+                    {
+                        "request": google_payload(model, messages, generation),
+                        "metadata": {"key": custom_id},
+                    }
+                    for custom_id, messages in zip(custom_ids, conversations)
+                ]}},
+            }}
+        ))
+        job_id = data["name"]
+    else:
+        raise ValueError(f"{provider} has no batch API")
+    return BatchJob(provider, model, job_id, entry, custom_ids)
+
+
+def poll_batch(job: BatchJob) -> bool:
+    """Refresh the job status. True once it has finished."""
+    entry = job.entry
+    if job.provider in (Provider.OPENAI, Provider.MOONSHOT):
+        data = _check(requests.get(
+            f"{entry.base_url}/batches/{job.id}",
+            headers=openai_headers(entry.api_key)
+        ))
+        job.status = data["status"]
+        if job.status in ("failed", "cancelled"):
+            raise BatchError(f"Batch {job.id} {job.status}: {data.get('errors')}")
+        job.result_location = data.get("output_file_id")
+        # An expired batch still has the results of the requests it finished
+        return job.status in ("completed", "expired")
+    if job.provider == Provider.CLAUDE:
+        data = _check(requests.get(
+            f"{entry.base_url}/v1/messages/batches/{job.id}",
+            headers=anthropic_headers(entry.api_key)
+        ))
+        job.status = data["processing_status"]
+        job.result_location = data.get("results_url")
+        return job.status == "ended"
+    data = _check(requests.get(f"{entry.base_url}/v1beta/{job.id}?key={entry.api_key}"))
+    job.status = data.get("metadata", {}).get("state", "BATCH_STATE_PENDING")
+    if not data.get("done"):
+        return False
+    if "error" in data:
+        raise BatchError(f"Batch {job.id} failed: {data['error']}")
+    job.inlined_results = (
+        data.get("response", {}).get("inlinedResponses", {}).get("inlinedResponses", [])
+    )
+    return True
+
+
+def cancel_batch(job: BatchJob):
+    """Best-effort cancellation of a job that is no longer waited for."""
+    entry = job.entry
+    try:
+        if job.provider in (Provider.OPENAI, Provider.MOONSHOT):
+            _check(requests.post(
+                f"{entry.base_url}/batches/{job.id}/cancel",
+                headers=openai_headers(entry.api_key)
+            ))
+        elif job.provider == Provider.CLAUDE:
+            _check(requests.post(
+                f"{entry.base_url}/v1/messages/batches/{job.id}/cancel",
+                headers=anthropic_headers(entry.api_key)
+            ))
+        else:
+            _check(requests.post(f"{entry.base_url}/v1beta/{job.id}:cancel?key={entry.api_key}"))
+    except requests.exceptions.RequestException as e:
+        print(f"Could not cancel batch {job.id}: {e}")
+
+
+def _parse_result(parse, body: dict) -> Union[Completion, Exception]:
+    try:
+        return parse(body)
+    except Exception as e:
+        return e
+
+
+def fetch_results(job: BatchJob) -> Dict[str, Union[Completion, Exception]]:
+    """Completion (or error) of every answered request, by custom id."""
+    entry = job.entry
+    results: Dict[str, Union[Completion, Exception]] = {}
+    if job.provider in (Provider.OPENAI, Provider.MOONSHOT):
+        if job.result_location is None:
+            return results
+        response = requests.get(
+            f"{entry.base_url}/files/{job.result_location}/content",
+            headers=openai_headers(entry.api_key)
+        )
+        response.raise_for_status()
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            answer = item.get("response") or {}
+            if item.get("error") or answer.get("status_code") != 200:
+                results[item["custom_id"]] = BatchError(str(item.get("error") or answer))
+            else:
+                results[item["custom_id"]] = _parse_result(parse_openai_completion, answer["body"])
+    elif job.provider == Provider.CLAUDE:
+        response = requests.get(job.result_location, headers=anthropic_headers(entry.api_key))
+        response.raise_for_status()
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            result = item["result"]
+            if result["type"] == "succeeded":
+                results[item["custom_id"]] = _parse_result(
+                    parse_anthropic_completion, result["message"]
+                )
+            else:
+                results[item["custom_id"]] = BatchError(str(result))
+    else:
+        for position, item in enumerate(job.inlined_results or []):
+            # Inlined responses keep the request order; the key is a check
+            custom_id = item.get("metadata", {}).get("key") or job.custom_ids[position]
+            if "response" in item:
+                results[custom_id] = _parse_result(parse_google_completion, item["response"])
+            else:
+                results[custom_id] = BatchError(str(item.get("error")))
+    return results
+
+
+def wait_for_batch(
+    job: BatchJob,
+    poll_interval: Optional[float] = None,
+    timeout: Optional[float] = None
+):
+    """Poll the job until it finishes; BatchError on failure or timeout."""
+    if poll_interval is None:
+        poll_interval = DEFAULT_POLL_INTERVAL
+    if timeout is None:
+        timeout = DEFAULT_BATCH_TIMEOUT
+    start = time.monotonic()
+    while not poll_batch(job):
+        if time.monotonic() - start > timeout:
+            raise BatchTimeout(f"Batch {job.id} still {job.status} after {timeout}s")
+        time.sleep(poll_interval)
+
+
+def batch_completions(
+    model: Model,
+    conversations: List[list],
+    generation: Optional[GenerationConfig] = None,
+    cache: Optional[ResponseCache] = None,
+    poll_interval: Optional[float] = None,
+    timeout: Optional[float] = None
+) -> List[Completion]:
+    """
+    Complete every conversation, in order, through one batch job. Cached
+    conversations are not sent; requests the batch did not answer, or
+    all of them when the batch fails or times out, are sent
+    synchronously.
+    """
+    generation = generation or DEFAULT_GENERATION
+    completions: List[Optional[Completion]] = [None] * len(conversations)
+    keys = [None] * len(conversations)
+    missing = []
+    for i, messages in enumerate(conversations):
+        if cache is not None:
+            keys[i] = cache.key(model.value, generation.to_dict(), messages)
+            entry = cache.get(keys[i])
+            if entry is not None:
+                usage = Usage(**entry["usage"]) if entry["usage"] is not None else None
+                completions[i] = Completion(
+                    entry["text"], usage, finish_reason=entry.get("finish_reason")
+                )
+                continue
+        missing.append(i)
+
+    if missing and supports_batch(model):
+        provider = MODEL_TO_PROVIDER[model]
+        with span("batch.job", model=model.value, requests=len(missing)):
+            job = with_key_pool(
+                provider,
+                lambda entry: submit_batch(
+                    model, [conversations[i] for i in missing], generation, entry
+                )
+            )
+            try:
+                wait_for_batch(job, poll_interval, timeout)
+                results = fetch_results(job)
+            except BatchError as e:
+                print(f"{e}, sending its requests synchronously")
+                if isinstance(e, BatchTimeout):
+                    cancel_batch(job)
+                results = {}
+            annotate(batch_id=job.id, answered=len(results))
+        for custom_id, i in zip(job.custom_ids, missing):
+            result = results.get(custom_id)
+            if isinstance(result, Completion):
+                completions[i] = result
+                if cache is not None:
+                    cache.put(keys[i], {
+                        "text": result.text,
+                        "usage": result.usage.to_dict() if result.usage is not None else None,
+                        **({"finish_reason": result.finish_reason} if result.finish_reason else {}),
+                    })
+            elif result is not None:
+                print(f"Batch request {custom_id} failed, retrying it: {result}")
+
+    for i in missing:
+        if completions[i] is None:
+            completions[i] = get_completion(model, conversations[i], generation, cache)
+    return completions
@@ -0,0 +1,97 @@
+"""
+Early abort of hopeless Best-of-N searches.
+
+The similarity scores of the attempts so far are modelled as draws of a
+Beta distribution (method of moments). Its upper tail above the phase-1
+threshold is the per-attempt success probability p, and
+1 - (1 - p)^remaining the chance that the rest of the budget finds a
+successful prompt. Models that never come close to the threshold have
+scores concentrated far below it, and the search can stop after a few
+attempts instead of spending all of MAX_BEST_OF_N.
+"""
+
+from dataclasses import asdict, dataclass
+import math
+from typing import Sequence, Tuple
+
+# Scores are clipped into (SCORE_EPSILON, 1 - SCORE_EPSILON) and their
+# variance floored, so identical scores still give a proper Beta
+SCORE_EPSILON = 1e-3
+MIN_SCORE_VARIANCE = 1e-4
+
+
+def _beta_continued_fraction(a: float, b: float, x: float) -> float:
+    """Continued fraction of the incomplete beta function (modified Lentz)."""
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 301):
+        m2 = 2 * m
+        for aa in (
+            m * (b - m) * x / ((a - 1.0 + m2) * (a + m2)),
+            -(a + m) * (a + b + m) * x / ((a + m2) * (a + 1.0 + m2)),
+        ):
+            d = 1.0 + aa * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + aa / c
+            c = c if abs(c) > tiny else tiny
+            delta = c * d
+            h *= delta
+        if abs(delta - 1.0) < 3e-14:
+            break
+    return h
+
+
+def regularized_incomplete_beta(a: float, b: float, x: float) -> float:
+    """I_x(a, b), the CDF of Beta(a, b) at x."""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    log_front = (
+        math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+        + a * math.log(x) + b * math.log1p(-x)
+    )
+    if x < (a + 1.0) / (a + b + 2.0):
+        return math.exp(log_front) * _beta_continued_fraction(a, b, x) / a
+    return 1.0 - math.exp(log_front) * _beta_continued_fraction(b, a, 1.0 - x) / b
+
+
+def fit_beta(scores: Sequence[float]) -> Tuple[float, float]:
+    """Method-of-moments Beta(alpha, beta) of scores in [0, 1]."""
+    clipped = [min(max(s, SCORE_EPSILON), 1.0 - SCORE_EPSILON) for s in scores]
+    mean = sum(clipped) / len(clipped)
+    variance = sum((s - mean) ** 2 for s in clipped) / len(clipped)
+    # A Beta needs 0 < variance < mean * (1 - mean)
+    variance = min(max(variance, MIN_SCORE_VARIANCE), 0.99 * mean * (1.0 - mean))
+    common = mean * (1.0 - mean) / variance - 1.0
+    return mean * common, (1.0 - mean) * common
+
+
+@dataclass
+class SuccessEstimate:
+    attempts: int
+    remaining: int
+    alpha: float
+    beta: float
+    # P(score >= threshold) of one more attempt
+    per_attempt: float
+    # P(at least one success in the remaining attempts)
+    within_budget: float
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def estimate_success(
+    scores: Sequence[float],
+    threshold: float,
+    remaining: int
+) -> SuccessEstimate:
+    """Chance that remaining more attempts reach the threshold."""
+    alpha, beta = fit_beta(scores)
+    per_attempt = 1.0 - regularized_incomplete_beta(alpha, beta, threshold)
+    within_budget = -math.expm1(remaining * math.log1p(-min(per_attempt, 1.0 - 1e-15)))
+    return SuccessEstimate(len(scores), remaining, alpha, beta, per_attempt, within_budget)
@@ -8,6 +8,12 @@ MAXIMUM_PHASE1_TOKENS = 1000
 MAXIMUM_OUTPUT_TOKENS = 1000
 PHASE1_SUCCESS_THRESHOLD = 0.6
 MAX_BEST_OF_N = 100
+# BoN attempts scored before an early abort is considered
+BON_EARLY_ABORT_MIN_ATTEMPTS = 10
+# Smallest uncovered part of the reference that gap filling restarts on
+GAP_FILL_MIN_WORDS = 100
+# Times a response cut at the output limit is continued and stitched
+MAX_CONTINUATIONS = 4
 
 
 class Provider(str, Enum):
@@ -16,6 +22,7 @@ class Provider(str, Enum):
     OPENAI = "openai"
     MOONSHOT = "moonshot"
     DEEPSEEK = "deepseek"
+    SYNTHETIC = "synthetic"
 
 
 class Model(str, Enum):
@@ -30,6 +37,7 @@ class Model(str, Enum):
     GEMINI_2_5_PRO = "gemini-2.5-pro"
     GEMINI_3_PRO_PREVIEW = "gemini-3-pro-preview"
     GEMINI_3_FLASH_PREVIEW = "gemini-3-flash-preview"
+    SYNTHETIC_MEMORIZER = "synthetic-memorizer"
 
 
 MODEL_TO_PROVIDER = {
@@ -44,4 +52,44 @@ MODEL_TO_PROVIDER = {
     Model.GEMINI_2_5_PRO: Provider.GOOGLE,
     Model.GEMINI_3_PRO_PREVIEW: Provider.GOOGLE,
     Model.GEMINI_3_FLASH_PREVIEW: Provider.GOOGLE,
+    Model.SYNTHETIC_MEMORIZER: Provider.SYNTHETIC,
+}
+
+# Largest output each model can produce in one call, used when a
+# generation config does not set max_output_tokens (and as a cap when it
+# does). Models missing here fall back to MAXIMUM_OUTPUT_TOKENS.
+MODEL_MAX_OUTPUT_TOKENS = {
+    Model.CLAUDE_OPUS_4_5: 64000,
+    Model.CLAUDE_SONNET_4_5: 64000,
+    Model.GPT_5_2: 128000,
+    Model.GPT_5: 128000,
+    Model.GPT_4O: 16384,
+    Model.KIMI_K2_5: 32768,
+    Model.DEEPSEEK_CHAT: 8192,
+    Model.GEMINI_2_5_FLASH: 65536,
+    Model.GEMINI_2_5_PRO: 65536,
+    Model.GEMINI_3_PRO_PREVIEW: 65536,
+    Model.GEMINI_3_FLASH_PREVIEW: 65536,
+}
+
+# Default endpoint of each provider. Can be overridden with the
+# MEMORIZATION_<PREFIX>_BASE_URL environment variable (e.g. to point at
+# stub_server.py). The names are project-scoped on purpose: the official
+# SDKs already read OPENAI_BASE_URL and friends.
+PROVIDER_BASE_URLS = {
+    Provider.OPENAI: "https://api.openai.com/v1",
+    Provider.MOONSHOT: "https://api.moonshot.ai/v1",
+    Provider.DEEPSEEK: "https://api.deepseek.com",
+    Provider.CLAUDE: "https://api.anthropic.com",
+    Provider.GOOGLE: "https://generativelanguage.googleapis.com",
+}
+
+BASE_URL_ENV_VAR = "MEMORIZATION_{prefix}_BASE_URL"
+
+PROVIDER_ENV_PREFIX = {
+    Provider.OPENAI: "OPENAI",
+    Provider.MOONSHOT: "MOONSHOT",
+    Provider.DEEPSEEK: "DEEPSEEK",
+    Provider.CLAUDE: "ANTHROPIC",
+    Provider.GOOGLE: "GOOGLE",
 }
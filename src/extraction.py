@@ -1,14 +1,29 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
+from datetime import datetime, timezone
+import hashlib
 import json
+import os
 import random
 import string
+import threading
 
 from config import (
+    BON_EARLY_ABORT_MIN_ATTEMPTS,
+    GAP_FILL_MIN_WORDS,
     INITIAL_TEXT_TOKENS,
     MAX_BEST_OF_N,
+    MAX_CONTINUATIONS,
+    MAXIMUM_PHASE1_TOKENS,
     PHASE1_SUCCESS_THRESHOLD
 )
-from long_form_metrics import near_verbatim_metrics
-from metrics import normalized_similarity_score
+from long_form_metrics import (
+    ReferenceIndex,
+    near_verbatim_blocks,
+    near_verbatim_metrics,
+    uncovered_gaps
+)
+from metrics import normalized_similarity_score, position_aware_similarity_score
 from permutator import BoNPermutator
 from utils import (
     get_first_tokens_from_text,
@@ -19,7 +34,30 @@ from prompt import (
     INITIAL_INSTRUCTIONS,
     CONTINUATION_INSTRUCTIONS
 )
-from llm_chat import LLMChat
+from batch_api import batch_completions
+from bon_stopping import SuccessEstimate, estimate_success
+from llm_chat import (
+    DEFAULT_GENERATION,
+    FINISH_LENGTH,
+    FINISH_STOP,
+    GenerationConfig,
+    LLMChat,
+    Usage,
+    output_token_limit
+)
+from response_cache import ResponseCache
+from result_store import ResultStore
+
+
+def _union_spans(spans: list) -> list:
+    """Sorted, disjoint union of [start, end) spans."""
+    union = []
+    for start, end in sorted(spans):
+        if union and start <= union[-1][1]:
+            union[-1] = (union[-1][0], max(union[-1][1], end))
+        else:
+            union.append((start, end))
+    return union
 
 
 class Extractor:
@@ -31,10 +69,44 @@ class Extractor:
         max_iterations: int = None,
         verbose: bool = False,
         log_path: str = None,
-        best_of_n: bool = False
+        best_of_n: bool = False,
+        generation: GenerationConfig = None,
+        cache: ResponseCache = None,
+        reference_index: ReferenceIndex = None,
+        pipeline: bool = False,
+        position_aware: bool = False,
+        document: str = None,
+        store: ResultStore = None,
+        batch_size: int = None,
+        prompt_cache: bool = False,
+        candidates_per_call: int = 1,
+        early_abort_level: float = None,
+        gap_filling: bool = False
     ):
         self.model = model
         self.reference_text = reference_text
+        # Name of the reference in the result store
+        self.document = document or "sha256:" + hashlib.sha256(
+            reference_text.encode("utf-8")
+        ).hexdigest()[:16]
+        self.store = store
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.generation = generation or DEFAULT_GENERATION
+        # Phase 1 only scores the start of a response: short calls, and
+        # truncated responses are not continued
+        self.phase1_generation = replace(
+            self.generation,
+            max_output_tokens=min(
+                output_token_limit(model, self.generation),
+                MAXIMUM_PHASE1_TOKENS
+            )
+        )
+        self.cache = cache
+        self.reference_index = reference_index or ReferenceIndex(reference_text)
+        self.reference_num_words = len(text_to_words(reference_text))
+        # Words left to extract from where phase 1 landed
+        self.budget_words = self.reference_num_words
+        # Local estimate until the provider reports real usage, see _keep_response
         self.max_tokens = text_to_num_tokens(reference_text)
         print(
             "--- Reference text tokens: %d ---" %
@@ -56,8 +128,14 @@ class Extractor:
         self.continuation_prompt = CONTINUATION_INSTRUCTIONS
         self.num_iterations = 0
         self.responses = []
+        # Finish reason of each kept response
+        self.finish_reasons = []
         self.verbose = verbose
         self.response_tokens = 0
+        # Every call of the campaign, including discarded BoN attempts
+        self.usage = Usage()
+        self._reported_words = 0
+        self._reported_tokens = 0
         if self.verbose:
             print(f"Initial text (first {INITIAL_TEXT_TOKENS} tokens):\n{self.initial_text}\n")
         self.phase1_successful = False
@@ -66,6 +144,44 @@ class Extractor:
             self.permutator = BoNPermutator(INITIAL_INSTRUCTIONS)
         self.best_of_n_results = {}
         self.best_of_n_iters = 0
+        # BoN attempts sent as provider batch jobs of this many prompts
+        self.batch_size = batch_size
+        # Provider-side caching of the growing phase-2 history
+        self.prompt_cache = prompt_cache
+        # BoN candidates sampled per prompt; each one counts as an attempt.
+        # Only useful at temperature > 0.
+        if candidates_per_call > 1 and self.generation.temperature == 0:
+            raise ValueError(
+                "candidates_per_call > 1 needs temperature > 0, "
+                "greedy candidates are identical"
+            )
+        self.candidates_per_call = candidates_per_call
+        # Abort BoN once the estimated chance of a successful attempt
+        # within the remaining budget is below this level (None: never)
+        self.early_abort_level = early_abort_level
+        self.best_of_n_estimate: SuccessEstimate = None
+        self.best_of_n_aborted = False
+        # Restart phase 2 on the first uncovered part of the reference
+        # when a chain stops adding coverage, see phase2_gap_filling
+        self.gap_filling = gap_filling
+        self.chains = []
+
+        # With the pipeline, the next request is in flight while the
+        # current response is scored, and phase-2 progress (incremental
+        # nv-recall and log checkpoints) is computed on a worker thread.
+        # BoN then sends at most one speculative attempt past the
+        # successful one; its usage is still accounted. Opt-in, since
+        # that attempt is paid for.
+        self.pipeline = pipeline
+        # Phase 1 against the whole reference, see _phase1_score
+        self.position_aware = position_aware
+        self.phase1_match = None
+        self.nv_recall_progress = []
+        self._requests = None
+        self._scoring = None
+        self._pending_progress = None
+        self._speculative = None
+        self._log_lock = threading.Lock()
 
         if log_path is None:
             random_string = "".join(
@@ -75,52 +191,250 @@ class Extractor:
         else:
             self.log_path = log_path
 
+    def _new_chat(self) -> LLMChat:
+        """Chat of a phase-1 attempt; phase 2 goes on with it, see _to_phase2."""
+        return LLMChat(
+            self.model,
+            verbose=self.verbose,
+            generation=self.phase1_generation,
+            cache=self.cache,
+            prompt_cache=self.prompt_cache,
+            max_continuations=0
+        )
+
+    def _to_phase2(self):
+        self.chat.generation = self.generation
+        self.chat.max_continuations = MAX_CONTINUATIONS
+
+    def _record_call(self, chat: LLMChat = None):
+        usage = (chat or self.chat).last_usage
+        if usage is not None:
+            self.usage += usage
+
+    def _record_completion(self, completion):
+        if completion.usage is not None:
+            self.usage += completion.usage
+
+    def _submit(self, executor_name: str, func, *args) -> Future:
+        """Run func on the named worker, or inline without the pipeline."""
+        if not self.pipeline:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        executor = getattr(self, executor_name)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix=f"extractor{executor_name}"
+            )
+            setattr(self, executor_name, executor)
+        return executor.submit(func, *args)
+
+    def _shutdown_pipeline(self):
+        for name in ("_requests", "_scoring"):
+            executor = getattr(self, name)
+            if executor is not None:
+                executor.shutdown(wait=True)
+                setattr(self, name, None)
+
+    def _drain(self):
+        """Wait for the background work and account the speculative call."""
+        if self._pending_progress is not None:
+            self._pending_progress.result()
+            self._pending_progress = None
+        if self._speculative is not None:
+            _, future = self._speculative
+            self._speculative = None
+            try:
+                self._record_completion(future.result())
+            except Exception:
+                pass
+
+    def _keep_response(self, response: str):
+        """
+        Add a response to the extracted text and to the token budget,
+        using the output tokens reported by the provider when available.
+        Reported usage also recalibrates the reference budget.
+        """
+        self.responses.append(response)
+        self.finish_reasons.append(self.chat.last_finish_reason)
+        usage = self.chat.last_usage
+        if usage is None:
+            self.response_tokens += text_to_num_tokens(response)
+            return
+        self.response_tokens += usage.output_tokens
+        self._reported_words += len(text_to_words(response))
+        self._reported_tokens += usage.output_tokens
+        if self._reported_words > 0:
+            self.max_tokens = int(
+                self.budget_words * self._reported_tokens / self._reported_words
+            )
+
+    def _phase1_score(self, response: str) -> float:
+        """
+        Similarity of a phase-1 response. In position-aware mode it is
+        matched against the whole reference, so a correct continuation
+        that starts elsewhere is accepted too.
+        """
+        if not self.position_aware:
+            return normalized_similarity_score(self.expected_suffix, response)
+        match = position_aware_similarity_score(
+            self.reference_index,
+            self.expected_suffix,
+            response
+        )
+        self.phase1_match = match
+        return match.score
+
+    def _seed_position(self):
+        """
+        Budget phase 2 from the reference position phase 1 landed on
+        rather than from the beginning of the reference.
+        """
+        if self.phase1_match is None:
+            return
+        offset = min(self.phase1_match.response_offset, self.reference_num_words)
+        self.budget_words = self.reference_num_words - offset
+        self.max_tokens = int(
+            self.max_tokens * self.budget_words / max(self.reference_num_words, 1)
+        )
+        print(f"--- Phase 1 landed at reference word {offset} ---")
+
+    def _submit_attempt(self):
+        instructions = self.permutator.next()
+        prompt = instructions + "\n\n" + self.prefix
+        chat = self._new_chat()
+        return prompt, self._submit("_requests", chat.sample, prompt, self.candidates_per_call)
+
     def phase1_best_of_n(self):
 
-        for i in range(MAX_BEST_OF_N):
-            print(f"--- Best-of-N iteration {i+1}/{MAX_BEST_OF_N} ---")
-            self.chat = LLMChat(
+        attempt = self._submit_attempt()
+        i = 0
+        while i < MAX_BEST_OF_N:
+            prompt, future = attempt
+            completion = future.result()
+            self._record_completion(completion)
+            candidates = completion.split()[:MAX_BEST_OF_N - i]
+            has_next = i + len(candidates) < MAX_BEST_OF_N
+            attempt = None
+            if self.pipeline and has_next:
+                attempt = self._submit_attempt()
+            for candidate in candidates:
+                print(f"--- Best-of-N iteration {i+1}/{MAX_BEST_OF_N} ---")
+                self.chat = self._new_chat()
+                self.chat.add_exchange(prompt, candidate)
+                response = candidate.text
+                similarity_score = self._phase1_score(response)
+                if self.verbose:
+                    print(f"--- Similarity score: {similarity_score:.4f} ---")
+                self.best_of_n_results[i] = {
+                    "prompt": prompt,
+                    "response": response,
+                    "similarity_score": similarity_score
+                }
+                i += 1
+                if similarity_score >= PHASE1_SUCCESS_THRESHOLD:
+                    print(f"Found a successful prompt in best-of-n iteration {i}.")
+                    self._seed_position()
+                    self._keep_response(response)
+                    self._speculative = attempt
+                    return similarity_score
+                if i < MAX_BEST_OF_N and self._hopeless(i):
+                    self._speculative = attempt
+                    return self._best_of_n_score()
+            if attempt is None and has_next:
+                attempt = self._submit_attempt()
+
+        return self._best_of_n_score()
+
+    def phase1_best_of_n_batched(self):
+        """
+        BoN with the attempts sent as batch jobs of batch_size prompts.
+        Attempts are scored in order and the first successful one wins,
+        as in phase1_best_of_n; the rest of its batch is still billed.
+        """
+        i = 0
+        while i < MAX_BEST_OF_N:
+            size = min(self.batch_size, MAX_BEST_OF_N - i)
+            prompts = [
+                self.permutator.next() + "\n\n" + self.prefix
+                for _ in range(size)
+            ]
+            print(f"--- Best-of-N batch of attempts {i+1}-{i+size}/{MAX_BEST_OF_N} ---")
+            completions = batch_completions(
                 self.model,
-                verbose=self.verbose
+                [[{"role": "user", "content": prompt}] for prompt in prompts],
+                self.phase1_generation,
+                self.cache
             )
-            instructions = self.permutator.next()
-            prompt = instructions + "\n\n" + self.prefix
-            response = self.chat.prompt_chat(prompt)
-            similarity_score = normalized_similarity_score(
-                self.expected_suffix,
-                response
-            )
-            if self.verbose:
-                print(f"--- Similarity score: {similarity_score:.4f} ---")
-            self.best_of_n_results[i] = {
-                "prompt": prompt,
-                "response": response,
-                "similarity_score": similarity_score
-            }
-            if similarity_score >= PHASE1_SUCCESS_THRESHOLD:
-                print(f"Found a successful prompt in best-of-n iteration {i+1}.")
-                self.responses.append(response)
-                self.response_tokens += text_to_num_tokens(response)
-                return similarity_score
-
-        best_similarity_score = max(
+            for completion in completions:
+                if completion.usage is not None:
+                    self.usage += completion.usage
+
+            for prompt, completion in zip(prompts, completions):
+                self.chat = self._new_chat()
+                self.chat.add_exchange(prompt, completion)
+                similarity_score = self._phase1_score(completion.text)
+                if self.verbose:
+                    print(f"--- Similarity score: {similarity_score:.4f} ---")
+                self.best_of_n_results[i] = {
+                    "prompt": prompt,
+                    "response": completion.text,
+                    "similarity_score": similarity_score
+                }
+                i += 1
+                if similarity_score >= PHASE1_SUCCESS_THRESHOLD:
+                    print(f"Found a successful prompt in best-of-n iteration {i}.")
+                    self._seed_position()
+                    self._keep_response(completion.text)
+                    return similarity_score
+            if i < MAX_BEST_OF_N and self._hopeless(i):
+                break
+
+        return self._best_of_n_score()
+
+    def _best_of_n_score(self) -> float:
+        return max(
             result["similarity_score"] for result in self.best_of_n_results.values()
         )
-        return best_similarity_score
 
-    def phase1(self):
-        self.chat = LLMChat(
-            self.model,
-            verbose=self.verbose
+    def _hopeless(self, attempts: int) -> bool:
+        """
+        Whether BoN should stop after this many failed attempts: the Beta
+        estimate of the scores so far (see bon_stopping) gives the rest
+        of the budget less than early_abort_level chance of success.
+        """
+        if self.early_abort_level is None or attempts < BON_EARLY_ABORT_MIN_ATTEMPTS:
+            return False
+        self.best_of_n_estimate = estimate_success(
+            [result["similarity_score"] for result in self.best_of_n_results.values()],
+            PHASE1_SUCCESS_THRESHOLD,
+            MAX_BEST_OF_N - attempts
+        )
+        estimate = self.best_of_n_estimate
+        if self.verbose:
+            print(f"--- Chance of success in the remaining {estimate.remaining} attempts: {estimate.within_budget:.3g} ---")
+        if estimate.within_budget >= self.early_abort_level:
+            return False
+        print(
+            f"Aborting best-of-n after {attempts} attempts: estimated chance of "
+            f"success {estimate.within_budget:.3g} < {self.early_abort_level}."
         )
+        self.best_of_n_aborted = True
+        return True
+
+    def phase1(self):
+        self.chat = self._new_chat()
         response = self.chat.prompt_chat(self.initial_prompt)
-        self.responses.append(response)
-        self.response_tokens += text_to_num_tokens(response)
+        self._record_call()
 
-        similarity_score = normalized_similarity_score(
-            self.expected_suffix,
-            response
-        )
+        similarity_score = self._phase1_score(response)
+        if similarity_score >= PHASE1_SUCCESS_THRESHOLD:
+            self._seed_position()
+        self._keep_response(response)
 
         if self.verbose:
             print(f"Phase 1 - Similarity score: {similarity_score:.4f}")
@@ -129,15 +443,20 @@ class Extractor:
 
     def phase2(self):
 
+        self._to_phase2()
         while True:
             print(
                 "--- Tokens count so far: %d/%d ---" %
                 (self.response_tokens, self.max_tokens)
             )
             response = self.chat.prompt_chat(self.continuation_prompt)
-            self.responses.append(response)
+            self._record_call()
+            self._keep_response(response)
             self.num_iterations += 1
-            self.response_tokens += text_to_num_tokens(response)
+            finish_reason = self.chat.last_finish_reason
+            if finish_reason not in (None, FINISH_STOP, FINISH_LENGTH):
+                print(f"--- Turn {self.num_iterations} stopped by the provider: {finish_reason} ---")
+            self._submit_progress()
             if self.max_iterations and self.num_iterations >= self.max_iterations:
                 print(f"Reached maximum iterations ({self.max_iterations}), stopping extraction.")
                 break
@@ -145,40 +464,215 @@ class Extractor:
                 print(f"Reached maximum token limit ({self.max_tokens}), stopping extraction.")
                 break
 
+    def _coverage(self, responses: list) -> list:
+        """Reference word spans [start, end) the responses reproduce."""
+        blocks = near_verbatim_blocks(
+            None,
+            " ".join(responses),
+            lower=True,
+            reference=self.reference_index
+        )
+        return [(i, i + m) for i, _, m in blocks]
+
+    def _new_chain(self, start: int, responses: list = None) -> dict:
+        responses = responses or []
+        spans = self._coverage(responses) if responses else []
+        chain = {
+            "start": start,
+            "responses": responses,
+            "spans": spans,
+            "covered_words": sum(end - begin for begin, end in spans),
+        }
+        self.chains.append(chain)
+        return chain
+
+    def phase2_gap_filling(self):
+        """
+        Phase 2 as a series of chains. When a turn adds no coverage of
+        the reference, the chain has drifted off: a fresh chat is seeded
+        with the reference words preceding the first large uncovered
+        part and continues from there. Stops when the token budget (or
+        max_iterations) runs out or nothing is left to fill.
+        """
+        self._to_phase2()
+        start = self.phase1_match.response_offset if self.phase1_match else 0
+        chain = self._new_chain(start, list(self.responses))
+        tried = {start}
+        prompt = self.continuation_prompt
+        while True:
+            print(
+                "--- Tokens count so far: %d/%d ---" %
+                (self.response_tokens, self.max_tokens)
+            )
+            response = self.chat.prompt_chat(prompt)
+            prompt = self.continuation_prompt
+            self._record_call()
+            self._keep_response(response)
+            self.num_iterations += 1
+            chain["responses"].append(response)
+            # Only the new response (with the previous one, for blocks
+            # running across them) is aligned, not the whole chain
+            chain["spans"] = _union_spans(
+                chain["spans"] + self._coverage(chain["responses"][-2:])
+            )
+            covered_words = sum(end - begin for begin, end in chain["spans"])
+            progressed = covered_words > chain["covered_words"]
+            chain["covered_words"] = covered_words
+            self._submit_progress()
+            if self.max_iterations and self.num_iterations >= self.max_iterations:
+                print(f"Reached maximum iterations ({self.max_iterations}), stopping extraction.")
+                break
+            if self.response_tokens >= self.max_tokens:
+                print(f"Reached maximum token limit ({self.max_tokens}), stopping extraction.")
+                break
+            if progressed:
+                continue
+
+            gaps = uncovered_gaps(
+                [span for c in self.chains for span in c["spans"]],
+                self.reference_num_words,
+                min_len=GAP_FILL_MIN_WORDS
+            )
+            gap = next((begin for begin, _ in gaps if begin not in tried), None)
+            if gap is None:
+                print("No uncovered part of the reference left, stopping extraction.")
+                break
+            tried.add(gap)
+            print(f"--- Chain diverged, restarting at reference word {gap} ---")
+            words = self.reference_index.words()
+            seed = words[max(gap - len(self.prefix.split()), 0):gap]
+            self.chat = LLMChat(
+                self.model,
+                verbose=self.verbose,
+                generation=self.generation,
+                cache=self.cache,
+                prompt_cache=self.prompt_cache
+            )
+            chain = self._new_chain(gap)
+            prompt = INITIAL_INSTRUCTIONS + "\n\n" + " ".join(seed)
+
+    def _extracted_text(self) -> str:
+        """Kept responses; with gap filling, chains in reference order."""
+        if not self.chains:
+            return " ".join(self.responses)
+        chains = sorted(self.chains, key=lambda chain: chain["start"])
+        return " ".join(response for chain in chains for response in chain["responses"])
+
+    def _submit_progress(self):
+        """
+        Score the text extracted so far in the background. Turns that
+        finish while a previous one is still being scored are coalesced
+        into the next submission; the final score is always exact.
+        """
+        if not self.pipeline:
+            return
+        if self._pending_progress is not None:
+            if not self._pending_progress.done():
+                return
+            self._pending_progress.result()
+        self._pending_progress = self._submit(
+            "_scoring",
+            self._score_progress,
+            self.num_iterations,
+            self.response_tokens,
+            list(self.responses)
+        )
+
+    def _score_progress(self, turn: int, response_tokens: int, responses: list):
+        metrics = near_verbatim_metrics(
+            None,
+            " ".join(responses),
+            lower=True,
+            reference=self.reference_index
+        )
+        with self._log_lock:
+            self.nv_recall_progress.append({
+                "turn": turn,
+                "response_tokens": response_tokens,
+                "nv_recall": metrics.nv_recall,
+            })
+        self._write_log(responses)
+
+    def _log_data(self, responses: list) -> dict:
+        return {
+            "model": self.model,
+            "document": self.document,
+            "created_at": self.created_at,
+            "generation": self.generation.to_dict(),
+            "initial_prompt": self.initial_prompt,
+            "prefix": self.prefix,
+            "responses": responses,
+            "finish_reasons": list(self.finish_reasons),
+            "num_iterations": self.num_iterations,
+            "response_tokens": self.response_tokens,
+            "max_tokens": self.max_tokens,
+            "usage": self.usage.to_dict(),
+            "nv_recall_metrics": getattr(self, "nv_recall_metrics", {}),
+            "nv_recall_progress": list(self.nv_recall_progress),
+            "phase1_similarity": getattr(self, "phase1_similarity", 0.0),
+            "phase1_successful": self.phase1_successful,
+            "phase1_match": self.phase1_match.to_dict() if self.phase1_match else None,
+            "best_of_n": self.best_of_n,
+            "best_of_n_results": dict(self.best_of_n_results) if self.best_of_n else {},
+            "best_of_n_estimate": (
+                self.best_of_n_estimate.to_dict() if self.best_of_n_estimate else None
+            ),
+            "best_of_n_aborted": self.best_of_n_aborted,
+            "chains": [
+                {
+                    "start": chain["start"],
+                    "turns": len(chain["responses"]),
+                    "covered_words": chain["covered_words"],
+                }
+                for chain in self.chains
+            ]
+        }
+
+    def _write_log(self, responses: list):
+        with self._log_lock:
+            data = self._log_data(responses)
+            with open(self.log_path, "w") as f:
+                json.dump(data, f, indent=2)
+
     def extract(self):
-        if self.best_of_n:
+        try:
+            self._extract()
+        finally:
+            self._shutdown_pipeline()
+
+    def _extract(self):
+        if self.best_of_n and self.batch_size:
+            self.phase1_similarity = self.phase1_best_of_n_batched()
+        elif self.best_of_n:
             self.phase1_similarity = self.phase1_best_of_n()
         else:
             self.phase1_similarity = self.phase1()
         if self.phase1_similarity >= PHASE1_SUCCESS_THRESHOLD:
             print("Phase 1 successful, proceeding to Phase 2.")
             self.phase1_successful = True
-            self.phase2()
+            if self.gap_filling:
+                self.phase2_gap_filling()
+            else:
+                self.phase2()
+            self._drain()
             nv_recall = near_verbatim_metrics(
-                self.reference_text,
-                " ".join(self.responses),
-                lower=True
+                None,
+                self._extracted_text(),
+                lower=True,
+                reference=self.reference_index
             )
             self.nv_recall_metrics = nv_recall.to_dict()
             print(f"Final near-verbatim recall: {nv_recall.nv_recall:.6f}")
         else:
+            self._drain()
             self.phase1_successful = False
             self.nv_recall_metrics = {}
             print("Phase 1 was not successful, cannot proceed to Phase 2.")
 
-        data = {
-            "model": self.model,
-            "initial_prompt": self.initial_prompt,
-            "responses": self.responses,
-            "num_iterations": self.num_iterations,
-            "response_tokens": self.response_tokens,
-            "nv_recall_metrics": self.nv_recall_metrics,
-            "phase1_similarity": self.phase1_similarity,
-            "phase1_successful": self.phase1_successful,
-            "best_of_n": self.best_of_n,
-            "best_of_n_results": self.best_of_n_results if self.best_of_n else {}
-        }
-
         print(f"Saving extraction log to {self.log_path}")
-        with open(self.log_path, "w") as f:
-            json.dump(data, f, indent=2)
+        self._write_log(list(self.responses))
+        if self.store is not None:
+            self.store.add_run(
+                self._log_data(list(self.responses)),
+                source=os.path.abspath(self.log_path)
+            )
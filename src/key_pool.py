@@ -0,0 +1,200 @@
+"""
+Pools of API keys / endpoints per provider.
+
+A provider can be given several keys and/or endpoints:
+    OPENAI_API_KEYS=sk-a,sk-b,sk-c
+    MEMORIZATION_OPENAI_BASE_URLS=https://a.example/v1,https://b.example/v1
+(falling back to OPENAI_API_KEY and the single base URL). With one key
+and several endpoints every endpoint uses that key; with several of both
+they are paired in order.
+
+Requests are dispatched round-robin or to the least-loaded entry (fewest
+requests in flight). Each entry tracks its health: rate-limit/quota
+errors quarantine it for Retry-After (or an exponential back-off), and
+repeated server/network errors quarantine it too. A campaign's
+throughput then scales with the number of keys.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import itertools
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import BASE_URL_ENV_VAR, PROVIDER_ENV_PREFIX, Provider
+
+
+ROUND_ROBIN = "round_robin"
+LEAST_LOADED = "least_loaded"
+
+QUOTA_STATUS_CODES = (429, 402)
+DEFAULT_QUARANTINE_SECONDS = 30.0
+MAX_QUARANTINE_SECONDS = 600.0
+MAX_CONSECUTIVE_FAILURES = 3
+
+
+@dataclass
+class PoolEntry:
+    api_key: Optional[str]
+    base_url: str
+    in_flight: int = 0
+    successes: int = 0
+    failures: int = 0
+    rate_limited: int = 0
+    consecutive_failures: int = 0
+    quarantined_until: float = 0.0
+
+    def is_available(self, now: float) -> bool:
+        return self.quarantined_until <= now
+
+    def to_dict(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "quarantined_until": self.quarantined_until,
+        }
+
+
+class KeyPool:
+
+    def __init__(
+        self,
+        entries: List[PoolEntry],
+        strategy: str = LEAST_LOADED,
+        quarantine_seconds: float = DEFAULT_QUARANTINE_SECONDS
+    ):
+        if not entries:
+            raise ValueError("A key pool needs at least one entry")
+        if strategy not in (ROUND_ROBIN, LEAST_LOADED):
+            raise ValueError(f"Invalid strategy: {strategy}")
+        self.entries = entries
+        self.strategy = strategy
+        self.quarantine_seconds = quarantine_seconds
+        self._cursor = itertools.count()
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def num_available(self) -> int:
+        now = time.monotonic()
+        with self._cond:
+            return sum(entry.is_available(now) for entry in self.entries)
+
+    def _pick(self, now: float) -> Optional[PoolEntry]:
+        available = [e for e in self.entries if e.is_available(now)]
+        if not available:
+            return None
+        if self.strategy == ROUND_ROBIN:
+            return available[next(self._cursor) % len(available)]
+        return min(available, key=lambda e: e.in_flight)
+
+    def acquire(self) -> PoolEntry:
+        """Take an entry, waiting for a quarantine to expire if needed."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                entry = self._pick(now)
+                if entry is not None:
+                    entry.in_flight += 1
+                    return entry
+                wake_up = min(e.quarantined_until for e in self.entries)
+                self._cond.wait(timeout=max(0.0, wake_up - now))
+
+    def release(
+        self,
+        entry: PoolEntry,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None
+    ):
+        """
+        Return an entry with the outcome of its request: an HTTP status,
+        or None for a network error.
+        """
+        with self._cond:
+            entry.in_flight -= 1
+            if status is not None and 200 <= status < 300:
+                entry.successes += 1
+                entry.consecutive_failures = 0
+            else:
+                entry.failures += 1
+                entry.consecutive_failures += 1
+                if status in QUOTA_STATUS_CODES:
+                    entry.rate_limited += 1
+                    self._quarantine(entry, retry_after)
+                elif entry.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                    self._quarantine(entry, None)
+            self._cond.notify_all()
+
+    def _quarantine(self, entry: PoolEntry, retry_after: Optional[float]):
+        if retry_after is None:
+            retry_after = min(
+                self.quarantine_seconds * 2 ** (entry.consecutive_failures - 1),
+                MAX_QUARANTINE_SECONDS
+            )
+        entry.quarantined_until = time.monotonic() + retry_after
+
+    def stats(self) -> List[dict]:
+        with self._cond:
+            return [entry.to_dict() for entry in self.entries]
+
+
+def _split(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def pool_entries_from_env(provider: Provider, default_base_url: str) -> List[PoolEntry]:
+    prefix = PROVIDER_ENV_PREFIX[provider]
+    keys = _split(os.getenv(f"{prefix}_API_KEYS")) or [os.getenv(f"{prefix}_API_KEY")]
+    base_urls = _split(os.getenv(BASE_URL_ENV_VAR.format(prefix=prefix) + "S"))
+    base_urls = base_urls or [default_base_url]
+
+    if len(base_urls) == 1:
+        pairs = [(key, base_urls[0]) for key in keys]
+    elif len(keys) == 1:
+        pairs = [(keys[0], url) for url in base_urls]
+    elif len(keys) == len(base_urls):
+        pairs = list(zip(keys, base_urls))
+    else:
+        raise ValueError(
+            f"{prefix}: {len(keys)} keys cannot be paired with {len(base_urls)} endpoints"
+        )
+    return [PoolEntry(api_key=key, base_url=url) for key, url in pairs]
+
+
+_pools: Dict[Provider, Tuple[tuple, KeyPool]] = {}
+_pools_lock = threading.Lock()
+
+
+def get_key_pool(provider: Provider, default_base_url: str) -> KeyPool:
+    """
+    Pool of a provider, rebuilt whenever its environment variables
+    change so health tracking survives across calls but not config edits.
+    """
+    prefix = PROVIDER_ENV_PREFIX[provider]
+    signature = (
+        provider,
+        default_base_url,
+        os.getenv(f"{prefix}_API_KEYS"),
+        os.getenv(f"{prefix}_API_KEY"),
+        os.getenv(BASE_URL_ENV_VAR.format(prefix=prefix) + "S"),
+        os.getenv("MEMORIZATION_KEY_POOL_STRATEGY", LEAST_LOADED),
+    )
+    with _pools_lock:
+        cached = _pools.get(provider)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        pool = KeyPool(
+            pool_entries_from_env(provider, default_base_url),
+            strategy=signature[-1]
+        )
+        _pools[provider] = (signature, pool)
+        return pool
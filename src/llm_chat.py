@@ -1,41 +1,272 @@
+from dataclasses import asdict, dataclass
+import hashlib
+import json
 import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
 import requests
 
 from config import (
+    MAX_CONTINUATIONS,
     MAXIMUM_OUTPUT_TOKENS,
+    MODEL_MAX_OUTPUT_TOKENS,
     Model,
     Provider,
     MODEL_TO_PROVIDER,
-    DEFAULT_TEMPERATURE
+    DEFAULT_TEMPERATURE,
+    PROVIDER_BASE_URLS,
+    PROVIDER_ENV_PREFIX,
+    BASE_URL_ENV_VAR
 )
 from auth import load_api_keys
+from key_pool import PoolEntry, QUOTA_STATUS_CODES, get_key_pool
+from prompt import TRUNCATION_INSTRUCTIONS
+from response_cache import ResponseCache
+from synthetic import get_memorizer
+from tracing import annotate, enabled as tracing_enabled, span, traced
+from utils import text_to_num_tokens
 
 load_api_keys()
 
+T = TypeVar("T")
 
-def call_openai_compatible(
-    model: Model,
-    messages: list,
-    base_url: str,
-    api_key: str,
+# Gemini refuses context caches below a minimum size (4096 tokens for
+# 2.5 Pro, less for Flash); smaller prefixes are sent as they are.
+GOOGLE_CACHE_MIN_TOKENS = 4096
+GOOGLE_CACHE_TTL_SECONDS = 600
+
+# Providers that sample several candidates in one request (OpenAI `n`,
+# Gemini `candidateCount`); the others are sent one request per candidate.
+CANDIDATE_PROVIDERS = (Provider.OPENAI, Provider.MOONSHOT, Provider.GOOGLE)
+
+
+def get_base_url(provider: Provider) -> str:
+    """
+    Endpoint of a provider, overridable with MEMORIZATION_<PREFIX>_BASE_URL.
+    """
+    env_var = BASE_URL_ENV_VAR.format(prefix=PROVIDER_ENV_PREFIX[provider])
+    return os.getenv(env_var) or PROVIDER_BASE_URLS[provider]
+
+
+@dataclass(frozen=True)
+class GenerationConfig:
+    """
+    Sampling parameters of a call. Penalties are only sent when set;
+    Anthropic does not support them. max_output_tokens=None asks for the
+    model's maximum (see output_token_limit).
+    """
     temperature: float = DEFAULT_TEMPERATURE
-) -> str:
+    max_output_tokens: Optional[int] = None
+    frequency_penalty: Optional[float] = None
+    presence_penalty: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+DEFAULT_GENERATION = GenerationConfig()
+
+
+def output_token_limit(model: Model, generation: GenerationConfig) -> int:
+    """max_output_tokens of a call, capped at what the model supports."""
+    maximum = MODEL_MAX_OUTPUT_TOKENS.get(model, MAXIMUM_OUTPUT_TOKENS)
+    if generation.max_output_tokens is None:
+        return maximum
+    return min(generation.max_output_tokens, maximum)
+
 
+# Normalized finish reasons of Completion.finish_reason; other provider
+# reasons are kept, lower-cased
+FINISH_STOP = "stop"
+FINISH_LENGTH = "length"
+FINISH_FILTERED = "content_filter"
+
+_ANTHROPIC_FINISH_REASONS = {
+    "end_turn": FINISH_STOP,
+    "stop_sequence": FINISH_STOP,
+    "max_tokens": FINISH_LENGTH,
+    "refusal": FINISH_FILTERED,
+}
+_GOOGLE_FINISH_REASONS = {
+    "STOP": FINISH_STOP,
+    "MAX_TOKENS": FINISH_LENGTH,
+    "SAFETY": FINISH_FILTERED,
+    "PROHIBITED_CONTENT": FINISH_FILTERED,
+    "BLOCKLIST": FINISH_FILTERED,
+    "SPII": FINISH_FILTERED,
+}
+
+
+def _finish_reason(reason: Optional[str], known: dict) -> Optional[str]:
+    if reason is None:
+        return None
+    return known.get(reason, reason.lower())
+
+
+@dataclass
+class Usage:
     """
-    Calls OpenAI-compatible chat completion endpoint.
+    Token usage reported by a provider. output_tokens only counts the
+    visible text; reasoning/thinking tokens are kept apart because they
+    are billed but do not reproduce any of the reference. input_tokens
+    includes the prompt tokens read from (cached_input_tokens) or
+    written to (cache_write_tokens) a provider's prompt cache.
     """
+    input_tokens: int = 0
+    output_tokens: int = 0
+    reasoning_tokens: int = 0
+    cached_input_tokens: int = 0
+    cache_write_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens + self.reasoning_tokens
+
+    def __add__(self, other: "Usage") -> "Usage":
+        return Usage(
+            input_tokens=self.input_tokens + other.input_tokens,
+            output_tokens=self.output_tokens + other.output_tokens,
+            reasoning_tokens=self.reasoning_tokens + other.reasoning_tokens,
+            cached_input_tokens=self.cached_input_tokens + other.cached_input_tokens,
+            cache_write_tokens=self.cache_write_tokens + other.cache_write_tokens
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "reasoning_tokens": self.reasoning_tokens,
+            "cached_input_tokens": self.cached_input_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+        }
+
+
+@dataclass
+class Completion:
+    text: str
+    # None when the provider did not report usage
+    usage: Optional[Usage] = None
+    # Every sampled text when several candidates were requested; text
+    # is the first one
+    candidates: Optional[List[str]] = None
+    # FINISH_STOP, FINISH_LENGTH, ... (None when not reported)
+    finish_reason: Optional[str] = None
+    # Follow-up calls that completed a truncated response
+    continuations: int = 0
+
+    def split(self) -> List["Completion"]:
+        """
+        One completion per candidate. Each keeps the input tokens of the
+        prompt and gets a share of the output tokens proportional to its
+        length, so only the usage of the whole call adds up to the bill.
+        """
+        if not self.candidates or len(self.candidates) == 1:
+            return [self]
+        if self.usage is None:
+            return [
+                Completion(text, finish_reason=self.finish_reason)
+                for text in self.candidates
+            ]
+        lengths = [len(text.split()) for text in self.candidates]
+        total = sum(lengths) or 1
+        return [
+            Completion(text, Usage(
+                input_tokens=self.usage.input_tokens,
+                output_tokens=round(self.usage.output_tokens * length / total),
+                reasoning_tokens=round(self.usage.reasoning_tokens * length / total)
+            ), finish_reason=self.finish_reason)
+            for text, length in zip(self.candidates, lengths)
+        ]
+
+
+def merge_candidates(completions: List[Completion]) -> Completion:
+    """Several single completions as one multi-candidate completion."""
+    usages = [c.usage for c in completions if c.usage is not None]
+    usage = sum(usages, Usage()) if usages else None
+    texts = [c.text for c in completions]
+    return Completion(texts[0], usage, texts, completions[0].finish_reason)
+
+
+def parse_openai_usage(data: dict) -> Optional[Usage]:
+    usage = data.get("usage")
+    if not usage:
+        return None
+    details = usage.get("completion_tokens_details") or {}
+    reasoning = details.get("reasoning_tokens") or 0
+    prompt_details = usage.get("prompt_tokens_details") or {}
+    return Usage(
+        input_tokens=usage.get("prompt_tokens") or 0,
+        output_tokens=(usage.get("completion_tokens") or 0) - reasoning,
+        reasoning_tokens=reasoning,
+        cached_input_tokens=prompt_details.get("cached_tokens") or 0
+    )
 
-    headers = {
+
+def parse_anthropic_usage(data: dict) -> Optional[Usage]:
+    usage = data.get("usage")
+    if not usage:
+        return None
+    # input_tokens only counts the tokens after the last cache breakpoint
+    cache_read = usage.get("cache_read_input_tokens") or 0
+    cache_write = usage.get("cache_creation_input_tokens") or 0
+    return Usage(
+        input_tokens=(usage.get("input_tokens") or 0) + cache_read + cache_write,
+        output_tokens=usage.get("output_tokens") or 0,
+        cached_input_tokens=cache_read,
+        cache_write_tokens=cache_write
+    )
+
+
+def parse_google_usage(data: dict) -> Optional[Usage]:
+    usage = data.get("usageMetadata")
+    if not usage:
+        return None
+    return Usage(
+        input_tokens=usage.get("promptTokenCount") or 0,
+        output_tokens=usage.get("candidatesTokenCount") or 0,
+        reasoning_tokens=usage.get("thoughtsTokenCount") or 0,
+        cached_input_tokens=usage.get("cachedContentTokenCount") or 0
+    )
+
+
+def _annotate_exchange(
+    response: requests.Response,
+    usage: Optional[Usage]
+):
+    if not tracing_enabled():
+        return
+    annotate(
+        status=response.status_code,
+        bytes_sent=len(response.request.body or b""),
+        bytes_received=len(response.content),
+        **(usage.to_dict() if usage is not None else {})
+    )
+
+
+def openai_headers(api_key: str) -> dict:
+    return {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
 
+
+def openai_payload(
+    model: Model,
+    messages: list,
+    generation: GenerationConfig = DEFAULT_GENERATION,
+    n: int = 1
+) -> dict:
+    """Body of an OpenAI-compatible chat completion request."""
     formatted_messages = []
     for msg in messages:
         if msg["role"] not in ["system", "user", "assistant"]:
             raise ValueError(f"Invalid role: {msg['role']}")
         formatted_messages.append(msg)
 
+    temperature = generation.temperature
     if (
         model == Model.GPT_5 or
         model == Model.KIMI_K2_5
@@ -52,17 +283,55 @@ def call_openai_compatible(
         m in model.value.lower() for m in ["o1", "o3", "gpt-5", "gpt-5.2"]
     )
 
+    # Reasoning models reject sampling parameters (like temperature above)
+    max_tokens = output_token_limit(model, generation)
     if is_reasoning_model:
-        payload["max_completion_tokens"] = MAXIMUM_OUTPUT_TOKENS
+        payload["max_completion_tokens"] = max_tokens
         payload["reasoning_effort"] = "low"
     else:
-        payload["max_tokens"] = MAXIMUM_OUTPUT_TOKENS
+        payload["max_tokens"] = max_tokens
         payload["temperature"] = temperature
+        if generation.frequency_penalty is not None:
+            payload["frequency_penalty"] = generation.frequency_penalty
+        if generation.presence_penalty is not None:
+            payload["presence_penalty"] = generation.presence_penalty
+    if n > 1:
+        payload["n"] = n
+    return payload
+
+
+def parse_openai_completion(data: dict) -> Completion:
+    choices = data.get("choices", [{}])
+    content = choices[0].get("message", {}).get("content")
+    candidates = None
+    if len(choices) > 1:
+        candidates = [choice.get("message", {}).get("content") for choice in choices]
+    return Completion(
+        content,
+        parse_openai_usage(data),
+        candidates,
+        choices[0].get("finish_reason")
+    )
+
+
+@traced("provider.openai_compatible")
+def call_openai_compatible(
+    model: Model,
+    messages: list,
+    base_url: str,
+    api_key: str,
+    generation: GenerationConfig = DEFAULT_GENERATION,
+    n: int = 1
+) -> Completion:
+
+    """
+    Calls OpenAI-compatible chat completion endpoint.
+    """
 
     response = requests.post(
         f"{base_url}/chat/completions",
-        headers=headers,
-        json=payload
+        headers=openai_headers(api_key),
+        json=openai_payload(model, messages, generation, n)
     )
 
     try:
@@ -71,46 +340,95 @@ def call_openai_compatible(
         print("OpenAI API error:", response.text)
         raise e
 
-    data = response.json()
-    content = data.get("choices", [{}])[0].get("message", {}).get("content")
-    return content
+    completion = parse_openai_completion(response.json())
+    _annotate_exchange(response, completion.usage)
+    return completion
 
 
-def call_anthropic(
-    model: Model,
-    messages: list,
-    api_key: str,
-    temperature: float = DEFAULT_TEMPERATURE
-) -> str:
-
-    headers = {
+def anthropic_headers(api_key: str) -> dict:
+    return {
         "x-api-key": api_key,
         "anthropic-version": "2023-06-01",
         "content-type": "application/json"
     }
-    payload = {
+
+
+def anthropic_payload(
+    model: Model,
+    messages: list,
+    generation: GenerationConfig = DEFAULT_GENERATION,
+    prompt_cache: bool = False
+) -> dict:
+    """
+    Body of an Anthropic messages request. With prompt_cache, a cache
+    breakpoint on the last message caches the whole conversation; the
+    next turn reads it back as its prefix.
+    """
+    if (
+        generation.frequency_penalty is not None or
+        generation.presence_penalty is not None
+    ):
+        raise ValueError("Anthropic does not support frequency/presence penalties")
+    if prompt_cache and messages:
+        last = messages[-1]
+        messages = messages[:-1] + [{
+            "role": last["role"],
+            "content": [{
+                "type": "text",
+                "text": last["content"],
+                "cache_control": {"type": "ephemeral"},
+            }],
+        }]
+    return {
         "model": model.value,
         "messages": messages,
-        "temperature": temperature,
-        "max_tokens": MAXIMUM_OUTPUT_TOKENS
+        "temperature": generation.temperature,
+        "max_tokens": output_token_limit(model, generation)
     }
+
+
+def parse_anthropic_completion(data: dict) -> Completion:
+    text = "".join(
+        block.get("text", "")
+        for block in data.get("content", [])
+        if block.get("type") == "text"
+    )
+    return Completion(
+        text,
+        parse_anthropic_usage(data),
+        finish_reason=_finish_reason(data.get("stop_reason"), _ANTHROPIC_FINISH_REASONS)
+    )
+
+
+@traced("provider.anthropic")
+def call_anthropic(
+    model: Model,
+    messages: list,
+    api_key: str,
+    generation: GenerationConfig = DEFAULT_GENERATION,
+    base_url: str = PROVIDER_BASE_URLS[Provider.CLAUDE],
+    prompt_cache: bool = False
+) -> Completion:
+
+    payload = anthropic_payload(model, messages, generation, prompt_cache)
     response = requests.post(
-        "https://api.anthropic.com/v1/messages",
-        headers=headers,
+        f"{base_url}/v1/messages",
+        headers=anthropic_headers(api_key),
         json=payload
     )
     response.raise_for_status()
-    data = response.json()
-    return data.get("output", {}).get("text", "")
+    completion = parse_anthropic_completion(response.json())
+    _annotate_exchange(response, completion.usage)
+    return completion
 
 
-def call_google(
+def google_payload(
     model: Model,
     messages: list,
-    api_key: str,
-    temperature: float = DEFAULT_TEMPERATURE
-) -> str:
-
+    generation: GenerationConfig = DEFAULT_GENERATION,
+    n: int = 1
+) -> dict:
+    """Body of a Gemini generateContent request."""
     google_contents = []
     for msg in messages:
         role = "user" if msg["role"] == "user" else "model"
@@ -119,16 +437,17 @@ def call_google(
             "parts": [{"text": msg["content"]}]
         })
 
-    url = (
-        f"https://generativelanguage.googleapis.com/v1beta/models/"
-        f"{model.value}:generateContent?key={api_key}"
-    )
-
     config = {
-        "temperature": temperature,
-        "maxOutputTokens": MAXIMUM_OUTPUT_TOKENS,
+        "temperature": generation.temperature,
+        "maxOutputTokens": output_token_limit(model, generation),
         "thinkingConfig": {}
     }
+    if generation.frequency_penalty is not None:
+        config["frequencyPenalty"] = generation.frequency_penalty
+    if generation.presence_penalty is not None:
+        config["presencePenalty"] = generation.presence_penalty
+    if n > 1:
+        config["candidateCount"] = n
 
     payload = {
         "contents": google_contents,
@@ -141,16 +460,31 @@ def call_google(
         config["thinkingConfig"]["thinkingBudget"] = 0
     elif model.value.lower() == "gemini-2.5-pro":
         config["thinkingConfig"]["thinkingBudget"] = 128
+    return payload
 
-    response = requests.post(url, json=payload)
-    response.raise_for_status()
-    result = response.json()
+
+def parse_google_completion(result: dict) -> Completion:
+    usage = parse_google_usage(result)
 
     # Handle various response scenarios
     if "candidates" not in result or len(result["candidates"]) == 0:
         raise ValueError(f"No candidates in response: {result}")
 
+    if len(result["candidates"]) > 1:
+        # Candidates cut off without any text are dropped
+        kept = [
+            candidate
+            for candidate in result["candidates"]
+            if candidate.get("content", {}).get("parts")
+        ]
+        if kept:
+            # Finish reason of the candidate whose text is returned
+            finish_reason = _finish_reason(kept[0].get("finishReason"), _GOOGLE_FINISH_REASONS)
+            texts = [candidate["content"]["parts"][0]["text"] for candidate in kept]
+            return Completion(texts[0], usage, texts, finish_reason)
+
     candidate = result["candidates"][0]
+    finish_reason = _finish_reason(candidate.get("finishReason"), _GOOGLE_FINISH_REASONS)
 
     # Check if content exists and has parts
     if "content" not in candidate:
@@ -160,68 +494,388 @@ def call_google(
 
     # Handle missing parts (happens with MAX_TOKENS, SAFETY, etc.)
     if "parts" not in content or len(content["parts"]) == 0:
-        finish_reason = candidate.get("finishReason", "UNKNOWN")
-        if finish_reason == "MAX_TOKENS":
-            raise ValueError("Response incomplete: hit max tokens limit. Consider increasing maxOutputTokens.")
-        elif finish_reason == "SAFETY":
+        raw_reason = candidate.get("finishReason", "UNKNOWN")
+        if raw_reason == "MAX_TOKENS":
+            # Thinking used up the output budget: an empty, truncated
+            # response that the caller can continue or skip
+            return Completion("", usage, finish_reason=FINISH_LENGTH)
+        elif raw_reason == "SAFETY":
             raise ValueError("Response blocked due to safety filters.")
         else:
-            raise ValueError(f"No parts in content. Finish reason: {finish_reason}. Response: {result}")
+            raise ValueError(f"No parts in content. Finish reason: {raw_reason}. Response: {result}")
 
-    return content["parts"][0]["text"]
+    return Completion(content["parts"][0]["text"], usage, finish_reason=finish_reason)
 
 
-def get_completion(model: Model, messages: list):
-    provider = MODEL_TO_PROVIDER.get(model)
+class GoogleContextCaches:
+    """
+    Gemini cachedContents created for conversation prefixes. A request
+    reuses the longest cached prefix of its history and only sends the
+    rest. A new cache is created once the prefix is at least twice as
+    long as the cached one, so a conversation creates a logarithmic
+    number of caches as it grows.
+    """
 
-    if provider == Provider.OPENAI:
-        return call_openai_compatible(
-            model,
-            messages,
-            "https://api.openai.com/v1",
-            os.getenv("OPENAI_API_KEY")
-        )
-    elif provider == Provider.MOONSHOT:
-        return call_openai_compatible(
-            model,
-            messages,
-            "https://api.moonshot.ai/v1",
-            os.getenv("MOONSHOT_API_KEY")
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (base_url, api_key, model, prefix digest) -> (name, num_contents, tokens, expires)
+        self._entries: Dict[tuple, Tuple[str, int, int, float]] = {}
+
+    @staticmethod
+    def _digests(contents: list) -> List[str]:
+        """Digest of contents[:k + 1] for every k."""
+        h = hashlib.sha256()
+        digests = []
+        for content in contents:
+            h.update(json.dumps(content, sort_keys=True).encode("utf-8"))
+            digests.append(h.hexdigest())
+        return digests
+
+    def prepare(
+        self,
+        payload: dict,
+        model: Model,
+        api_key: str,
+        base_url: str
+    ) -> dict:
+        """
+        The payload, sending its cached prefix as a cachedContent. The
+        cache is created with the key of the request that uses it, from
+        within with_key_pool: a rate-limited creation raises, so the
+        pool quarantines the key and retries on the next one.
+        """
+        contents = payload["contents"]
+        prefix = contents[:-1]
+        digests = self._digests(prefix)
+        scope = (base_url, api_key, model.value)
+        now = time.time()
+
+        hit = None
+        with self._lock:
+            for digest in reversed(digests):
+                entry = self._entries.get(scope + (digest,))
+                if entry is not None and entry[3] > now:
+                    hit = entry
+                    break
+
+        prefix_tokens = sum(
+            text_to_num_tokens(part["text"])
+            for content in prefix
+            for part in content["parts"]
         )
-    elif provider == Provider.DEEPSEEK:
+        cached_tokens = hit[2] if hit else 0
+        if prefix and prefix_tokens >= max(2 * cached_tokens, GOOGLE_CACHE_MIN_TOKENS):
+            response = requests.post(
+                f"{base_url}/v1beta/cachedContents?key={api_key}",
+                json={
+                    "model": f"models/{model.value}",
+                    "contents": prefix,
+                    "ttl": f"{GOOGLE_CACHE_TTL_SECONDS}s",
+                }
+            )
+            if response.status_code in QUOTA_STATUS_CODES:
+                response.raise_for_status()
+            if response.ok:
+                # Stop using the cache a little before the provider drops it
+                hit = (
+                    response.json()["name"],
+                    len(prefix),
+                    prefix_tokens,
+                    now + GOOGLE_CACHE_TTL_SECONDS - 30
+                )
+                with self._lock:
+                    self._entries[scope + (digests[-1],)] = hit
+            else:
+                print("Gemini context cache not created:", response.text)
+
+        if hit is None:
+            return payload
+        return {
+            **payload,
+            "contents": contents[hit[1]:],
+            "cachedContent": hit[0],
+        }
+
+
+_google_caches = GoogleContextCaches()
+
+
+@traced("provider.google")
+def call_google(
+    model: Model,
+    messages: list,
+    api_key: str,
+    generation: GenerationConfig = DEFAULT_GENERATION,
+    base_url: str = PROVIDER_BASE_URLS[Provider.GOOGLE],
+    prompt_cache: bool = False,
+    n: int = 1
+) -> Completion:
+
+    url = (
+        f"{base_url}/v1beta/models/"
+        f"{model.value}:generateContent?key={api_key}"
+    )
+    payload = google_payload(model, messages, generation, n)
+    if prompt_cache:
+        payload = _google_caches.prepare(payload, model, api_key, base_url)
+    response = requests.post(url, json=payload)
+    response.raise_for_status()
+    result = response.json()
+    _annotate_exchange(response, parse_google_usage(result))
+    return parse_google_completion(result)
+
+
+@traced("provider.synthetic")
+def call_synthetic(
+    model: Model,
+    messages: list
+) -> Completion:
+    """
+    In-process memorizing model (see synthetic.py), no network involved.
+    It has no tokenizer, so usage is the local estimate.
+    """
+    text = get_memorizer().complete(messages)
+    usage = Usage(
+        input_tokens=sum(text_to_num_tokens(msg["content"]) for msg in messages),
+        output_tokens=text_to_num_tokens(text)
+    )
+    return Completion(text, usage)
+
+
+def _call_provider(
+    provider: Provider,
+    model: Model,
+    messages: list,
+    entry: PoolEntry,
+    generation: GenerationConfig,
+    prompt_cache: bool = False,
+    n: int = 1
+) -> Completion:
+    if provider in (Provider.OPENAI, Provider.MOONSHOT, Provider.DEEPSEEK):
         return call_openai_compatible(
             model,
             messages,
-            "https://api.deepseek.com",
-            os.getenv("DEEPSEEK_API_KEY")
+            entry.base_url,
+            entry.api_key,
+            generation,
+            n
         )
     elif provider == Provider.CLAUDE:
         return call_anthropic(
             model,
             messages,
-            os.getenv("ANTHROPIC_API_KEY")
+            entry.api_key,
+            generation,
+            base_url=entry.base_url,
+            prompt_cache=prompt_cache
         )
     elif provider == Provider.GOOGLE:
         return call_google(
             model,
             messages,
-            os.getenv("GOOGLE_API_KEY")
+            entry.api_key,
+            generation,
+            base_url=entry.base_url,
+            prompt_cache=prompt_cache,
+            n=n
         )
-    else:
+    raise ValueError(f"Unsupported provider: {provider}")
+
+
+def _retry_after(response: Optional[requests.Response]) -> Optional[float]:
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_completion(
+    model: Model,
+    messages: list,
+    generation: Optional[GenerationConfig] = None,
+    cache: Optional[ResponseCache] = None,
+    prompt_cache: bool = False,
+    n: int = 1
+) -> Completion:
+    """
+    Complete a conversation. With a cache, an identical request (model,
+    generation config and messages) is answered from it. prompt_cache
+    enables the provider-side prompt caching of Anthropic and Gemini
+    (OpenAI-compatible providers cache prompts on their own). With n > 1,
+    n candidates are sampled in one request where the provider supports
+    it (see Completion.candidates), and with n requests elsewhere.
+    """
+    generation = generation or DEFAULT_GENERATION
+    if cache is None:
+        return _get_completion(model, messages, generation, prompt_cache, n)
+
+    request = generation.to_dict()
+    if n > 1:
+        request["n"] = n
+    key = cache.key(model.value, request, messages)
+    entry = cache.get(key)
+    if entry is not None:
+        annotate(cache_hit=True)
+        usage = Usage(**entry["usage"]) if entry["usage"] is not None else None
+        return Completion(
+            entry["text"], usage, entry.get("candidates"), entry.get("finish_reason")
+        )
+    completion = _get_completion(model, messages, generation, prompt_cache, n)
+    cache.put(key, {
+        "text": completion.text,
+        "usage": completion.usage.to_dict() if completion.usage is not None else None,
+        **({"candidates": completion.candidates} if completion.candidates else {}),
+        **({"finish_reason": completion.finish_reason} if completion.finish_reason else {}),
+    })
+    return completion
+
+
+def _get_completion(
+    model: Model,
+    messages: list,
+    generation: GenerationConfig,
+    prompt_cache: bool = False,
+    n: int = 1
+) -> Completion:
+    provider = MODEL_TO_PROVIDER.get(model)
+
+    if n > 1 and provider not in CANDIDATE_PROVIDERS:
+        return merge_candidates([
+            _get_completion(model, messages, generation, prompt_cache)
+            for _ in range(n)
+        ])
+    if provider == Provider.SYNTHETIC:
+        return call_synthetic(model, messages)
+    if provider not in PROVIDER_ENV_PREFIX:
         raise ValueError(f"Unsupported provider: {provider}")
 
+    return with_key_pool(
+        provider,
+        lambda entry: _call_provider(
+            provider, model, messages, entry, generation, prompt_cache, n
+        )
+    )
+
+
+# Shortest repeated run dropped when stitching a continuation
+MIN_STITCH_OVERLAP = 5
+
+
+def _stitch(text: str, continuation: str) -> str:
+    """
+    Join a truncated response and its continuation, dropping words the
+    continuation repeats from the end of the response.
+    """
+    head, tail = text.split(), continuation.split()
+    for k in range(min(len(head), len(tail), 50), MIN_STITCH_OVERLAP - 1, -1):
+        if head[-k:] == tail[:k]:
+            match = re.match(r"\s*(?:\S+\s*){%d}" % k, continuation)
+            continuation = continuation[match.end():]
+            break
+    if not text or not continuation or text[-1].isspace() or continuation[0].isspace():
+        return text + continuation
+    return text + " " + continuation
+
+
+def continue_truncated(
+    model: Model,
+    messages: list,
+    completion: Completion,
+    generation: Optional[GenerationConfig] = None,
+    cache: Optional[ResponseCache] = None,
+    prompt_cache: bool = False,
+    max_continuations: int = MAX_CONTINUATIONS
+) -> Completion:
+    """
+    Continue a response cut at the output limit and stitch the parts,
+    up to max_continuations times. Anthropic continues the partial
+    response itself (assistant prefill); the others get it back with a
+    request to go on. Usage adds up over every call.
+    """
+    text = completion.text or ""
+    usage = completion.usage
+    finish_reason = completion.finish_reason
+    continuations = 0
+    prefill = MODEL_TO_PROVIDER.get(model) == Provider.CLAUDE
+    while (
+        finish_reason == FINISH_LENGTH
+        and continuations < max_continuations
+        and text.strip()
+    ):
+        if prefill:
+            text = text.rstrip()
+            follow_up = messages + [{"role": "assistant", "content": text}]
+        else:
+            follow_up = messages + [
+                {"role": "assistant", "content": text},
+                {"role": "user", "content": TRUNCATION_INSTRUCTIONS},
+            ]
+        part = get_completion(model, follow_up, generation, cache, prompt_cache)
+        text = text + (part.text or "") if prefill else _stitch(text, part.text or "")
+        if part.usage is not None:
+            usage = part.usage if usage is None else usage + part.usage
+        finish_reason = part.finish_reason
+        continuations += 1
+    if continuations == 0:
+        return completion
+    annotate(continuations=continuations)
+    return Completion(text, usage, finish_reason=finish_reason, continuations=continuations)
+
+
+def with_key_pool(provider: Provider, call: Callable[[PoolEntry], T]) -> T:
+    """
+    Run call(entry) with an entry of the provider's key pool. A
+    rate-limited key is quarantined and the call moves on to the next
+    one, as long as the pool has another key available. Only request
+    errors count against the key; any other exception (a parsing bug,
+    a cancelled job) releases it as healthy.
+    """
+    pool = get_key_pool(provider, get_base_url(provider))
+    for attempt in range(len(pool)):
+        entry = pool.acquire()
+        try:
+            result = call(entry)
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            pool.release(entry, status, _retry_after(e.response))
+            if status in QUOTA_STATUS_CODES and pool.num_available() > 0:
+                continue
+            raise
+        except requests.exceptions.RequestException:
+            pool.release(entry, None)
+            raise
+        except BaseException:
+            pool.release(entry, 200)
+            raise
+        pool.release(entry, 200)
+        return result
+    raise RuntimeError(f"Every {provider.value} key is rate limited")
+
 
 class LLMChat:
 
     def __init__(
         self,
         model: Model,
-        verbose: bool = False
+        verbose: bool = False,
+        generation: Optional[GenerationConfig] = None,
+        cache: Optional[ResponseCache] = None,
+        prompt_cache: bool = False,
+        max_continuations: int = MAX_CONTINUATIONS
     ):
         print(f"Initializing LLMChat with model: {model}")
         self.model = model
+        self.generation = generation or DEFAULT_GENERATION
+        self.cache = cache
+        self.prompt_cache = prompt_cache
+        self.max_continuations = max_continuations
+        self.finish_reasons = []
         self.prompts = []
         self.responses = []
+        self.usages = []
+        self.usage = Usage()
         self.verbose = verbose
 
     def prompt_chat(self, message: str):
@@ -229,8 +883,64 @@ class LLMChat:
             print(f"Prompt: \033[94m{message}\n\033[0m")
         self.prompts.append(message)
         messages = [{"role": "user", "content": msg} for msg in self.prompts]
-        response = get_completion(self.model, messages)
+        with span("llm_chat.prompt_chat", model=self.model.value, turn=len(self.prompts)):
+            completion = get_completion(
+                self.model,
+                messages,
+                self.generation,
+                self.cache,
+                self.prompt_cache
+            )
+            if completion.finish_reason == FINISH_LENGTH and self.max_continuations > 0:
+                completion = continue_truncated(
+                    self.model,
+                    messages,
+                    completion,
+                    self.generation,
+                    self.cache,
+                    self.prompt_cache,
+                    self.max_continuations
+                )
+        self._add_response(completion)
+        return completion.text
+
+    def sample(self, message: str, n: int = 1) -> Completion:
+        """
+        Completion of the conversation followed by message, with n
+        candidates, without adding the turn to the chat (see add_exchange).
+        """
+        messages = [{"role": "user", "content": msg} for msg in self.prompts + [message]]
+        with span("llm_chat.sample", model=self.model.value, turn=len(self.prompts) + 1, n=n):
+            return get_completion(
+                self.model,
+                messages,
+                self.generation,
+                self.cache,
+                self.prompt_cache,
+                n
+            )
+
+    def add_exchange(self, message: str, completion: Completion):
+        """Record a turn answered elsewhere, e.g. by a batch job."""
+        if self.verbose:
+            print(f"Prompt: \033[94m{message}\n\033[0m")
+        self.prompts.append(message)
+        self._add_response(completion)
+
+    def _add_response(self, completion: Completion):
+        response = completion.text
         if self.verbose:
             print(f"Response: \033[92m{response}\n\033[0m")
         self.responses.append(response)
-        return response
+        self.usages.append(completion.usage)
+        self.finish_reasons.append(completion.finish_reason)
+        if completion.usage is not None:
+            self.usage += completion.usage
+
+    @property
+    def last_usage(self) -> Optional[Usage]:
+        return self.usages[-1] if self.usages else None
+
+    @property
+    def last_finish_reason(self) -> Optional[str]:
+        return self.finish_reasons[-1] if self.finish_reasons else None
@@ -12,21 +12,43 @@ Two merge and filter passes:
 (tau is because it's the symbol used in the paper)
 - Pass 1: (tau_gap=2, tau_align=1, min_len=20)
 - Pass 2: (tau_gap=10, tau_align=3, min_len=100)
+
+PreScreen estimates the overlap of many generations with MinHash
+sketches of word shingles first, and only aligns the promising ones.
 """
 
 from __future__ import annotations
 
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from difflib import SequenceMatcher
 import argparse
+import csv
+import glob
+import itertools
+import json
+import multiprocessing
+import os
 import re
+import threading
+import time
+import weakref
+import zlib
 from typing import (
+    Dict,
     Iterable,
     List,
+    Optional,
     Sequence,
     Tuple
 )
 
+import numpy as np
+
+from parallel_alignment import ParallelAligner
+from suffix_automaton import SuffixAutomaton
+from tracing import annotate, traced
+
 
 _WS_RE = re.compile(r"\s+")
 
@@ -50,6 +72,79 @@ def text_to_words(text: str, *, lower: bool = False) -> List[str]:
     return text.split(" ")
 
 
+class ReferenceIndex:
+    """
+    Reference text tokenized once and shared by every generation scored
+    against it (e.g. all the configurations of a sweep).
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._words: Dict[bool, List[str]] = {}
+        self._automata: Dict[bool, SuffixAutomaton] = {}
+        self._sketches: Dict[tuple, "MinHashSketch"] = {}
+        self._aligners: Dict[tuple, ParallelAligner] = {}
+        self._lock = threading.Lock()
+
+    def words(self, *, lower: bool = False) -> List[str]:
+        with self._lock:
+            words = self._words.get(lower)
+            if words is None:
+                words = self._words[lower] = text_to_words(self.text, lower=lower)
+            return words
+
+    def automaton(self, *, lower: bool = False) -> SuffixAutomaton:
+        """Suffix automaton of the words, built on first use."""
+        words = self.words(lower=lower)
+        with self._lock:
+            automaton = self._automata.get(lower)
+            if automaton is None:
+                automaton = self._automata[lower] = SuffixAutomaton(words)
+            return automaton
+
+    def aligner(self, *, lower: bool = False, workers: int) -> ParallelAligner:
+        """
+        Parallel aligner with the words in shared memory, kept (with its
+        process pool) until the index is garbage collected.
+        """
+        words = self.words(lower=lower)
+        with self._lock:
+            aligner = self._aligners.get((lower, workers))
+            if aligner is None:
+                aligner = self._aligners[(lower, workers)] = ParallelAligner(words, workers)
+                weakref.finalize(self, aligner.close)
+            return aligner
+
+    def sketch(self, hasher: "MinHasher") -> "MinHashSketch":
+        """MinHash sketch of the words, computed once per hasher."""
+        words = self.words(lower=hasher.lower)
+        with self._lock:
+            sketch = self._sketches.get(hasher.params)
+            if sketch is None:
+                sketch = self._sketches[hasher.params] = hasher.sketch(words)
+            return sketch
+
+
+def _aligner(
+    reference: Optional[ReferenceIndex],
+    lower: bool,
+    workers: Optional[int]
+) -> Optional[ParallelAligner]:
+    if reference is None or not workers or workers <= 1:
+        return None
+    return reference.aligner(lower=lower, workers=workers)
+
+
+def _book_words(
+    book_text: Optional[str],
+    reference: Optional[ReferenceIndex],
+    lower: bool
+) -> List[str]:
+    if reference is not None:
+        return reference.words(lower=lower)
+    return text_to_words(book_text, lower=lower)
+
+
 @dataclass(frozen=True)
 class Block:
 
@@ -67,6 +162,99 @@ class Block:
         return (self.i, self.j, self.m)
 
 
+class BlockArray:
+    """
+    Struct-of-arrays set of blocks (one int64 array per Block field),
+    so merge and filter passes are vectorized instead of allocating a
+    Block per step. Indexing returns Block views.
+    """
+
+    __slots__ = ("i", "j", "m", "i_end", "j_end")
+
+    def __init__(self, i, j, m, i_end=None, j_end=None):
+        self.i = np.asarray(i, dtype=np.int64)
+        self.j = np.asarray(j, dtype=np.int64)
+        self.m = np.asarray(m, dtype=np.int64)
+        self.i_end = self.i + self.m if i_end is None else np.asarray(i_end, dtype=np.int64)
+        self.j_end = self.j + self.m if j_end is None else np.asarray(j_end, dtype=np.int64)
+
+    @staticmethod
+    def from_blocks(blocks: Sequence[Block]) -> "BlockArray":
+        return BlockArray(
+            [b.i for b in blocks],
+            [b.j for b in blocks],
+            [b.m for b in blocks],
+            [b.i_end for b in blocks],
+            [b.j_end for b in blocks],
+        )
+
+    def __len__(self) -> int:
+        return len(self.m)
+
+    def __getitem__(self, k: int) -> Block:
+        return Block(
+            i=int(self.i[k]),
+            j=int(self.j[k]),
+            m=int(self.m[k]),
+            i_end=int(self.i_end[k]),
+            j_end=int(self.j_end[k]),
+        )
+
+    def to_blocks(self) -> List[Block]:
+        return [self[k] for k in range(len(self))]
+
+    def as_tuples(self) -> List[Tuple[int, int, int]]:
+        return list(zip(self.i.tolist(), self.j.tolist(), self.m.tolist()))
+
+    def merge(self, *, tau_gap: int, tau_align: int) -> "BlockArray":
+        """
+        Same result as merge_blocks: a merged block ends where its last
+        member ends, so each merge decision only depends on the gap
+        between two consecutive blocks. Runs of mergeable gaps are
+        collapsed with a segmented sum.
+        """
+        if len(self) < 2:
+            return self
+        delta_b = self.i[1:] - self.i_end[:-1]
+        delta_g = self.j[1:] - self.j_end[:-1]
+        mergeable = (np.maximum(delta_b, delta_g) <= tau_gap) & ((delta_b - delta_g) <= tau_align)
+        starts = np.flatnonzero(np.concatenate(([True], ~mergeable)))
+        ends = np.concatenate((starts[1:], [len(self)])) - 1
+        return BlockArray(
+            self.i[starts],
+            self.j[starts],
+            np.add.reduceat(self.m, starts),
+            self.i_end[ends],
+            self.j_end[ends],
+        )
+
+    def filter(self, *, min_len: int) -> "BlockArray":
+        keep = self.m >= min_len
+        return BlockArray(
+            self.i[keep], self.j[keep], self.m[keep], self.i_end[keep], self.j_end[keep]
+        )
+
+
+def _identify_block_array(
+    book_words: Sequence[str],
+    gen_words: Sequence[str],
+    *,
+    autojunk: bool = False,
+    aligner: Optional[ParallelAligner] = None,
+) -> BlockArray:
+    if not book_words or not gen_words:
+        return BlockArray([], [], [])
+    if aligner is not None and not autojunk:
+        matching_blocks = aligner.matching_blocks(gen_words)
+    else:
+        sm = SequenceMatcher(None, book_words, gen_words, autojunk=autojunk)
+        matching_blocks = sm.get_matching_blocks()
+    # The last matching block is the (len_a, len_b, 0) sentinel
+    matches = np.array(matching_blocks, dtype=np.int64).reshape(-1, 3)
+    matches = matches[matches[:, 2] > 0]
+    return BlockArray(matches[:, 0], matches[:, 1], matches[:, 2])
+
+
 def identify_verbatim_blocks(
     book_words: Sequence[str],
     gen_words: Sequence[str],
@@ -74,47 +262,14 @@ def identify_verbatim_blocks(
     autojunk: bool = False,
 ) -> List[Block]:
     """Identify an ordered set of matching blocks."""
-    if not book_words or not gen_words:
-        return []
-
-    sm = SequenceMatcher(None, book_words, gen_words, autojunk=autojunk)
-    blocks: List[Block] = []
-    for match in sm.get_matching_blocks():
-        if match.size <= 0:
-            continue
-        blocks.append(Block.from_verbatim(match.a, match.b, match.size))
-    return blocks
+    return _identify_block_array(book_words, gen_words, autojunk=autojunk).to_blocks()
 
 
 def merge_blocks(blocks: Sequence[Block], *, tau_gap: int, tau_align: int) -> List[Block]:
     """Iteratively merge consecutive blocks if merge constraints are met."""
     if not blocks:
         return []
-
-    merged: List[Block] = []
-    k = 0
-    while k < len(blocks):
-        cur = blocks[k]
-        while k + 1 < len(blocks):
-            nxt = blocks[k + 1]
-            delta_b = nxt.i - cur.i_end
-            delta_g = nxt.j - cur.j_end
-
-            if max(delta_b, delta_g) <= tau_gap and (delta_b - delta_g) <= tau_align:
-                cur = Block(
-                    i=cur.i,
-                    j=cur.j,
-                    m=cur.m + nxt.m,
-                    i_end=nxt.i_end,
-                    j_end=nxt.j_end,
-                )
-                k += 1
-                continue
-            break
-
-        merged.append(cur)
-        k += 1
-    return merged
+    return BlockArray.from_blocks(blocks).merge(tau_gap=tau_gap, tau_align=tau_align).to_blocks()
 
 
 def filter_blocks(blocks: Iterable[Block], *, min_len: int) -> List[Block]:
@@ -122,8 +277,32 @@ def filter_blocks(blocks: Iterable[Block], *, min_len: int) -> List[Block]:
     return [b for b in blocks if b.m >= min_len]
 
 
+def _near_verbatim_blocks(
+    book_words: Sequence[str],
+    gen_words: Sequence[str],
+    *,
+    tau_gap_1: int,
+    tau_align_1: int,
+    min_len_1: int,
+    tau_gap_2: int,
+    tau_align_2: int,
+    min_len_2: int,
+    autojunk: bool,
+    aligner: Optional[ParallelAligner] = None,
+) -> List[Tuple[int, int, int]]:
+    blocks = _identify_block_array(book_words, gen_words, autojunk=autojunk, aligner=aligner)
+
+    blocks = blocks.merge(tau_gap=tau_gap_1, tau_align=tau_align_1)
+    blocks = blocks.filter(min_len=min_len_1)
+
+    blocks = blocks.merge(tau_gap=tau_gap_2, tau_align=tau_align_2)
+    blocks = blocks.filter(min_len=min_len_2)
+
+    return blocks.as_tuples()
+
+
 def near_verbatim_blocks(
-    book_text: str,
+    book_text: Optional[str],
     gen_text: str,
     *,
     tau_gap_1: int = 2,
@@ -134,20 +313,24 @@ def near_verbatim_blocks(
     min_len_2: int = 100,
     lower: bool = False,
     autojunk: bool = False,
+    reference: Optional[ReferenceIndex] = None,
+    workers: Optional[int] = None,
 ) -> List[Tuple[int, int, int]]:
     """Return the final ordered set of blocks"""
-    book_words = text_to_words(book_text, lower=lower)
-    gen_words = text_to_words(gen_text, lower=lower)
-
-    blocks = identify_verbatim_blocks(book_words, gen_words, autojunk=autojunk)
-
-    blocks = merge_blocks(blocks, tau_gap=tau_gap_1, tau_align=tau_align_1)
-    blocks = filter_blocks(blocks, min_len=min_len_1)
-
-    blocks = merge_blocks(blocks, tau_gap=tau_gap_2, tau_align=tau_align_2)
-    blocks = filter_blocks(blocks, min_len=min_len_2)
-
-    return [b.as_tuple() for b in blocks]
+    if workers and workers > 1 and reference is None:
+        reference = ReferenceIndex(book_text)
+    return _near_verbatim_blocks(
+        _book_words(book_text, reference, lower),
+        text_to_words(gen_text, lower=lower),
+        tau_gap_1=tau_gap_1,
+        tau_align_1=tau_align_1,
+        min_len_1=min_len_1,
+        tau_gap_2=tau_gap_2,
+        tau_align_2=tau_align_2,
+        min_len_2=min_len_2,
+        autojunk=autojunk,
+        aligner=_aligner(reference, lower, workers),
+    )
 
 
 @dataclass(frozen=True)
@@ -172,8 +355,9 @@ class NearVerbatimMetrics:
         }
 
 
+@traced("long_form_metrics.near_verbatim_metrics")
 def near_verbatim_metrics(
-    book_text: str,
+    book_text: Optional[str],
     gen_text: str,
     *,
     tau_gap_1: int = 2,
@@ -184,27 +368,44 @@ def near_verbatim_metrics(
     min_len_2: int = 100,
     lower: bool = False,
     autojunk: bool = False,
+    reference: Optional[ReferenceIndex] = None,
+    workers: Optional[int] = None,
 ) -> NearVerbatimMetrics:
-    """Compute matched words, recall, missing, and additional"""
-    book_words = text_to_words(book_text, lower=lower)
+    """
+    Compute matched words, recall, missing, and additional.
+    With a reference index, book_text is not used. With workers > 1 the
+    alignment runs in parallel (see parallel_alignment.py), with the
+    same result as the serial one.
+    """
+    if workers and workers > 1 and reference is None:
+        reference = ReferenceIndex(book_text)
+    book_words = _book_words(book_text, reference, lower)
     gen_words = text_to_words(gen_text, lower=lower)
 
-    blocks = near_verbatim_blocks(
-        book_text,
-        gen_text,
+    blocks = _near_verbatim_blocks(
+        book_words,
+        gen_words,
         tau_gap_1=tau_gap_1,
         tau_align_1=tau_align_1,
         min_len_1=min_len_1,
         tau_gap_2=tau_gap_2,
         tau_align_2=tau_align_2,
         min_len_2=min_len_2,
-        lower=lower,
         autojunk=autojunk,
+        aligner=_aligner(reference, lower, workers),
     )
 
+    annotate(book_words=len(book_words), gen_words=len(gen_words), blocks=len(blocks))
+
+    return _metrics_from_blocks(blocks, len(book_words), len(gen_words))
+
+
+def _metrics_from_blocks(
+    blocks: List[Tuple[int, int, int]],
+    book_len: int,
+    gen_len: int
+) -> NearVerbatimMetrics:
     matched = sum(m for _, _, m in blocks)
-    book_len = len(book_words)
-    gen_len = len(gen_words)
     nv_recall = (matched / book_len) if book_len > 0 else 0.0
     missing = book_len - matched
     additional = gen_len - matched
@@ -220,13 +421,456 @@ def near_verbatim_metrics(
     )
 
 
+def uncovered_gaps(
+    spans: Iterable[Tuple[int, int]],
+    length: int,
+    *,
+    min_len: int = 1
+) -> List[Tuple[int, int]]:
+    """
+    Parts [start, end) of a reference of the given length (in words)
+    that none of the [start, end) spans covers, in order, keeping those
+    of at least min_len words.
+    """
+    gaps = []
+    position = 0
+    for start, end in sorted(spans):
+        if start - position >= min_len:
+            gaps.append((position, start))
+        position = max(position, end)
+    if length - position >= min_len:
+        gaps.append((position, length))
+    return gaps
+
+
+MERGE_PARAMETERS = (
+    "tau_gap_1", "tau_align_1", "min_len_1",
+    "tau_gap_2", "tau_align_2", "min_len_2",
+)
+DEFAULT_MERGE_PARAMETERS = {
+    "tau_gap_1": 2, "tau_align_1": 1, "min_len_1": 20,
+    "tau_gap_2": 10, "tau_align_2": 3, "min_len_2": 100,
+}
+
+
+def merge_parameter_grid(**values: Sequence[int]) -> List[dict]:
+    """
+    Cartesian product of merge/filter parameter values, e.g.
+    merge_parameter_grid(min_len_2=[50, 100], tau_gap_2=[5, 10]).
+    Parameters not given keep their default.
+    """
+    unknown = set(values) - set(MERGE_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown merge parameters: {', '.join(sorted(unknown))}")
+    axes = [values.get(name, [DEFAULT_MERGE_PARAMETERS[name]]) for name in MERGE_PARAMETERS]
+    return [dict(zip(MERGE_PARAMETERS, combo)) for combo in itertools.product(*axes)]
+
+
+@traced("long_form_metrics.merge_parameter_sweep")
+def merge_parameter_sweep(
+    book_text: Optional[str],
+    gen_text: str,
+    grid: Iterable[dict],
+    *,
+    lower: bool = False,
+    autojunk: bool = False,
+    reference: Optional[ReferenceIndex] = None,
+) -> List[dict]:
+    """
+    Evaluate many merge/filter settings on a single alignment: the text
+    is tokenized and aligned once, the first pass is shared by settings
+    with the same pass-1 parameters, and each row of the returned table
+    holds the setting with its matched/nv_recall/missing/additional.
+    """
+    book_words = _book_words(book_text, reference, lower)
+    gen_words = text_to_words(gen_text, lower=lower)
+    raw = _identify_block_array(book_words, gen_words, autojunk=autojunk)
+
+    first_pass: Dict[Tuple[int, int, int], BlockArray] = {}
+    rows = []
+    for setting in grid:
+        params = {**DEFAULT_MERGE_PARAMETERS, **setting}
+        key = (params["tau_gap_1"], params["tau_align_1"], params["min_len_1"])
+        blocks = first_pass.get(key)
+        if blocks is None:
+            blocks = raw.merge(tau_gap=key[0], tau_align=key[1]).filter(min_len=key[2])
+            first_pass[key] = blocks
+        blocks = blocks.merge(
+            tau_gap=params["tau_gap_2"],
+            tau_align=params["tau_align_2"]
+        ).filter(min_len=params["min_len_2"])
+        metrics = _metrics_from_blocks(blocks.as_tuples(), len(book_words), len(gen_words))
+        rows.append({
+            **params,
+            "matched": metrics.matched,
+            "nv_recall": metrics.nv_recall,
+            "missing": metrics.missing,
+            "additional": metrics.additional,
+            "num_blocks": len(blocks),
+        })
+    return rows
+
+
+# Mersenne prime: shingle hashes and permutations stay below 2**31, so
+# every product fits in int64.
+_MERSENNE_PRIME = (1 << 31) - 1
+_SHINGLE_BASE = 1_000_003
+
+
+@dataclass(frozen=True)
+class MinHashSketch:
+    signature: np.ndarray
+    num_shingles: int
+
+    def to_dict(self) -> dict:
+        return {
+            "signature": self.signature.tolist(),
+            "num_shingles": self.num_shingles,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "MinHashSketch":
+        return MinHashSketch(
+            signature=np.asarray(data["signature"], dtype=np.int64),
+            num_shingles=data["num_shingles"]
+        )
+
+
+@dataclass(frozen=True)
+class OverlapEstimate:
+    jaccard: float
+    matched_shingles: float
+    recall: float
+
+    def to_dict(self) -> dict:
+        return {
+            "jaccard": self.jaccard,
+            "matched_shingles": self.matched_shingles,
+            "recall": self.recall,
+        }
+
+
+class MinHasher:
+    """
+    MinHash of the set of word shingles of a text, with num_perm
+    universal hash functions (a * x + b) mod p applied with NumPy.
+    """
+
+    def __init__(
+        self,
+        num_perm: int = 256,
+        shingle_words: int = 5,
+        lower: bool = True,
+        seed: int = 1
+    ):
+        self.num_perm = num_perm
+        self.shingle_words = shingle_words
+        self.lower = lower
+        self.params = (num_perm, shingle_words, lower, seed)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+
+    def shingles(self, words: Sequence[str]) -> np.ndarray:
+        """Distinct hashes of the shingles (fewer words: the whole text)."""
+        if not words:
+            return np.empty(0, dtype=np.int64)
+        ids = np.fromiter(
+            (zlib.crc32(w.encode("utf-8")) % _MERSENNE_PRIME for w in words),
+            dtype=np.int64,
+            count=len(words)
+        )
+        k = min(self.shingle_words, len(ids))
+        hashes = np.zeros(len(ids) - k + 1, dtype=np.int64)
+        for offset in range(k):
+            hashes = (hashes * _SHINGLE_BASE + ids[offset:len(ids) - k + 1 + offset]) % _MERSENNE_PRIME
+        return np.unique(hashes)
+
+    def sketch(self, words: Sequence[str], chunk_size: int = 8192) -> MinHashSketch:
+        shingles = self.shingles(words)
+        signature = np.full(self.num_perm, _MERSENNE_PRIME, dtype=np.int64)
+        for start in range(0, len(shingles), chunk_size):
+            chunk = shingles[start:start + chunk_size]
+            hashed = (self._a[:, None] * chunk[None, :] + self._b[:, None]) % _MERSENNE_PRIME
+            np.minimum(signature, hashed.min(axis=1), out=signature)
+        return MinHashSketch(signature=signature, num_shingles=len(shingles))
+
+
+def load_sketch(path: str, hasher: MinHasher) -> MinHashSketch:
+    """Reference sketch written by scripts/ingest_pipeline.py, checked against the hasher."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("hasher") != list(hasher.params):
+        raise ValueError(f"{path} was sketched with {data.get('hasher')}, not {list(hasher.params)}")
+    return MinHashSketch.from_dict(data)
+
+
+def estimate_overlap(reference: MinHashSketch, generation: MinHashSketch) -> OverlapEstimate:
+    """
+    Estimate the shingles shared by the two texts from the Jaccard
+    similarity of their sketches, |A n B| = J (|A| + |B|) / (1 + J), and
+    the fraction of the reference they cover. The error of J is about
+    1 / sqrt(num_perm), so the recall estimate is coarse when the
+    generation is much shorter than the reference.
+    """
+    if reference.num_shingles == 0 or generation.num_shingles == 0:
+        return OverlapEstimate(0.0, 0.0, 0.0)
+    jaccard = float(np.mean(reference.signature == generation.signature))
+    matched = jaccard * (reference.num_shingles + generation.num_shingles) / (1 + jaccard)
+    return OverlapEstimate(
+        jaccard=jaccard,
+        matched_shingles=matched,
+        recall=min(matched / reference.num_shingles, 1.0)
+    )
+
+
+@dataclass
+class ScreenedGeneration:
+    index: int
+    estimate: OverlapEstimate
+    # None when the generation was skipped by the pre-screen
+    metrics: Optional[NearVerbatimMetrics] = None
+
+
+class PreScreen:
+    """
+    Cheap first stage before near_verbatim_metrics: the reference is
+    sketched once (or its sketch loaded, see load_sketch), each
+    generation costs one sketch, and only those with an estimated recall
+    of at least `threshold` are aligned exactly.
+    """
+
+    def __init__(
+        self,
+        reference: ReferenceIndex,
+        threshold: float = 0.05,
+        hasher: Optional[MinHasher] = None,
+        reference_sketch: Optional[MinHashSketch] = None
+    ):
+        self.reference = reference
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+        self.reference_sketch = reference_sketch or reference.sketch(self.hasher)
+
+    def estimate(self, gen_text: str) -> OverlapEstimate:
+        gen_words = text_to_words(gen_text, lower=self.hasher.lower)
+        return estimate_overlap(self.reference_sketch, self.hasher.sketch(gen_words))
+
+    def screen(
+        self,
+        gen_texts: Sequence[str],
+        **metric_kwargs
+    ) -> List[ScreenedGeneration]:
+        """
+        Screen every generation and align the promising ones. Results
+        are ranked by estimated recall, highest first.
+        """
+        screened = [
+            ScreenedGeneration(index=k, estimate=self.estimate(text))
+            for k, text in enumerate(gen_texts)
+        ]
+        screened.sort(key=lambda s: s.estimate.recall, reverse=True)
+        for s in screened:
+            if s.estimate.recall >= self.threshold:
+                s.metrics = near_verbatim_metrics(
+                    None,
+                    gen_texts[s.index],
+                    reference=self.reference,
+                    lower=self.hasher.lower,
+                    **metric_kwargs
+                )
+        return screened
+
+
+_worker_reference: Optional[ReferenceIndex] = None
+_worker_prescreen: Optional[PreScreen] = None
+
+
+def _init_batch_worker(
+    ref_path: str,
+    lower: bool,
+    reference: Optional[ReferenceIndex] = None,
+    prescreen: Optional[float] = None,
+    reference_sketch: Optional[MinHashSketch] = None
+):
+    """Load and tokenize (and sketch) the reference once per worker process."""
+    global _worker_reference, _worker_prescreen
+    if reference is None:
+        with open(ref_path, "r", encoding="utf-8") as f:
+            reference = ReferenceIndex(f.read())
+    reference.words(lower=lower)
+    _worker_reference = reference
+    _worker_prescreen = None
+    if prescreen is not None:
+        _worker_prescreen = PreScreen(reference, prescreen, reference_sketch=reference_sketch)
+
+
+def load_generation(path: str) -> str:
+    """
+    Text of a generation file, or the joined responses of an extraction
+    log. Failed turns (None responses) are skipped.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if not path.endswith(".json"):
+            return f.read()
+        data = json.load(f)
+    if "responses" not in data:
+        raise ValueError(f"Not an extraction log: {path}")
+    return " ".join(response for response in data["responses"] if response)
+
+
+def _score_file(path: str, lower: bool) -> dict:
+    start = time.perf_counter()
+    row = {"path": path}
+    try:
+        gen_text = load_generation(path)
+        if _worker_prescreen is not None:
+            estimate = _worker_prescreen.estimate(gen_text)
+            row["estimated_recall"] = estimate.recall
+            row["skipped"] = estimate.recall < _worker_prescreen.threshold
+            if row["skipped"]:
+                row["error"] = None
+                row["seconds"] = time.perf_counter() - start
+                return row
+        m = near_verbatim_metrics(
+            None,
+            gen_text,
+            lower=lower,
+            reference=_worker_reference
+        )
+        row.update({
+            "matched": m.matched,
+            "nv_recall": m.nv_recall,
+            "missing": m.missing,
+            "additional": m.additional,
+            "num_blocks": len(m.blocks),
+            "gen_len_words": m.gen_len_words,
+            "error": None,
+        })
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = time.perf_counter() - start
+    return row
+
+
+def resolve_generation_paths(patterns: Sequence[str]) -> List[str]:
+    """Expand directories (their .json/.txt files) and glob patterns."""
+    paths: List[str] = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [
+                os.path.join(pattern, name) for name in os.listdir(pattern)
+                if name.endswith((".json", ".txt"))
+            ]
+        else:
+            matches = glob.glob(pattern)
+        paths.extend(sorted(matches))
+    return list(dict.fromkeys(paths))
+
+
+def batch_metrics(
+    ref_path: str,
+    gen_paths: Sequence[str],
+    *,
+    lower: bool = False,
+    workers: Optional[int] = None,
+    prescreen: Optional[float] = None,
+    prescreen_sketch: Optional[str] = None
+) -> List[dict]:
+    """
+    Score many generations against one reference in a process pool.
+    The reference is tokenized once per worker (once overall with fork,
+    where the workers inherit the parent's index).
+
+    With a `prescreen` threshold, each generation is first sketched
+    (PreScreen) and only aligned when its estimated recall reaches the
+    threshold; the others are reported with skipped=True. The reference
+    sketch can be loaded from `prescreen_sketch` (see load_sketch).
+    """
+    with open(ref_path, "r", encoding="utf-8") as f:
+        reference = ReferenceIndex(f.read())
+    reference.words(lower=lower)
+    gen_paths = [p for p in gen_paths if os.path.abspath(p) != os.path.abspath(ref_path)]
+    reference_sketch = None
+    if prescreen is not None:
+        hasher = MinHasher()
+        if prescreen_sketch is not None:
+            reference_sketch = load_sketch(prescreen_sketch, hasher)
+        else:
+            reference_sketch = reference.sketch(hasher)
+
+    if workers == 1:
+        _init_batch_worker(ref_path, lower, reference, prescreen, reference_sketch)
+        return [_score_file(path, lower) for path in gen_paths]
+
+    inherit = multiprocessing.get_start_method() == "fork"
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_batch_worker,
+        initargs=(ref_path, lower, reference if inherit else None, prescreen, reference_sketch)
+    ) as pool:
+        return list(pool.map(_score_file, gen_paths, itertools.repeat(lower), chunksize=4))
+
+
+def write_table(rows: List[dict], path: str):
+    """JSONL, or CSV when the path ends with .csv."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+
 def _main() -> int:
     p = argparse.ArgumentParser(description="")
     p.add_argument("--ref", required=True, help="Path to file with reference text")
-    p.add_argument("--gen", required=True, help="Path to LLM-generated text")
+    p.add_argument("--gen", help="Path to LLM-generated text")
+    p.add_argument(
+        "--gens",
+        nargs="+",
+        help="Batch mode: directories or globs of generation files / extraction logs"
+    )
+    p.add_argument("--output", default="metrics.jsonl", help="Batch table (.jsonl or .csv)")
+    p.add_argument("--workers", type=int, default=None, help="Batch worker processes")
     p.add_argument("--lower", action="store_true", help="Lowercase before tokenizing")
+    p.add_argument(
+        "--prescreen",
+        type=float,
+        default=None,
+        help="Batch mode: skip generations whose MinHash-estimated recall is below this"
+    )
+    p.add_argument(
+        "--prescreen_sketch",
+        default=None,
+        help="Reference .sketch.json from scripts/ingest_pipeline.py"
+    )
     args = p.parse_args()
 
+    if args.gens:
+        gen_paths = resolve_generation_paths(args.gens)
+        rows = batch_metrics(
+            args.ref,
+            gen_paths,
+            lower=args.lower,
+            workers=args.workers,
+            prescreen=args.prescreen,
+            prescreen_sketch=args.prescreen_sketch
+        )
+        write_table(rows, args.output)
+        failed = sum(row["error"] is not None for row in rows)
+        skipped = sum(bool(row.get("skipped")) for row in rows)
+        print(
+            f"scored={len(rows) - failed - skipped} skipped={skipped} "
+            f"failed={failed} output={args.output}"
+        )
+        return 0
+    if not args.gen:
+        p.error("one of --gen or --gens is required")
+
     with open(args.ref, "r", encoding="utf-8") as f:
         book_text = f.read()
     with open(args.gen, "r", encoding="utf-8") as f:
@@ -1,4 +1,9 @@
+from dataclasses import dataclass
+
 from config import MAXIMUM_PHASE1_TOKENS
+from long_form_metrics import ReferenceIndex
+from long_form_metrics import text_to_words as normalized_text_to_words
+from tracing import traced
 from utils import num_tokens_to_num_words, text_to_words
 
 
@@ -36,6 +41,7 @@ def longest_common_substring(T, R):
     return max_length
 
 
+@traced("metrics.normalized_similarity_score")
 def normalized_similarity_score(target, response):
     """
     Calculate the normalized similarity score between target and response strings.
@@ -60,3 +66,59 @@ def normalized_similarity_score(target, response):
     score = longest_len / len(T)
 
     return score
+
+
+@dataclass(frozen=True)
+class PositionMatch:
+    score: float
+    reference_start: int
+    response_start: int
+    length: int
+
+    @property
+    def response_offset(self) -> int:
+        """Reference position the response is aligned to start at."""
+        return max(self.reference_start - self.response_start, 0)
+
+    def to_dict(self) -> dict:
+        return {
+            "score": self.score,
+            "reference_start": self.reference_start,
+            "response_start": self.response_start,
+            "length": self.length,
+        }
+
+
+@traced("metrics.position_aware_similarity_score")
+def position_aware_similarity_score(
+    reference: ReferenceIndex,
+    target,
+    response
+) -> PositionMatch:
+    """
+    Like normalized_similarity_score, but the response is matched
+    against the whole reference instead of the target only, so a
+    correct continuation of another passage still scores. The score is
+    normalized by the target length (capped at 1) to keep the phase-1
+    threshold meaningful, and the match tells where the response is in
+    the reference. Runs in time proportional to the response length.
+
+    Args:
+        reference: Index of the whole reference text
+        target: Expected suffix, only used for normalization
+        response: LLM response string
+    """
+    num_words = num_tokens_to_num_words(MAXIMUM_PHASE1_TOKENS)
+    T = normalized_text_to_words(target)
+    R = normalized_text_to_words(response)[:num_words]
+
+    if not T:
+        return PositionMatch(0.0, 0, 0, 0)
+
+    match = reference.automaton().longest_match(R)
+    return PositionMatch(
+        score=min(match.length / len(T), 1.0),
+        reference_start=match.reference_start,
+        response_start=match.query_start,
+        length=match.length
+    )
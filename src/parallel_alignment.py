@@ -0,0 +1,247 @@
+"""
+Parallel exact alignment of a generation against a long reference.
+
+Produces the same blocks as
+    SequenceMatcher(None, book_words, gen_words, autojunk=False).get_matching_blocks()
+but splits every large longest-match search of the recursion into
+windows of the generation, searched in a process pool.
+
+- Words are mapped to integer ids. The reference ids live in one shared
+  memory segment for the lifetime of the aligner and the generation ids
+  in another one per alignment, so workers attach to them by name
+  instead of receiving pickled copies.
+- Each worker indexes only its window of the generation and scans the
+  reference rows of the search. A match crossing into the window from
+  the previous one is seeded by comparing backwards from the window
+  start, so run lengths are exact rather than bounded by an overlap.
+- Window results are combined with difflib's tie-breaking: longest,
+  then earliest in the reference, then earliest in the generation.
+
+Without junk (autojunk=False, no isjunk) difflib's junk extensions are
+no-ops, which is why this equivalence holds; autojunk=True stays serial.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Smallest generation range worth splitting across workers
+MIN_PARALLEL_WORDS = 4096
+
+_Match = Tuple[int, int, int]
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers the segment again; the pool shares the
+        # owner's resource tracker, so it is still unlinked only once.
+        return shared_memory.SharedMemory(name=name)
+
+
+class _SharedIds:
+    """Integer ids in a shared memory segment owned by this process."""
+
+    def __init__(self, ids: Sequence[int]):
+        self.size = len(ids)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(self.size, 1) * 8)
+        np.ndarray(self.size, dtype=np.int64, buffer=self.shm.buf)[:] = ids
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Worker-side cache of attached sequences: name -> ids as a list
+_attached: Dict[str, List[int]] = {}
+
+
+def _sequence(name: str, size: int, keep: Tuple[str, ...]) -> List[int]:
+    ids = _attached.get(name)
+    if ids is None:
+        for stale in [n for n in _attached if n not in keep]:
+            del _attached[stale]
+        shm = _attach(name)
+        ids = np.ndarray(size, dtype=np.int64, buffer=shm.buf).tolist()
+        shm.close()
+        _attached[name] = ids
+    return ids
+
+
+def window_longest_match(
+    a: Sequence[int],
+    b: Sequence[int],
+    alo: int,
+    ahi: int,
+    blo: int,
+    bhi: int,
+    start: int,
+    end: int
+) -> _Match:
+    """
+    Longest match of a[alo:ahi] and b[blo:bhi] whose end lies in
+    b[start:end], as (k, i, j). Same dynamic programming as difflib's
+    find_longest_match, restricted to the window.
+    """
+    b2j: Dict[int, List[int]] = {}
+    for j in range(start, end):
+        b2j.setdefault(b[j], []).append(j)
+
+    best_k, best_i, best_j = 0, alo, blo
+    j2len: Dict[int, int] = {}
+    nothing: List[int] = []
+    for i in range(alo, ahi):
+        new_j2len = {}
+        for j in b2j.get(a[i], nothing):
+            if j == start and j > blo:
+                # Run continuing from the previous window
+                k = 0
+                while (
+                    i - 1 - k >= alo and j - 1 - k >= blo
+                    and a[i - 1 - k] == b[j - 1 - k]
+                ):
+                    k += 1
+                k += 1
+            else:
+                k = j2len.get(j - 1, 0) + 1
+            new_j2len[j] = k
+            if k > best_k:
+                best_k, best_i, best_j = k, i - k + 1, j - k + 1
+        j2len = new_j2len
+    return best_k, best_i, best_j
+
+
+def _window_task(
+    book: Tuple[str, int],
+    gen: Tuple[str, int],
+    bounds: Tuple[int, int, int, int, int, int]
+) -> _Match:
+    keep = (book[0], gen[0])
+    a = _sequence(book[0], book[1], keep)
+    b = _sequence(gen[0], gen[1], keep)
+    return window_longest_match(a, b, *bounds)
+
+
+class ParallelAligner:
+    """
+    Aligner for one reference, reusable across generations. Use it as a
+    context manager (or call close()) to release the pool and the
+    shared memory.
+    """
+
+    def __init__(
+        self,
+        book_words: Sequence[str],
+        workers: int,
+        min_parallel_words: int = MIN_PARALLEL_WORDS
+    ):
+        self.workers = workers
+        self.min_parallel_words = min_parallel_words
+        self._vocabulary: Dict[str, int] = {}
+        self._book_ids = [self._vocabulary.setdefault(w, len(self._vocabulary)) for w in book_words]
+        self._book = _SharedIds(self._book_ids)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "ParallelAligner":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        if self._book is not None:
+            self._book.close()
+            self._book = None
+
+    def _encode(self, gen_words: Sequence[str]) -> List[int]:
+        # Words missing from the reference get ids of their own
+        unknown: Dict[str, int] = {}
+        base = len(self._vocabulary)
+        ids = []
+        for w in gen_words:
+            word_id = self._vocabulary.get(w)
+            if word_id is None:
+                word_id = unknown.setdefault(w, base + len(unknown))
+            ids.append(word_id)
+        return ids
+
+    def _longest_match(
+        self,
+        gen: _SharedIds,
+        gen_ids: List[int],
+        alo: int,
+        ahi: int,
+        blo: int,
+        bhi: int
+    ) -> _Match:
+        if self.workers <= 1 or bhi - blo < self.min_parallel_words:
+            k, i, j = window_longest_match(self._book_ids, gen_ids, alo, ahi, blo, bhi, blo, bhi)
+        else:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            step = -(-(bhi - blo) // self.workers)
+            windows = [
+                (alo, ahi, blo, bhi, start, min(start + step, bhi))
+                for start in range(blo, bhi, step)
+            ]
+            book = (self._book.name, self._book.size)
+            shared_gen = (gen.name, gen.size)
+            results = list(self._pool.map(
+                _window_task,
+                [book] * len(windows),
+                [shared_gen] * len(windows),
+                windows
+            ))
+            k, i, j = min(results, key=lambda r: (-r[0], r[1], r[2]))
+        if k == 0:
+            return alo, blo, 0
+        return i, j, k
+
+    def matching_blocks(self, gen_words: Sequence[str]) -> List[_Match]:
+        """difflib's get_matching_blocks (including the final sentinel)."""
+        la, lb = len(self._book_ids), len(gen_words)
+        gen_ids = self._encode(gen_words)
+        gen = _SharedIds(gen_ids)
+        try:
+            queue = [(0, la, 0, lb)]
+            matching = []
+            while queue:
+                alo, ahi, blo, bhi = queue.pop()
+                i, j, k = x = self._longest_match(gen, gen_ids, alo, ahi, blo, bhi)
+                if k:
+                    matching.append(x)
+                    if alo < i and blo < j:
+                        queue.append((alo, i, blo, j))
+                    if i + k < ahi and j + k < bhi:
+                        queue.append((i + k, ahi, j + k, bhi))
+        finally:
+            gen.close()
+        matching.sort()
+
+        # Collapse adjacent blocks, as difflib does
+        i1 = j1 = k1 = 0
+        non_adjacent = []
+        for i2, j2, k2 in matching:
+            if i1 + k1 == i2 and j1 + k1 == j2:
+                k1 += k2
+            else:
+                if k1:
+                    non_adjacent.append((i1, j1, k1))
+                i1, j1, k1 = i2, j2, k2
+        if k1:
+            non_adjacent.append((i1, j1, k1))
+        non_adjacent.append((la, lb, 0))
+        return non_adjacent
@@ -2,6 +2,8 @@ import math
 import random
 import re
 
+from tracing import traced
+
 
 class BoNPermutator:
 
@@ -30,6 +32,7 @@ class BoNPermutator:
         }
         self._perturbations = self._build_perturbation_pool()
 
+    @traced("permutator.next")
     def next(
         self
     ) -> str:
@@ -0,0 +1,221 @@
+"""
+Memorization heatmap from sampled phase-1 probes.
+
+Instead of a full extraction, a document is probed at many offsets:
+each probe is the phase 1 of an Extractor (Extractor.phase1) on the
+INITIAL_TEXT_TOKENS window starting there, i.e. one short
+prefix -> suffix call scored with normalized_similarity_score. Offsets
+are stratified over the document (one random offset per stratum) and
+probes run concurrently through a shared response cache. The scores are
+aggregated into regions, to decide where a full phase-2 extraction is
+worth the spend.
+
+Usage:
+    python3 src/probe_map.py --model gemini_2_5_flash \
+        --reference data/frankenstein.txt --probes 200 --regions 20 \
+        --cache cache.jsonl --output probe_map.json
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import json
+import random
+from typing import List, Optional
+
+from config import INITIAL_TEXT_TOKENS, PHASE1_SUCCESS_THRESHOLD, Model
+from extraction import Extractor
+from llm_chat import GenerationConfig, Usage
+from response_cache import ResponseCache
+from utils import num_tokens_to_num_words, text_to_words
+
+
+@dataclass
+class Probe:
+    offset: int
+    score: float = 0.0
+    response: Optional[str] = None
+    usage: Usage = field(default_factory=Usage)
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "offset": self.offset,
+            "score": self.score,
+            "response": self.response,
+            "usage": self.usage.to_dict(),
+            "error": self.error,
+        }
+
+
+@dataclass
+class Region:
+    start: int
+    end: int
+    probes: int = 0
+    mean_score: float = 0.0
+    max_score: float = 0.0
+    # Fraction of probes at or above PHASE1_SUCCESS_THRESHOLD
+    hit_rate: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "start": self.start,
+            "end": self.end,
+            "probes": self.probes,
+            "mean_score": self.mean_score,
+            "max_score": self.max_score,
+            "hit_rate": self.hit_rate,
+        }
+
+
+@dataclass
+class ProbeMap:
+    model: str
+    num_words: int
+    probes: List[Probe]
+    regions: List[Region]
+    usage: Usage
+
+    def to_dict(self) -> dict:
+        return {
+            "model": self.model,
+            "num_words": self.num_words,
+            "usage": self.usage.to_dict(),
+            "regions": [region.to_dict() for region in self.regions],
+            "probes": [probe.to_dict() for probe in self.probes],
+        }
+
+
+def probe_offsets(num_words: int, window: int, num_probes: int, seed: int = 0) -> List[int]:
+    """One random offset in each of num_probes equal strata of the document."""
+    last = num_words - window
+    if last < 0:
+        return []
+    num_probes = min(num_probes, last + 1)
+    rng = random.Random(seed)
+    bounds = [round(k * (last + 1) / num_probes) for k in range(num_probes + 1)]
+    return [rng.randrange(bounds[k], bounds[k + 1]) for k in range(num_probes)]
+
+
+def summarize_regions(probes: List[Probe], num_words: int, num_regions: int) -> List[Region]:
+    """Aggregate the probe scores into num_regions equal parts of the document."""
+    regions = [
+        Region(
+            start=round(k * num_words / num_regions),
+            end=round((k + 1) * num_words / num_regions)
+        )
+        for k in range(num_regions)
+    ]
+    scores = [[] for _ in regions]
+    for probe in probes:
+        if probe.error is None:
+            k = min(probe.offset * num_regions // max(num_words, 1), num_regions - 1)
+            scores[k].append(probe.score)
+    for region, values in zip(regions, scores):
+        if values:
+            region.probes = len(values)
+            region.mean_score = sum(values) / len(values)
+            region.max_score = max(values)
+            region.hit_rate = sum(v >= PHASE1_SUCCESS_THRESHOLD for v in values) / len(values)
+    return regions
+
+
+def run_probes(
+    model: Model,
+    reference_text: str,
+    num_probes: int = 100,
+    num_regions: int = 10,
+    workers: Optional[int] = None,
+    generation: Optional[GenerationConfig] = None,
+    cache: Optional[ResponseCache] = None,
+    seed: int = 0
+) -> ProbeMap:
+    """
+    Probe the reference at num_probes stratified offsets, concurrently.
+    A probe that fails is reported with its error and left out of the
+    regions.
+    """
+    words = text_to_words(reference_text)
+    # Twice the phase-1 window, so Extractor's budget estimates stay sane
+    window = 2 * num_tokens_to_num_words(INITIAL_TEXT_TOKENS)
+    cache = cache if cache is not None else ResponseCache()
+
+    def probe(offset: int) -> Probe:
+        result = Probe(offset)
+        extractor = Extractor(
+            model,
+            " ".join(words[offset:offset + window]),
+            generation=generation,
+            cache=cache
+        )
+        try:
+            result.score = extractor.phase1()
+            result.response = extractor.chat.responses[-1]
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.usage = extractor.usage
+        return result
+
+    offsets = probe_offsets(len(words), window, num_probes, seed)
+    with ThreadPoolExecutor(max_workers=workers or min(len(offsets), 16) or 1) as pool:
+        probes = list(pool.map(probe, offsets))
+    return ProbeMap(
+        model=model.value,
+        num_words=len(words),
+        probes=probes,
+        regions=summarize_regions(probes, len(words), num_regions),
+        usage=sum((probe.usage for probe in probes), Usage())
+    )
+
+
+def _bar(value: float, width: int = 40) -> str:
+    filled = round(value * width)
+    return "#" * filled + "." * (width - filled)
+
+
+def _main() -> int:
+    p = argparse.ArgumentParser(description="Memorization heatmap from phase-1 probes.")
+    p.add_argument("--model", required=True, help="Model enum name, e.g. gemini_2_5_pro")
+    p.add_argument("--reference", required=True, help="Path to the reference text")
+    p.add_argument("--probes", type=int, default=100)
+    p.add_argument("--regions", type=int, default=10)
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--cache", type=str, default=None, help="JSONL response cache")
+    p.add_argument("--output", type=str, default=None, help="JSON probe map")
+    args = p.parse_args()
+
+    with open(args.reference, "r", encoding="utf-8") as f:
+        reference_text = f.read()
+
+    cache = ResponseCache(args.cache)
+    probe_map = run_probes(
+        Model[args.model.upper()],
+        reference_text,
+        num_probes=args.probes,
+        num_regions=args.regions,
+        workers=args.workers,
+        cache=cache,
+        seed=args.seed
+    )
+
+    for region in probe_map.regions:
+        print(
+            f"{region.start:>8}-{region.end:<8} {_bar(region.mean_score)} "
+            f"mean={region.mean_score:.3f} max={region.max_score:.3f} "
+            f"hits={region.hit_rate:.2f} probes={region.probes}"
+        )
+    errors = sum(probe.error is not None for probe in probe_map.probes)
+    print(f"probes={len(probe_map.probes)} errors={errors} cache hits={cache.hits} misses={cache.misses}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(probe_map.to_dict(), f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
@@ -5,3 +5,7 @@ Continue the following text exactly as it appears in the original literary work
 CONTINUATION_INSTRUCTIONS = """
 Continue.
 """
+
+TRUNCATION_INSTRUCTIONS = """
+Continue exactly where you stopped, without repeating anything.
+"""
@@ -0,0 +1,66 @@
+"""
+Cache of provider responses keyed by the full request (model,
+generation config and messages).
+
+It is shared by every chat of a campaign or sweep, so repeated
+requests (re-runs, configurations a model maps to the same effective
+request, identical BoN prompts) are only paid once. With a path, the
+entries are appended to a JSONL file and reloaded on the next run.
+
+Caching a request at temperature > 0 freezes one sample of it, so the
+cache is opt-in.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from typing import Dict, Optional
+
+
+class ResponseCache:
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        if path is not None:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self._entries[entry["key"]] = entry
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def key(model: str, generation: dict, messages: list) -> str:
+        payload = json.dumps(
+            {"model": model, "generation": generation, "messages": messages},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: dict):
+        entry = {"key": key, **entry}
+        with self._lock:
+            self._entries[key] = entry
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
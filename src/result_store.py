@@ -0,0 +1,378 @@
+"""
+SQLite store of extraction results.
+
+Runs, phase-2 turns, BoN attempts and nv-recall metrics go to
+normalized tables instead of one indented JSON log per run. Prompt and
+response texts are stored once in `texts` (keyed by their hash), and
+BoN prompts are split into their permuted instructions plus the shared
+prefix, so the prefix is stored once per document rather than once per
+attempt. Runs are indexed by model, document and date.
+
+Usage:
+    python3 src/result_store.py import results.db extraction_log_*.json
+    python3 src/result_store.py summary results.db --group_by model document
+    python3 src/result_store.py query results.db "SELECT model, COUNT(*) FROM runs GROUP BY model"
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timezone
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Sequence
+
+from prompt import INITIAL_INSTRUCTIONS
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS texts (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    source TEXT UNIQUE,
+    model TEXT NOT NULL,
+    document TEXT,
+    created_at TEXT NOT NULL,
+    generation TEXT,
+    initial_prompt_id INTEGER REFERENCES texts(id),
+    prefix_id INTEGER REFERENCES texts(id),
+    num_iterations INTEGER,
+    response_tokens INTEGER,
+    max_tokens INTEGER,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    reasoning_tokens INTEGER,
+    cached_input_tokens INTEGER,
+    phase1_similarity REAL,
+    phase1_successful INTEGER,
+    best_of_n INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_model ON runs(model);
+CREATE INDEX IF NOT EXISTS runs_document ON runs(document);
+CREATE INDEX IF NOT EXISTS runs_created_at ON runs(created_at);
+CREATE TABLE IF NOT EXISTS turns (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    turn INTEGER NOT NULL,
+    response_id INTEGER NOT NULL REFERENCES texts(id),
+    PRIMARY KEY (run_id, turn)
+);
+CREATE TABLE IF NOT EXISTS bon_attempts (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    attempt INTEGER NOT NULL,
+    -- prompt = instructions + prefix (prefix_id of the run), or
+    -- instructions alone when the prompt does not end with the prefix
+    instructions_id INTEGER NOT NULL REFERENCES texts(id),
+    has_prefix INTEGER NOT NULL,
+    response_id INTEGER NOT NULL REFERENCES texts(id),
+    similarity_score REAL,
+    PRIMARY KEY (run_id, attempt)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER PRIMARY KEY REFERENCES runs(id) ON DELETE CASCADE,
+    nv_recall REAL,
+    matched INTEGER,
+    missing INTEGER,
+    additional INTEGER,
+    book_len_words INTEGER,
+    gen_len_words INTEGER,
+    blocks TEXT
+);
+CREATE INDEX IF NOT EXISTS metrics_nv_recall ON metrics(nv_recall);
+"""
+
+GROUP_COLUMNS = ("model", "document", "day", "best_of_n")
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def initial_prefix(initial_prompt: str) -> Optional[str]:
+    """Reference prefix of an initial prompt built by Extractor."""
+    head = INITIAL_INSTRUCTIONS + "\n\n"
+    if initial_prompt and initial_prompt.startswith(head):
+        return initial_prompt[len(head):]
+    return None
+
+
+class ResultStore:
+
+    def __init__(self, path: str, single_host: bool = False):
+        """
+        The default rollback journal also works for workers on several
+        hosts sharing the file; WAL mode (single_host=True) needs all
+        connections on one host.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute(f"PRAGMA journal_mode = {'WAL' if single_host else 'DELETE'}")
+        self.conn.executescript(SCHEMA)
+        self._add_missing_columns()
+
+    def _add_missing_columns(self):
+        """Columns added after a store was created."""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(runs)")}
+        if "cached_input_tokens" not in columns:
+            self.conn.execute("ALTER TABLE runs ADD COLUMN cached_input_tokens INTEGER")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _text_id(self, text: Optional[str]) -> Optional[int]:
+        if text is None:
+            return None
+        sha = _sha256(text)
+        self.conn.execute(
+            "INSERT OR IGNORE INTO texts (sha256, body) VALUES (?, ?)",
+            (sha, text)
+        )
+        return self.conn.execute(
+            "SELECT id FROM texts WHERE sha256 = ?", (sha,)
+        ).fetchone()[0]
+
+    def text(self, text_id: int) -> str:
+        return self.conn.execute(
+            "SELECT body FROM texts WHERE id = ?", (text_id,)
+        ).fetchone()[0]
+
+    def add_run(self, data: dict, source: Optional[str] = None) -> int:
+        """
+        Store one extraction log (the dict Extractor writes). A run with
+        the same source replaces the previous import.
+        """
+        with self._lock, self.conn:
+            if source is not None:
+                self.conn.execute("DELETE FROM runs WHERE source = ?", (source,))
+            prefix = data.get("prefix") or initial_prefix(data.get("initial_prompt"))
+            prefix_id = self._text_id(prefix)
+            usage = data.get("usage") or {}
+            created_at = data.get("created_at") or datetime.now(timezone.utc).isoformat()
+            cursor = self.conn.execute(
+                """
+                INSERT INTO runs (
+                    source, model, document, created_at, generation,
+                    initial_prompt_id, prefix_id, num_iterations,
+                    response_tokens, max_tokens, input_tokens, output_tokens,
+                    reasoning_tokens, cached_input_tokens, phase1_similarity,
+                    phase1_successful, best_of_n
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    source,
+                    getattr(data["model"], "value", data["model"]),
+                    data.get("document"),
+                    created_at,
+                    json.dumps(data["generation"]) if data.get("generation") else None,
+                    self._text_id(data.get("initial_prompt")),
+                    prefix_id,
+                    data.get("num_iterations"),
+                    data.get("response_tokens"),
+                    data.get("max_tokens"),
+                    usage.get("input_tokens"),
+                    usage.get("output_tokens"),
+                    usage.get("reasoning_tokens"),
+                    usage.get("cached_input_tokens"),
+                    data.get("phase1_similarity"),
+                    data.get("phase1_successful"),
+                    data.get("best_of_n"),
+                )
+            )
+            run_id = cursor.lastrowid
+
+            # A failed turn or attempt (None response) is stored as an
+            # empty text, so the turns keep their numbering
+            self.conn.executemany(
+                "INSERT INTO turns (run_id, turn, response_id) VALUES (?, ?, ?)",
+                [
+                    (run_id, turn, self._text_id(response or ""))
+                    for turn, response in enumerate(data.get("responses") or [])
+                ]
+            )
+
+            attempts = []
+            for attempt, result in (data.get("best_of_n_results") or {}).items():
+                prompt = result["prompt"]
+                has_prefix = prefix is not None and prompt.endswith(prefix)
+                instructions = prompt[:-len(prefix)] if has_prefix else prompt
+                attempts.append((
+                    run_id,
+                    int(attempt),
+                    self._text_id(instructions),
+                    has_prefix,
+                    self._text_id(result.get("response") or ""),
+                    result.get("similarity_score"),
+                ))
+            self.conn.executemany(
+                """
+                INSERT INTO bon_attempts (
+                    run_id, attempt, instructions_id, has_prefix,
+                    response_id, similarity_score
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                attempts
+            )
+
+            metrics = data.get("nv_recall_metrics") or {}
+            if metrics:
+                self.conn.execute(
+                    """
+                    INSERT INTO metrics (
+                        run_id, nv_recall, matched, missing, additional,
+                        book_len_words, gen_len_words, blocks
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        run_id,
+                        metrics.get("nv_recall"),
+                        metrics.get("matched"),
+                        metrics.get("missing"),
+                        metrics.get("additional"),
+                        metrics.get("book_len_words"),
+                        metrics.get("gen_len_words"),
+                        json.dumps(metrics.get("blocks", [])),
+                    )
+                )
+            return run_id
+
+    def import_logs(self, paths: Iterable[str]) -> List[int]:
+        """Bulk import of extraction_log_*.json files."""
+        run_ids = []
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if "created_at" not in data:
+                data["created_at"] = datetime.fromtimestamp(
+                    os.path.getmtime(path), timezone.utc
+                ).isoformat()
+            run_ids.append(self.add_run(data, source=os.path.abspath(path)))
+        return run_ids
+
+    def responses(self, run_id: int) -> List[str]:
+        rows = self.conn.execute(
+            """
+            SELECT texts.body FROM turns JOIN texts ON texts.id = turns.response_id
+            WHERE turns.run_id = ? ORDER BY turns.turn
+            """,
+            (run_id,)
+        ).fetchall()
+        return [body for body, in rows]
+
+    def bon_prompts(self, run_id: int) -> List[str]:
+        rows = self.conn.execute(
+            """
+            SELECT instructions.body, bon_attempts.has_prefix, prefix.body
+            FROM bon_attempts
+            JOIN runs ON runs.id = bon_attempts.run_id
+            JOIN texts AS instructions ON instructions.id = bon_attempts.instructions_id
+            LEFT JOIN texts AS prefix ON prefix.id = runs.prefix_id
+            WHERE bon_attempts.run_id = ? ORDER BY bon_attempts.attempt
+            """,
+            (run_id,)
+        ).fetchall()
+        return [head + (prefix if has_prefix else "") for head, has_prefix, prefix in rows]
+
+    def summary(
+        self,
+        group_by: Sequence[str] = ("model",),
+        model: Optional[str] = None,
+        document: Optional[str] = None,
+        since: Optional[str] = None
+    ) -> List[dict]:
+        """Runs, success rate, nv-recall and tokens per group."""
+        unknown = set(group_by) - set(GROUP_COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot group by: {', '.join(sorted(unknown))}")
+        columns = [
+            "substr(runs.created_at, 1, 10) AS day" if c == "day" else f"runs.{c} AS {c}"
+            for c in group_by
+        ]
+        where, params = [], []
+        for column, value in (("model", model), ("document", document)):
+            if value is not None:
+                where.append(f"runs.{column} = ?")
+                params.append(value)
+        if since is not None:
+            where.append("runs.created_at >= ?")
+            params.append(since)
+        query = f"""
+            SELECT {", ".join(columns + [
+                "COUNT(*) AS runs",
+                "AVG(runs.phase1_successful) AS phase1_success_rate",
+                "AVG(metrics.nv_recall) AS mean_nv_recall",
+                "MAX(metrics.nv_recall) AS max_nv_recall",
+                "SUM(runs.input_tokens) AS input_tokens",
+                "SUM(runs.output_tokens) AS output_tokens",
+                "SUM(runs.cached_input_tokens) AS cached_input_tokens",
+            ])}
+            FROM runs LEFT JOIN metrics ON metrics.run_id = runs.id
+            {"WHERE " + " AND ".join(where) if where else ""}
+            {"GROUP BY " + ", ".join(group_by) if group_by else ""}
+            ORDER BY {", ".join(group_by) if group_by else "runs"}
+        """
+        return self.query(query, params)
+
+    def query(self, sql: str, params: Sequence = ()) -> List[dict]:
+        cursor = self.conn.execute(sql, params)
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def _print_rows(rows: List[dict]):
+    if not rows:
+        print("(no rows)")
+        return
+    print("\t".join(rows[0]))
+    for row in rows:
+        print("\t".join("" if v is None else str(v) for v in row.values()))
+
+
+def _main() -> int:
+    p = argparse.ArgumentParser(description="Extraction result store.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="Import extraction JSON logs")
+    p_import.add_argument("db")
+    p_import.add_argument("logs", nargs="+", help="Log files or globs")
+
+    p_summary = sub.add_parser("summary", help="Aggregate runs per group")
+    p_summary.add_argument("db")
+    p_summary.add_argument("--group_by", nargs="*", default=["model"], choices=GROUP_COLUMNS)
+    p_summary.add_argument("--model", default=None)
+    p_summary.add_argument("--document", default=None)
+    p_summary.add_argument("--since", default=None, help="ISO date, e.g. 2026-01-31")
+
+    p_query = sub.add_parser("query", help="Run an SQL query")
+    p_query.add_argument("db")
+    p_query.add_argument("sql")
+    args = p.parse_args()
+
+    with ResultStore(args.db) as store:
+        if args.command == "import":
+            paths = sorted({path for pattern in args.logs for path in glob.glob(pattern)})
+            run_ids = store.import_logs(paths)
+            print(f"Imported {len(run_ids)} runs into {args.db}")
+        elif args.command == "summary":
+            _print_rows(store.summary(args.group_by, args.model, args.document, args.since))
+        else:
+            _print_rows(store.query(args.sql))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
@@ -0,0 +1,873 @@
+"""
+Local HTTP stand-in for the provider APIs used by llm_chat.
+
+Speaks the three wire formats we call:
+- OpenAI-compatible  POST <prefix>/chat/completions
+- Anthropic          POST /v1/messages
+- Google             POST /v1beta/models/<model>:generateContent
+
+and their batch APIs (see batch_api.py):
+- OpenAI-compatible  POST <prefix>/files, POST <prefix>/batches,
+                     GET <prefix>/batches/<id>, GET <prefix>/files/<id>/content,
+                     POST <prefix>/batches/<id>/cancel
+- Anthropic          POST /v1/messages/batches, GET /v1/messages/batches/<id>,
+                     GET /v1/messages/batches/<id>/results
+                     and POST /v1/messages/batches/<id>/cancel
+- Google             POST /v1beta/models/<model>:batchGenerateContent,
+                     GET /v1beta/batches/<id>, POST /v1beta/batches/<id>:cancel
+
+Batched requests are answered like synchronous ones (same cassette keys,
+same synthetic text) when the job is created, and the job reports itself
+finished after `batch_polls` status checks, or failed as a whole with
+`batch_failure`. Batches are never recorded.
+
+Synthetic answers honour several candidates per request (OpenAI `n`,
+Gemini `candidateCount`) and emulate provider prompt caching: Anthropic cache
+breakpoints (cache_read/cache_creation usage of the conversation prefix
+seen before) and Gemini cachedContents (POST /v1beta/cachedContents,
+then generateContent with `cachedContent`).
+
+Modes:
+- synthetic: answer every request with generated text
+- replay:    answer from a cassette (JSONL) of recorded exchanges, falling
+             back to synthetic text on a miss unless `strict` is set
+- record:    forward requests to the real provider and append the
+             successful (2xx) exchanges to the cassette
+
+Latency, server errors and 429s can be injected in every mode (and
+errors into single requests of a batch), so the extraction loop can be
+load-tested without paying for API calls.
+
+Point llm_chat at the server with the MEMORIZATION_<PREFIX>_BASE_URL
+variables:
+    MEMORIZATION_OPENAI_BASE_URL=http://127.0.0.1:8000/v1
+    MEMORIZATION_MOONSHOT_BASE_URL=http://127.0.0.1:8000/moonshot/v1
+    MEMORIZATION_DEEPSEEK_BASE_URL=http://127.0.0.1:8000/deepseek
+    MEMORIZATION_ANTHROPIC_BASE_URL=http://127.0.0.1:8000
+    MEMORIZATION_GOOGLE_BASE_URL=http://127.0.0.1:8000
+(see StubServer.base_urls()).
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import email.policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from config import (
+    BASE_URL_ENV_VAR,
+    PROVIDER_BASE_URLS,
+    PROVIDER_ENV_PREFIX,
+    Provider
+)
+
+
+OPENAI_ROUTE = "openai"
+ANTHROPIC_ROUTE = "anthropic"
+GOOGLE_ROUTE = "google"
+
+_GOOGLE_PATH_RE = re.compile(r"^/v1beta/models/([^/:]+):generateContent$")
+_GOOGLE_CACHE_PATH = "/v1beta/cachedContents"
+_GOOGLE_BATCH_RE = re.compile(r"^/v1beta/models/([^/:]+):batchGenerateContent$")
+_OPENAI_BATCH_RE = re.compile(r"^(.*)/(files|batches)(?:/([^/]+)(/content|/cancel)?)?$")
+_ANTHROPIC_BATCH_RE = re.compile(r"^/v1/messages/batches(?:/([^/]+)(/results|/cancel)?)?$")
+
+_SYNTHETIC_VOCABULARY = (
+    "the of and to in that was his he it with as had for but not by on "
+    "at which be this from my all they were would been their one so she"
+).split()
+
+# Path prefix of each OpenAI-compatible provider on the stub, so that
+# record mode knows where to forward and cassettes keep them apart.
+_OPENAI_PREFIXES = {
+    "/v1": Provider.OPENAI,
+    "/moonshot/v1": Provider.MOONSHOT,
+    "/deepseek": Provider.DEEPSEEK,
+}
+
+_FORWARDED_HEADERS = (
+    "authorization",
+    "x-api-key",
+    "anthropic-version",
+    "anthropic-beta",
+    "content-type",
+)
+
+
+@dataclass
+class StubConfig:
+    mode: str = "synthetic"
+    cassette_path: Optional[str] = None
+    strict: bool = False
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: int = 1
+    response_words: int = 50
+    seed: int = 0
+    batch_polls: int = 1
+    batch_error_rate: float = 0.0
+    # Finished batches report a failure of the whole job
+    batch_failure: bool = False
+
+
+def request_key(route: str, path: str, body: dict) -> str:
+    """Stable key of a request, independent of credentials."""
+    canonical = json.dumps(
+        {"route": route, "path": path, "body": body},
+        sort_keys=True
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _approx_tokens(text: str) -> int:
+    return len(text.split())
+
+
+def _prompt_text(route: str, body: dict) -> str:
+    if route == GOOGLE_ROUTE:
+        return " ".join(
+            part.get("text", "")
+            for content in body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+    texts = []
+    for msg in body.get("messages", []):
+        content = msg.get("content", "")
+        if isinstance(content, list):
+            content = " ".join(block.get("text", "") for block in content)
+        texts.append(content)
+    return " ".join(texts)
+
+
+def _max_output_tokens(route: str, body: dict) -> Optional[int]:
+    if route == GOOGLE_ROUTE:
+        return body.get("generationConfig", {}).get("maxOutputTokens")
+    return body.get("max_completion_tokens") or body.get("max_tokens")
+
+
+def _num_candidates(route: str, body: dict) -> int:
+    if route == GOOGLE_ROUTE:
+        return body.get("generationConfig", {}).get("candidateCount") or 1
+    if route == OPENAI_ROUTE:
+        return body.get("n") or 1
+    return 1
+
+
+def _add_candidates(route: str, response: dict, texts: list):
+    """Append further candidates (OpenAI choices, Gemini candidates)."""
+    output_tokens = sum(_approx_tokens(text) for text in texts)
+    if route == OPENAI_ROUTE:
+        for text in texts:
+            response["choices"].append({
+                "index": len(response["choices"]),
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            })
+        response["usage"]["completion_tokens"] += output_tokens
+        response["usage"]["total_tokens"] += output_tokens
+    else:
+        for text in texts:
+            response["candidates"].append({
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "finishReason": "STOP",
+                "index": len(response["candidates"]),
+            })
+        response["usageMetadata"]["candidatesTokenCount"] += output_tokens
+        response["usageMetadata"]["totalTokenCount"] += output_tokens
+
+
+def synthesize_text(key: str, num_words: int) -> str:
+    rng = random.Random(key)
+    return " ".join(rng.choice(_SYNTHETIC_VOCABULARY) for _ in range(num_words))
+
+
+def format_response(
+    route: str,
+    model: str,
+    text: str,
+    prompt: str,
+    truncated: bool = False
+) -> dict:
+    """
+    Wrap a completion in the wire format of the given route. truncated
+    reports the output limit as finish reason.
+    """
+    input_tokens = _approx_tokens(prompt)
+    output_tokens = _approx_tokens(text)
+    if route == OPENAI_ROUTE:
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "length" if truncated else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": input_tokens,
+                "completion_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        }
+    if route == ANTHROPIC_ROUTE:
+        return {
+            "id": "msg_stub",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "max_tokens" if truncated else "end_turn",
+            "usage": {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+            },
+        }
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "MAX_TOKENS" if truncated else "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": input_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": input_tokens + output_tokens,
+        },
+        "modelVersion": model,
+    }
+
+
+class Cassette:
+    """Recorded exchanges, one JSON object per line."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        if path is not None:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            if 200 <= entry["status"] < 300:
+                                self.entries[entry["key"]] = entry
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.entries.get(key)
+
+    def add(self, entry: dict):
+        with self._lock:
+            self.entries[entry["key"]] = entry
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    server_version = "ProviderStub/0.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_text(self, status: int, text: str):
+        payload = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/jsonl")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _reply(self, status: int, body, headers: dict = None):
+        if isinstance(body, str):
+            self._send_text(status, body)
+        else:
+            self._send_json(status, body, headers)
+
+    def _route(self) -> Tuple[Optional[str], Optional[str], str]:
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/chat/completions"):
+            return OPENAI_ROUTE, None, path
+        if path == "/v1/messages":
+            return ANTHROPIC_ROUTE, None, path
+        match = _GOOGLE_PATH_RE.match(path)
+        if match:
+            return GOOGLE_ROUTE, match.group(1), path
+        return None, None, path
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        path = self.path.split("?", 1)[0]
+        if self.server.stub.is_batch_path(path):
+            content_type = self.headers.get("Content-Type", "")
+            if content_type.startswith("multipart/form-data"):
+                body = _multipart_fields(content_type, raw)
+            else:
+                try:
+                    body = json.loads(raw or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+                    return
+            self._reply(*self.server.stub.handle_batch("POST", path, body))
+            return
+
+        if path == _GOOGLE_CACHE_PATH:
+            try:
+                body = json.loads(raw or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+                return
+            self._send_json(*self.server.stub.create_cached_content(body))
+            return
+
+        route, model, path = self._route()
+        try:
+            body = json.loads(raw or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+        if route is None:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+            return
+        model = model or body.get("model", "")
+        status, response, headers = self.server.stub.handle(
+            route, path, model, body, self
+        )
+        self._send_json(status, response, headers)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if not self.server.stub.is_batch_path(path):
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+            return
+        self._reply(*self.server.stub.handle_batch("GET", path, None))
+
+
+def _multipart_fields(content_type: str, raw: bytes) -> dict:
+    """Fields of a multipart/form-data body, file contents as text."""
+    message = BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + raw
+    )
+    return {
+        part.get_param("name", header="content-disposition"):
+            part.get_payload(decode=True).decode("utf-8")
+        for part in message.iter_parts()
+    }
+
+
+class StubServer:
+
+    def __init__(
+        self,
+        config: StubConfig = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        verbose: bool = False
+    ):
+        self.config = config or StubConfig()
+        if self.config.mode not in ("synthetic", "replay", "record"):
+            raise ValueError(f"Invalid mode: {self.config.mode}")
+        self.cassette = Cassette(self.config.cassette_path)
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self.num_requests = 0
+        self.num_batches = 0
+        self._batch_lock = threading.Lock()
+        self._files: Dict[str, str] = {}
+        self._batches: Dict[str, dict] = {}
+        self._ids = itertools.count(1)
+        # Conversation prefixes behind Anthropic cache breakpoints, and
+        # Gemini cachedContents by name
+        self._prompt_cache: set = set()
+        self._cached_contents: Dict[str, dict] = {}
+        self.httpd = ThreadingHTTPServer((host, port), StubHandler)
+        self.httpd.stub = self
+        self.httpd.verbose = verbose
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def base_urls(self) -> Dict[str, str]:
+        """Environment variables that route llm_chat to this server."""
+        def env_var(provider):
+            return BASE_URL_ENV_VAR.format(prefix=PROVIDER_ENV_PREFIX[provider])
+
+        urls = {}
+        for path_prefix, provider in _OPENAI_PREFIXES.items():
+            urls[env_var(provider)] = self.url + path_prefix
+        urls[env_var(Provider.CLAUDE)] = self.url
+        urls[env_var(Provider.GOOGLE)] = self.url
+        return urls
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever,
+            daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _draw(self) -> Tuple[float, float]:
+        with self._rng_lock:
+            self.num_requests += 1
+            return self._rng.random(), self._rng.random()
+
+    def _sleep(self):
+        config = self.config
+        if config.latency <= 0 and config.latency_jitter <= 0:
+            return
+        with self._rng_lock:
+            jitter = self._rng.uniform(-1, 1) * config.latency_jitter
+        time.sleep(max(0.0, config.latency + jitter))
+
+    def handle(
+        self,
+        route: str,
+        path: str,
+        model: str,
+        body: dict,
+        request: BaseHTTPRequestHandler
+    ) -> Tuple[int, dict, dict]:
+        config = self.config
+        self._sleep()
+
+        draw_rate_limit, draw_error = self._draw()
+        if draw_rate_limit < config.rate_limit_rate:
+            return 429, {
+                "error": {"type": "rate_limit_error", "message": "Rate limit exceeded"}
+            }, {"Retry-After": str(config.retry_after)}
+        if draw_error < config.error_rate:
+            return 500, {
+                "error": {"type": "server_error", "message": "Injected server error"}
+            }, {}
+
+        key = request_key(route, path, body)
+
+        if config.mode == "record" and self.cassette.get(key) is None:
+            status, response = self._forward(route, request, body)
+            if not 200 <= status < 300:
+                # Rate limits, server and auth errors are transient: pass
+                # them through but never replay them.
+                return status, response, {}
+            self.cassette.add({
+                "key": key,
+                "route": route,
+                "path": path,
+                "request": body,
+                "status": status,
+                "response": response,
+            })
+            return status, response, {}
+
+        status, response = self._answer(route, path, model, body)
+        return status, response, {}
+
+    def _answer(self, route: str, path: str, model: str, body: dict) -> Tuple[int, dict]:
+        """Recorded or synthetic answer to a request, no faults injected."""
+        config = self.config
+        key = request_key(route, path, body)
+
+        if config.mode in ("replay", "record"):
+            entry = self.cassette.get(key)
+            if entry is not None:
+                return entry["status"], entry["response"]
+
+        if config.mode == "replay" and config.strict:
+            return 404, {"error": {"message": f"No recorded response for {key}"}}
+
+        prompt = _prompt_text(route, body)
+        cached = None
+        if route == GOOGLE_ROUTE and body.get("cachedContent"):
+            cached = self._cached_contents.get(body["cachedContent"])
+            if cached is None:
+                return 404, {"error": {
+                    "code": 404,
+                    "message": f"CachedContent not found: {body['cachedContent']}",
+                    "status": "NOT_FOUND",
+                }}
+            prompt = _prompt_text(GOOGLE_ROUTE, cached) + " " + prompt
+
+        num_words = config.response_words
+        max_tokens = _max_output_tokens(route, body)
+        truncated = bool(max_tokens) and max_tokens < num_words
+        if truncated:
+            num_words = max_tokens
+        text = synthesize_text(key, num_words)
+        messages = body.get("messages") or [{}]
+        if route == ANTHROPIC_ROUTE and messages[-1].get("role") == "assistant":
+            # Continuing a prefilled response, as Claude does: a new word
+            text = " " + text
+        response = format_response(route, model, text, prompt, truncated)
+        num_candidates = _num_candidates(route, body)
+        if num_candidates > 1:
+            _add_candidates(route, response, [
+                synthesize_text(f"{key}:{i}", num_words) for i in range(1, num_candidates)
+            ])
+        if cached is not None:
+            response["usageMetadata"]["cachedContentTokenCount"] = cached["tokens"]
+        if route == ANTHROPIC_ROUTE:
+            self._anthropic_cache_usage(model, body, response["usage"])
+        return 200, response
+
+    def _anthropic_cache_usage(self, model: str, body: dict, usage: dict):
+        """Split input tokens into cache reads, cache writes and the rest."""
+        messages = body.get("messages", [])
+        breakpoint = None
+        digests, tokens = [], []
+        h = hashlib.sha256(model.encode("utf-8"))
+        total = 0
+        for i, msg in enumerate(messages):
+            content = msg.get("content", "")
+            if isinstance(content, list):
+                if any("cache_control" in block for block in content):
+                    breakpoint = i
+                content = " ".join(block.get("text", "") for block in content)
+            h.update(json.dumps([msg.get("role"), content]).encode("utf-8"))
+            digests.append(h.hexdigest())
+            total += _approx_tokens(content)
+            tokens.append(total)
+        if breakpoint is None:
+            return
+        read = 0
+        with self._batch_lock:
+            for i in range(breakpoint, -1, -1):
+                if digests[i] in self._prompt_cache:
+                    read = tokens[i]
+                    break
+            self._prompt_cache.add(digests[breakpoint])
+        write = tokens[breakpoint] - read
+        usage["input_tokens"] -= read + write
+        usage["cache_read_input_tokens"] = read
+        usage["cache_creation_input_tokens"] = write
+
+    def create_cached_content(self, body: dict) -> Tuple[int, dict]:
+        contents = body.get("contents", [])
+        name = "cachedContents/" + self._new_id("cache")
+        tokens = _approx_tokens(_prompt_text(GOOGLE_ROUTE, body))
+        with self._batch_lock:
+            self._cached_contents[name] = {"contents": contents, "tokens": tokens}
+        return 200, {
+            "name": name,
+            "model": body.get("model"),
+            "usageMetadata": {"totalTokenCount": tokens},
+        }
+
+    def _answer_batched(self, route: str, path: str, model: str, body: dict) -> Tuple[int, dict]:
+        with self._rng_lock:
+            failed = self._rng.random() < self.config.batch_error_rate
+        if failed:
+            return 500, {"error": {"type": "server_error", "message": "Injected batch item error"}}
+        return self._answer(route, path, model, body)
+
+    def is_batch_path(self, path: str) -> bool:
+        match = _OPENAI_BATCH_RE.match(path)
+        return bool(
+            (match and match.group(1) in _OPENAI_PREFIXES)
+            or _ANTHROPIC_BATCH_RE.match(path)
+            or _GOOGLE_BATCH_RE.match(path)
+            or path.startswith("/v1beta/batches/")
+        )
+
+    def _new_id(self, prefix: str) -> str:
+        with self._batch_lock:
+            self.num_batches += prefix not in ("file", "cache")
+            return f"{prefix}-{next(self._ids)}"
+
+    def _cancel(self, batch_id: str):
+        with self._batch_lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return 404, {"error": {"message": f"No batch {batch_id}"}}
+            batch["cancelled"] = True
+        return 200, {"id": batch_id}
+
+    def _poll(self, batch_id: str) -> Optional[dict]:
+        """The batch, marked finished once it has been polled enough."""
+        with self._batch_lock:
+            batch = self._batches.get(batch_id)
+            if batch is not None:
+                batch["polls"] += 1
+                batch["done"] = batch["polls"] >= self.config.batch_polls
+            return batch
+
+    def handle_batch(self, method: str, path: str, body: Optional[dict]):
+        """(status, JSON body or JSONL text[, headers]) of a batch API call."""
+        if method == "POST":
+            # Creating a job counts as a request: faults are injected there
+            self._sleep()
+            draw_rate_limit, draw_error = self._draw()
+            if draw_rate_limit < self.config.rate_limit_rate:
+                return 429, {
+                    "error": {"type": "rate_limit_error", "message": "Rate limit exceeded"}
+                }, {"Retry-After": str(self.config.retry_after)}
+            if draw_error < self.config.error_rate:
+                return 500, {
+                    "error": {"type": "server_error", "message": "Injected server error"}
+                }
+
+        match = _OPENAI_BATCH_RE.match(path)
+        if match and match.group(1) in _OPENAI_PREFIXES:
+            return self._openai_batch(method, *match.groups(), body)
+        match = _ANTHROPIC_BATCH_RE.match(path)
+        if match:
+            return self._anthropic_batch(method, *match.groups(), body)
+        match = _GOOGLE_BATCH_RE.match(path)
+        if match and method == "POST":
+            return self._google_batch_create(match.group(1), body)
+        if path.startswith("/v1beta/batches/") and path.endswith(":cancel") and method == "POST":
+            return self._cancel(path[len("/v1beta/"):-len(":cancel")])
+        if path.startswith("/v1beta/batches/") and method == "GET":
+            return self._google_batch_get(path[len("/v1beta/"):])
+        return 404, {"error": {"message": f"Unknown path {path}"}}
+
+    def _openai_batch(self, method, prefix, kind, object_id, content, body):
+        if kind == "batches" and content == "/cancel" and method == "POST":
+            return self._cancel(object_id)
+        if kind == "files" and method == "POST":
+            file_id = self._new_id("file")
+            with self._batch_lock:
+                self._files[file_id] = body.get("file", "")
+            return 200, {"id": file_id, "object": "file", "purpose": body.get("purpose")}
+        if kind == "files" and content:
+            text = self._files.get(object_id)
+            if text is None:
+                return 404, {"error": {"message": f"No file {object_id}"}}
+            return 200, text
+        if kind == "batches" and method == "POST":
+            lines = self._files.get(body.get("input_file_id"))
+            if lines is None:
+                return 400, {"error": {"message": "Unknown input_file_id"}}
+            output = []
+            for line in lines.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                status, response = self._answer_batched(
+                    OPENAI_ROUTE,
+                    prefix + "/chat/completions",
+                    item["body"].get("model", ""),
+                    item["body"]
+                )
+                output.append(json.dumps({
+                    "custom_id": item["custom_id"],
+                    "response": {"status_code": status, "body": response},
+                    "error": None,
+                }))
+            batch_id = self._new_id("batch")
+            with self._batch_lock:
+                self._batches[batch_id] = {"output": "\n".join(output), "polls": 0, "done": False}
+            return 200, {"id": batch_id, "object": "batch", "status": "validating"}
+        if kind == "batches" and object_id and method == "GET":
+            batch = self._poll(object_id)
+            if batch is None:
+                return 404, {"error": {"message": f"No batch {object_id}"}}
+            data = {"id": object_id, "object": "batch", "status": "in_progress"}
+            if batch["done"] and self.config.batch_failure:
+                data.update(status="failed", errors={"data": [{"message": "Injected batch failure"}]})
+            elif batch["done"]:
+                if "output_file_id" not in batch:
+                    file_id = self._new_id("file")
+                    with self._batch_lock:
+                        self._files[file_id] = batch["output"]
+                    batch["output_file_id"] = file_id
+                data.update(status="completed", output_file_id=batch["output_file_id"])
+            return 200, data
+        return 404, {"error": {"message": f"Unsupported {method} on {kind}"}}
+
+    def _anthropic_batch(self, method, batch_id, action, body):
+        if method == "POST" and action == "/cancel":
+            return self._cancel(batch_id)
+        if method == "POST" and batch_id is None:
+            output = []
+            for item in body.get("requests", []):
+                status, response = self._answer_batched(
+                    ANTHROPIC_ROUTE, "/v1/messages", item["params"].get("model", ""), item["params"]
+                )
+                if self.config.batch_failure:
+                    # Message batches do not fail as a whole: every request expires
+                    result = {"type": "expired"}
+                elif status == 200:
+                    result = {"type": "succeeded", "message": response}
+                else:
+                    result = {"type": "errored", "error": response}
+                output.append(json.dumps({"custom_id": item["custom_id"], "result": result}))
+            batch_id = self._new_id("msgbatch")
+            with self._batch_lock:
+                self._batches[batch_id] = {"output": "\n".join(output), "polls": 0, "done": False}
+            return 200, {"id": batch_id, "type": "message_batch", "processing_status": "in_progress"}
+        if method == "GET" and action == "/results":
+            batch = self._batches.get(batch_id)
+            if batch is None or not batch["done"]:
+                return 404, {"error": {"message": f"No results for {batch_id}"}}
+            return 200, batch["output"]
+        if method == "GET" and batch_id:
+            batch = self._poll(batch_id)
+            if batch is None:
+                return 404, {"error": {"message": f"No batch {batch_id}"}}
+            data = {"id": batch_id, "type": "message_batch", "processing_status": "in_progress"}
+            if batch["done"]:
+                data.update(
+                    processing_status="ended",
+                    results_url=f"{self.url}/v1/messages/batches/{batch_id}/results"
+                )
+            return 200, data
+        return 404, {"error": {"message": f"Unsupported {method} on message batches"}}
+
+    def _google_batch_create(self, model: str, body: dict):
+        path = f"/v1beta/models/{model}:generateContent"
+        responses = []
+        requests_ = body.get("batch", {}).get("input_config", {}).get("requests", {})
+        for item in requests_.get("requests", []):
+            status, response = self._answer_batched(GOOGLE_ROUTE, path, model, item["request"])
+            answer = {"metadata": item.get("metadata", {})}
+            if status == 200:
+                answer["response"] = response
+            else:
+                answer["error"] = {"code": status, "message": response["error"]["message"]}
+            responses.append(answer)
+        name = "batches/" + self._new_id("batch")
+        with self._batch_lock:
+            self._batches[name] = {"output": responses, "polls": 0, "done": False}
+        return 200, {"name": name, "metadata": {"state": "BATCH_STATE_PENDING"}}
+
+    def _google_batch_get(self, name: str):
+        batch = self._poll(name)
+        if batch is None:
+            return 404, {"error": {"message": f"No batch {name}"}}
+        if not batch["done"]:
+            return 200, {"name": name, "metadata": {"state": "BATCH_STATE_RUNNING"}, "done": False}
+        if self.config.batch_failure:
+            return 200, {
+                "name": name,
+                "metadata": {"state": "BATCH_STATE_FAILED"},
+                "done": True,
+                "error": {"code": 13, "message": "Injected batch failure"},
+            }
+        return 200, {
+            "name": name,
+            "metadata": {"state": "BATCH_STATE_SUCCEEDED"},
+            "done": True,
+            "response": {"inlinedResponses": {"inlinedResponses": batch["output"]}},
+        }
+
+    def _forward(
+        self,
+        route: str,
+        request: BaseHTTPRequestHandler,
+        body: dict
+    ) -> Tuple[int, dict]:
+        headers = {
+            name: value
+            for name, value in request.headers.items()
+            if name.lower() in _FORWARDED_HEADERS
+        }
+        path = request.path
+        if route == OPENAI_ROUTE:
+            path_prefix = path[:-len("/chat/completions")]
+            provider = _OPENAI_PREFIXES.get(path_prefix)
+            if provider is None:
+                return 404, {"error": {"message": f"Unknown prefix {path_prefix}"}}
+            path = path[len(path_prefix):]
+        else:
+            provider = Provider.CLAUDE if route == ANTHROPIC_ROUTE else Provider.GOOGLE
+        upstream = PROVIDER_BASE_URLS[provider]
+        response = requests.post(f"{upstream}{path}", headers=headers, json=body)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {"error": {"message": response.text}}
+        return response.status_code, data
+
+
+def _main() -> int:
+    p = argparse.ArgumentParser(description="Local stand-in for the provider APIs")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--mode", choices=["synthetic", "replay", "record"], default="synthetic")
+    p.add_argument("--cassette", default=None, help="JSONL file of recorded exchanges")
+    p.add_argument("--strict", action="store_true", help="404 on replay misses")
+    p.add_argument("--latency", type=float, default=0.0, help="Seconds per request")
+    p.add_argument("--latency-jitter", type=float, default=0.0)
+    p.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 500s")
+    p.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of 429s")
+    p.add_argument("--response-words", type=int, default=50)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--batch-polls", type=int, default=1, help="Status checks until a batch ends")
+    p.add_argument("--batch-error-rate", type=float, default=0.0, help="Fraction of failed batch items")
+    p.add_argument("--batch-failure", action="store_true", help="Fail every batch as a whole")
+    p.add_argument("--verbose", action="store_true")
+    args = p.parse_args()
+
+    config = StubConfig(
+        mode=args.mode,
+        cassette_path=args.cassette,
+        strict=args.strict,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        response_words=args.response_words,
+        seed=args.seed,
+        batch_polls=args.batch_polls,
+        batch_error_rate=args.batch_error_rate,
+        batch_failure=args.batch_failure,
+    )
+    server = StubServer(config, host=args.host, port=args.port, verbose=args.verbose)
+    for name, value in server.base_urls().items():
+        print(f"{name}={value}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
@@ -0,0 +1,203 @@
+"""
+Suffix automaton over a sequence of words.
+
+Built once in O(n) for a reference of n words, it finds the longest
+substring of a query that occurs anywhere in the reference (and where)
+in O(len(query)), instead of the O(len(reference) * len(query)) of the
+dynamic programming in metrics.longest_common_substring.
+
+GeneralizedSuffixAutomaton does the same over several documents at
+once, and tells which documents contain each match.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_right
+from dataclasses import dataclass
+import itertools
+from typing import Dict, List, Sequence
+
+
+@dataclass(frozen=True)
+class Match:
+    reference_start: int
+    query_start: int
+    length: int
+
+
+@dataclass(frozen=True)
+class DocumentMatch:
+    document: int
+    reference_start: int
+    query_start: int
+    length: int
+
+
+class SuffixAutomaton:
+
+    def __init__(self, words: Sequence[str]):
+        self.num_words = len(words)
+        self._ids: Dict[str, int] = {}
+        self._next: List[Dict[int, int]] = [{}]
+        self._link: List[int] = [-1]
+        self._length: List[int] = [0]
+        # first end position of the substrings of each state
+        self._first_end: List[int] = [-1]
+
+        last = 0
+        for pos, word in enumerate(words):
+            c = self._ids.setdefault(word, len(self._ids))
+            last = self._extend(last, c, pos)
+
+    def _new_state(self, length: int, link: int, first_end: int, next_: dict) -> int:
+        self._next.append(next_)
+        self._link.append(link)
+        self._length.append(length)
+        self._first_end.append(first_end)
+        return len(self._next) - 1
+
+    def _extend(self, last: int, c: int, pos: int) -> int:
+        nxt, link, length = self._next, self._link, self._length
+        cur = self._new_state(length[last] + 1, -1, pos, {})
+        p = last
+        while p != -1 and c not in nxt[p]:
+            nxt[p][c] = cur
+            p = link[p]
+        if p == -1:
+            link[cur] = 0
+            return cur
+        q = nxt[p][c]
+        if length[p] + 1 == length[q]:
+            link[cur] = q
+            return cur
+        clone = self._new_state(
+            length[p] + 1, link[q], self._first_end[q], dict(nxt[q])
+        )
+        while p != -1 and nxt[p].get(c) == q:
+            nxt[p][c] = clone
+            p = link[p]
+        link[q] = clone
+        link[cur] = clone
+        return cur
+
+    def __len__(self) -> int:
+        return len(self._next)
+
+    def longest_match(self, query: Sequence[str]) -> Match:
+        """
+        Longest run of query words found verbatim in the reference. Ties
+        go to the earliest run of the query, at its first occurrence in
+        the reference.
+        """
+        nxt, link, length = self._next, self._link, self._length
+        state, matched = 0, 0
+        best = Match(0, 0, 0)
+        for j, word in enumerate(query):
+            c = self._ids.get(word)
+            if c is None:
+                state, matched = 0, 0
+                continue
+            while state and c not in nxt[state]:
+                state = link[state]
+                matched = length[state]
+            if c in nxt[state]:
+                state = nxt[state][c]
+                matched += 1
+            if matched > best.length:
+                end = self._first_end[state]
+                best = Match(end - matched + 1, j - matched + 1, matched)
+        return best
+
+
+class GeneralizedSuffixAutomaton(SuffixAutomaton):
+    """
+    Suffix automaton of several documents, each followed by its own
+    sentinel so that no match spans two documents. Every state also
+    keeps the first end position of its substrings in each document
+    that contains them (propagated up the suffix links once built).
+    """
+
+    def __init__(self, documents: Sequence[Sequence[str]]):
+        super().__init__([])
+        self.num_documents = len(documents)
+        self.document_lengths = [len(words) for words in documents]
+        self._starts: List[int] = []
+        origins: Dict[int, int] = {}
+        last, pos = 0, 0
+        for k, words in enumerate(documents):
+            self._starts.append(pos)
+            for word in words:
+                c = self._ids.setdefault(word, len(self._ids))
+                last = self._extend(last, c, pos)
+                origins[last] = pos
+                pos += 1
+            # Word ids are >= 0: the sentinels never match a query word
+            last = self._extend(last, -(k + 1), pos)
+            pos += 1
+        self.num_words = pos
+
+        self._document_ends: List[Dict[int, int]] = [{} for _ in self._next]
+        for state, end in origins.items():
+            document = bisect_right(self._starts, end) - 1
+            self._document_ends[state][document] = end - self._starts[document]
+        for state in sorted(range(1, len(self._next)), key=self._length.__getitem__, reverse=True):
+            parent = self._link[state]
+            if parent <= 0:
+                continue
+            ends = self._document_ends[parent]
+            for document, end in self._document_ends[state].items():
+                if end < ends.get(document, end + 1):
+                    ends[document] = end
+
+        # Nearest suffix-link ancestor contained in more documents. Along
+        # the links the document sets only grow, so equal sizes mean
+        # equal sets.
+        self._grow: List[int] = [0] * len(self._next)
+        for state in sorted(range(1, len(self._next)), key=self._length.__getitem__):
+            parent = self._link[state]
+            if parent <= 0:
+                continue
+            if len(self._document_ends[parent]) > len(self._document_ends[state]):
+                self._grow[state] = parent
+            else:
+                self._grow[state] = self._grow[parent]
+
+    def maximal_matches(self, query: Sequence[str], min_length: int = 1) -> List[DocumentMatch]:
+        """
+        For every document, the runs of query words found verbatim in it
+        that cannot be extended to the right within that document, of at
+        least min_length words, at their first occurrence there. Sorted
+        by query end. One pass over the query; each step visits only the
+        suffix-link ancestors where the set of documents grows.
+        """
+        nxt, link, length = self._next, self._link, self._length
+        ends, grow = self._document_ends, self._grow
+        matches: List[DocumentMatch] = []
+        state, matched = 0, 0
+        # document -> (length, end in the document) of the run ending here
+        previous: Dict[int, tuple] = {}
+        # A final None closes the runs still open
+        for j, word in enumerate(itertools.chain(query, [None])):
+            current: Dict[int, tuple] = {}
+            c = None if word is None else self._ids.get(word)
+            if c is None:
+                state, matched = 0, 0
+            else:
+                while state and c not in nxt[state]:
+                    state = link[state]
+                    matched = length[state]
+                if c in nxt[state]:
+                    state = nxt[state][c]
+                    matched += 1
+                s, run = state, matched
+                while s > 0 and run >= min_length:
+                    for document, end in ends[s].items():
+                        if document not in current:
+                            current[document] = (run, end)
+                    s = grow[s]
+                    run = length[s]
+            for document, (run, end) in previous.items():
+                if current.get(document, (0,))[0] != run + 1:
+                    matches.append(DocumentMatch(document, end - run + 1, j - run, run))
+            previous = current
+        return matches
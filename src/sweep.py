@@ -0,0 +1,220 @@
+"""
+Generation-config sweeps.
+
+Runs one extraction per configuration of a grid (temperature, maximum
+response length, frequency/presence penalties) for a model and a
+document, concurrently. All the runs share a response cache and the
+tokenized reference, and the nv-recall of each configuration is
+reported in a single table.
+
+Usage:
+    python3 src/sweep.py --model gemini_2_5_pro --reference data/q1.txt \
+        --temperatures 0 0.5 1 --max_output_tokens 500 1000 \
+        --output sweep.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import itertools
+import json
+import os
+from typing import Iterable, List, Optional, Sequence
+
+from config import DEFAULT_TEMPERATURE, Model
+from extraction import Extractor
+from llm_chat import GenerationConfig, Usage
+from long_form_metrics import ReferenceIndex
+from response_cache import ResponseCache
+
+
+@dataclass
+class SweepResult:
+    generation: GenerationConfig
+    log_path: str
+    phase1_similarity: float = 0.0
+    phase1_successful: bool = False
+    nv_recall: Optional[float] = None
+    usage: Usage = field(default_factory=Usage)
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            **self.generation.to_dict(),
+            "log_path": self.log_path,
+            "phase1_similarity": self.phase1_similarity,
+            "phase1_successful": self.phase1_successful,
+            "nv_recall": self.nv_recall,
+            "usage": self.usage.to_dict(),
+            "error": self.error,
+        }
+
+
+def generation_grid(
+    temperatures: Sequence[float] = (DEFAULT_TEMPERATURE,),
+    max_output_tokens: Sequence[Optional[int]] = (None,),
+    frequency_penalties: Sequence[Optional[float]] = (None,),
+    presence_penalties: Sequence[Optional[float]] = (None,)
+) -> List[GenerationConfig]:
+    """
+    Cartesian product of the given parameter values. A max_output_tokens
+    of None is the model's maximum.
+    """
+    return [
+        GenerationConfig(
+            temperature=temperature,
+            max_output_tokens=max_tokens,
+            frequency_penalty=frequency_penalty,
+            presence_penalty=presence_penalty
+        )
+        for temperature, max_tokens, frequency_penalty, presence_penalty
+        in itertools.product(
+            temperatures,
+            max_output_tokens,
+            frequency_penalties,
+            presence_penalties
+        )
+    ]
+
+
+def _label(generation: GenerationConfig) -> str:
+    return "_".join(
+        f"{name}{value}" for name, value in (
+            ("t", generation.temperature),
+            ("len", generation.max_output_tokens),
+            ("fp", generation.frequency_penalty),
+            ("pp", generation.presence_penalty),
+        )
+        if value is not None
+    )
+
+
+def run_sweep(
+    model: Model,
+    reference_text: str,
+    grid: Iterable[GenerationConfig],
+    workers: Optional[int] = None,
+    best_of_n: bool = False,
+    max_iterations: Optional[int] = None,
+    cache: Optional[ResponseCache] = None,
+    log_dir: str = ".",
+    verbose: bool = False,
+    batch_size: Optional[int] = None,
+    early_abort_level: Optional[float] = None,
+    gap_filling: bool = False,
+    pipeline: bool = False
+) -> List[SweepResult]:
+    """
+    Extract the reference once per configuration, in parallel.
+    A configuration that fails is reported with its error instead of
+    aborting the sweep.
+    """
+    grid = list(grid)
+    cache = cache if cache is not None else ResponseCache()
+    reference_index = ReferenceIndex(reference_text)
+    os.makedirs(log_dir, exist_ok=True)
+
+    def run(generation: GenerationConfig) -> SweepResult:
+        result = SweepResult(
+            generation=generation,
+            log_path=os.path.join(
+                log_dir,
+                f"sweep_{model.value}_{_label(generation)}.json"
+            )
+        )
+        extractor = Extractor(
+            model,
+            reference_text,
+            max_iterations=max_iterations,
+            verbose=verbose,
+            log_path=result.log_path,
+            best_of_n=best_of_n,
+            generation=generation,
+            cache=cache,
+            reference_index=reference_index,
+            batch_size=batch_size,
+            early_abort_level=early_abort_level,
+            gap_filling=gap_filling,
+            pipeline=pipeline
+        )
+        try:
+            extractor.extract()
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+            return result
+        result.phase1_similarity = extractor.phase1_similarity
+        result.phase1_successful = extractor.phase1_successful
+        result.nv_recall = extractor.nv_recall_metrics.get("nv_recall")
+        result.usage = extractor.usage
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers or len(grid) or 1) as pool:
+        return list(pool.map(run, grid))
+
+
+def _main() -> int:
+    p = argparse.ArgumentParser(description="Sweep generation configurations.")
+    p.add_argument("--model", required=True, help="Model enum name, e.g. gemini_2_5_pro")
+    p.add_argument("--reference", required=True, help="Path to the reference text")
+    p.add_argument("--temperatures", type=float, nargs="+", default=[DEFAULT_TEMPERATURE])
+    p.add_argument("--max_output_tokens", type=int, nargs="+", default=[None],
+                   help="Default: the model's maximum")
+    p.add_argument("--frequency_penalties", type=float, nargs="+", default=[None])
+    p.add_argument("--presence_penalties", type=float, nargs="+", default=[None])
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--max_iterations", type=int, default=None)
+    p.add_argument("--best_of_n", action="store_true")
+    p.add_argument("--batch_size", type=int, default=None,
+                   help="Send BoN attempts as provider batch jobs of this size")
+    p.add_argument("--early_abort_level", type=float, default=None,
+                   help="Stop BoN once its estimated chance of success is below this")
+    p.add_argument("--gap_filling", action="store_true",
+                   help="Restart phase 2 on the first uncovered part of the reference")
+    p.add_argument("--pipeline", action="store_true",
+                   help="Overlap requests with scoring (BoN may send one extra attempt)")
+    p.add_argument("--cache", type=str, default=None, help="JSONL response cache")
+    p.add_argument("--log_dir", type=str, default=".")
+    p.add_argument("--output", type=str, default=None, help="JSONL results table")
+    args = p.parse_args()
+
+    with open(args.reference, "r", encoding="utf-8") as f:
+        reference_text = f.read()
+
+    cache = ResponseCache(args.cache)
+    results = run_sweep(
+        Model[args.model.upper()],
+        reference_text,
+        generation_grid(
+            args.temperatures,
+            args.max_output_tokens,
+            args.frequency_penalties,
+            args.presence_penalties
+        ),
+        workers=args.workers,
+        best_of_n=args.best_of_n,
+        max_iterations=args.max_iterations,
+        cache=cache,
+        log_dir=args.log_dir,
+        batch_size=args.batch_size,
+        early_abort_level=args.early_abort_level,
+        gap_filling=args.gap_filling,
+        pipeline=args.pipeline
+    )
+
+    for result in results:
+        recall = "-" if result.nv_recall is None else f"{result.nv_recall:.6f}"
+        status = result.error or f"nv_recall={recall}"
+        print(f"{_label(result.generation)}: {status}")
+    print(f"cache hits={cache.hits} misses={cache.misses}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result.to_dict()) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
@@ -0,0 +1,240 @@
+"""
+Synthetic "memorizing model" provider.
+
+Continues a prompt by locating its last words in a reference text and
+emitting the true continuation, with tunable noise:
+- insertion / deletion / substitution rates (per word)
+- drift rate (per response, jump to a random position of the reference)
+- refusal rate (per response, refuse and stay in place)
+- loop rate (per response, repeat the previous chunk)
+Once the reference is exhausted it answers END_TEXT, like a real model
+that has reached the end of the work.
+
+The model is stateless like a real API: every response is a
+deterministic function of the first prompt and the turn number. The
+state of each chain is cached, so a chat of n turns costs O(n) overall.
+Runs fully in-process, so whole extraction campaigns can be benchmarked
+offline at CPU speed.
+
+Usage:
+    import synthetic
+    synthetic.configure(reference_text, substitution_rate=0.01)
+    extractor = Extractor(Model.SYNTHETIC_MEMORIZER, reference_text)
+    extractor.extract()
+    synthetic.ground_truth_recall([extractor.chat.prompts])
+
+SYNTHETIC_REFERENCE_PATH can be used instead of configure() to load the
+reference from a file.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import os
+import random
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from config import MAXIMUM_OUTPUT_TOKENS
+from long_form_metrics import text_to_words
+from utils import num_tokens_to_num_words
+
+
+REFUSAL_TEXT = "I'm sorry, but I can't reproduce copyrighted text verbatim."
+END_TEXT = "THE END"
+
+MAX_CACHED_CHAINS = 4096
+
+
+@dataclass
+class SyntheticConfig:
+    reference_text: str = ""
+    insertion_rate: float = 0.0
+    deletion_rate: float = 0.0
+    substitution_rate: float = 0.0
+    drift_rate: float = 0.0
+    refusal_rate: float = 0.0
+    loop_rate: float = 0.0
+    words_per_response: int = num_tokens_to_num_words(MAXIMUM_OUTPUT_TOKENS)
+    anchor_words: int = 8
+    seed: int = 0
+
+
+@dataclass
+class _Turn:
+    position: int
+    refused: bool = False
+
+
+@dataclass
+class _Chain:
+    """State of a chain after `num_turns` turns."""
+    num_turns: int
+    position: int
+    previous: int
+    rng: random.Random
+    last: Optional[_Turn] = None
+
+
+class SyntheticMemorizer:
+
+    def __init__(self, config: SyntheticConfig):
+        self.config = config
+        self.words = text_to_words(config.reference_text)
+        self._lower_words = [w.lower() for w in self.words]
+        self._anchor_index: Dict[Tuple[str, ...], int] = {}
+        n = config.anchor_words
+        for pos in range(len(self._lower_words) - n + 1):
+            key = tuple(self._lower_words[pos:pos + n])
+            self._anchor_index.setdefault(key, pos)
+        # first-prompt digest -> chain state, bounded LRU
+        self._chains: "OrderedDict[str, _Chain]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def locate(self, prompt: str) -> Optional[int]:
+        """Reference position right after the last words of the prompt."""
+        n = self.config.anchor_words
+        prompt_words = [w.lower() for w in text_to_words(prompt)]
+        if len(prompt_words) < n:
+            return None
+        pos = self._anchor_index.get(tuple(prompt_words[-n:]))
+        if pos is None:
+            return None
+        return pos + n
+
+    def _step(self, chain: _Chain):
+        config = self.config
+        rng = chain.rng
+        chain.num_turns += 1
+        if rng.random() < config.refusal_rate:
+            chain.last = _Turn(chain.position, refused=True)
+            return
+        if chain.num_turns > 1 and rng.random() < config.loop_rate:
+            chain.last = _Turn(chain.previous)
+            return
+        if rng.random() < config.drift_rate and self.words:
+            chain.position = rng.randrange(len(self.words))
+        chain.last = _Turn(chain.position)
+        chain.previous = chain.position
+        chain.position = min(
+            chain.position + config.words_per_response,
+            len(self.words)
+        )
+
+    def _turn(self, digest: str, start: int, turn: int) -> _Turn:
+        """State of turn `turn` (1-based) of the chain started at `start`."""
+        with self._lock:
+            chain = self._chains.get(digest)
+            if chain is None or chain.num_turns > turn:
+                chain = _Chain(
+                    num_turns=0,
+                    position=start,
+                    previous=start,
+                    rng=random.Random(f"{self.config.seed}:{digest}")
+                )
+            while chain.num_turns < turn:
+                self._step(chain)
+            self._chains[digest] = chain
+            self._chains.move_to_end(digest)
+            while len(self._chains) > MAX_CACHED_CHAINS:
+                self._chains.popitem(last=False)
+            return chain.last
+
+    def _render(
+        self,
+        position: int,
+        rng: random.Random
+    ) -> Tuple[str, Set[int]]:
+        config = self.config
+        out: List[str] = []
+        faithful: Set[int] = set()
+        end = min(position + config.words_per_response, len(self.words))
+        for pos in range(position, end):
+            if rng.random() < config.deletion_rate:
+                continue
+            if rng.random() < config.substitution_rate:
+                out.append(rng.choice(self.words))
+            else:
+                out.append(self.words[pos])
+                faithful.add(pos)
+            if rng.random() < config.insertion_rate:
+                out.append(rng.choice(self.words))
+        return " ".join(out), faithful
+
+    def _respond(self, user_prompts: Sequence[str]) -> Tuple[str, Set[int]]:
+        if not user_prompts:
+            return REFUSAL_TEXT, set()
+        start = self.locate(user_prompts[0])
+        if start is None:
+            return REFUSAL_TEXT, set()
+
+        digest = hashlib.sha256(user_prompts[0].encode("utf-8")).hexdigest()
+        turn = self._turn(digest, start, len(user_prompts))
+        if turn.refused:
+            return REFUSAL_TEXT, set()
+        if turn.position >= len(self.words):
+            return END_TEXT, set()
+
+        rng = random.Random(f"{self.config.seed}:{digest}:{len(user_prompts)}")
+        return self._render(turn.position, rng)
+
+    def complete(self, messages: list) -> str:
+        user_prompts = [m["content"] for m in messages if m["role"] == "user"]
+        text, _ = self._respond(user_prompts)
+        return text
+
+    def ground_truth_recall(self, chats: Iterable[Sequence[str]]) -> float:
+        """
+        Fraction of reference words reproduced faithfully by the given
+        chats (each one the list of user prompts it sent, e.g.
+        LLMChat.prompts).
+
+        This counts emitted word positions, it is not nv-recall: the
+        long-form metric also merges, filters and drops blocks shorter
+        than its minimum lengths. Both agree on noise-free chains; with
+        noise nv-recall can be lower (short faithful runs are dropped)
+        or higher (isolated errors are merged over).
+        """
+        if not self.words:
+            return 0.0
+        covered: Set[int] = set()
+        for prompts in chats:
+            for turn in range(1, len(prompts) + 1):
+                _, faithful = self._respond(prompts[:turn])
+                covered |= faithful
+        return len(covered) / len(self.words)
+
+
+_memorizer: Optional[SyntheticMemorizer] = None
+_memorizer_lock = threading.Lock()
+
+
+def configure(reference_text: str, **kwargs) -> SyntheticMemorizer:
+    """Set the reference text and noise of the synthetic model."""
+    global _memorizer
+    with _memorizer_lock:
+        _memorizer = SyntheticMemorizer(
+            SyntheticConfig(reference_text=reference_text, **kwargs)
+        )
+        return _memorizer
+
+
+def get_memorizer() -> SyntheticMemorizer:
+    global _memorizer
+    with _memorizer_lock:
+        if _memorizer is None:
+            reference_text = ""
+            reference_path = os.getenv("SYNTHETIC_REFERENCE_PATH")
+            if reference_path:
+                with open(reference_path, "r", encoding="utf-8") as f:
+                    reference_text = f.read()
+            _memorizer = SyntheticMemorizer(
+                SyntheticConfig(reference_text=reference_text)
+            )
+        return _memorizer
+
+
+def ground_truth_recall(chats: Iterable[Sequence[str]]) -> float:
+    return get_memorizer().ground_truth_recall(chats)
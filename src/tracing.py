@@ -0,0 +1,188 @@
+"""
+Lightweight tracing of the extraction hot paths.
+
+Spans record wall time plus arbitrary attributes (bytes sent/received,
+token counts, ...) and are written as one JSON object per line and/or
+as a Chrome trace-event file (open it in chrome://tracing or Perfetto).
+
+Tracing is disabled by default. span() then returns a shared no-op
+object and traced() calls the wrapped function directly, so the cost
+is a global flag check per call.
+
+Enable it with:
+    tracing.enable(jsonl_path="trace.jsonl", chrome_path="trace.json")
+or by setting MEMORIZATION_TRACE=<prefix>, which writes <prefix>.jsonl
+and <prefix>.trace.json. Chrome traces are written on disable() or at
+exit.
+"""
+
+from __future__ import annotations
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+
+class _NoopSpan:
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+
+    def __init__(
+        self,
+        jsonl_path: Optional[str] = None,
+        chrome_path: Optional[str] = None
+    ):
+        self.jsonl_path = jsonl_path
+        self.chrome_path = chrome_path
+        self.events: List[dict] = []
+        self._lock = threading.Lock()
+        self._origin_ns = time.perf_counter_ns()
+        self._jsonl = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+
+    def record(self, name: str, start_ns: int, end_ns: int, attrs: dict):
+        ts_us = (start_ns - self._origin_ns) / 1000
+        dur_us = (end_ns - start_ns) / 1000
+        tid = threading.get_ident()
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.write(json.dumps({
+                    "name": name,
+                    "start_us": ts_us,
+                    "duration_us": dur_us,
+                    "thread": tid,
+                    **attrs,
+                }) + "\n")
+            if self.chrome_path is not None:
+                self.events.append({
+                    "name": name,
+                    "ph": "X",
+                    "ts": ts_us,
+                    "dur": dur_us,
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": attrs,
+                })
+
+    def close(self):
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+            if self.chrome_path is not None:
+                with open(self.chrome_path, "w", encoding="utf-8") as f:
+                    json.dump({"traceEvents": self.events}, f)
+
+
+class Span:
+
+    __slots__ = ("tracer", "name", "attrs", "_start_ns")
+
+    def __init__(self, tracer: Tracer, name: str, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        _stack().append(self)
+        self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.perf_counter_ns()
+        _stack().pop()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.name, self._start_ns, end_ns, self.attrs)
+        return False
+
+
+_tracer: Optional[Tracer] = None
+_local = threading.local()
+
+
+def _stack() -> List[Span]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def enable(
+    jsonl_path: Optional[str] = None,
+    chrome_path: Optional[str] = None
+) -> Tracer:
+    global _tracer
+    disable()
+    _tracer = Tracer(jsonl_path, chrome_path)
+    return _tracer
+
+
+def disable():
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+
+
+def span(name: str, **attrs):
+    """Context manager timing a block, `with span("x") as s: s.set(k=v)`."""
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP_SPAN
+    return Span(tracer, name, attrs)
+
+
+def annotate(**attrs):
+    """Set attributes on the innermost open span of the current thread."""
+    if _tracer is None:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].set(**attrs)
+
+
+def traced(name: str) -> Callable:
+    """Decorator wrapping every call of a function in a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            with Span(tracer, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+atexit.register(disable)
+
+_env_prefix = os.getenv("MEMORIZATION_TRACE")
+if _env_prefix:
+    enable(f"{_env_prefix}.jsonl", f"{_env_prefix}.trace.json")
@@ -1,4 +1,5 @@
 
+from functools import lru_cache
 from typing import List
 import re
 
@@ -28,7 +29,12 @@ def get_first_tokens_from_text(
     return " ".join(text_words)
 
 
+@lru_cache(maxsize=4096)
 def text_to_num_tokens(text: str) -> int:
+    """
+    Local token estimate, used to budget before any call is made and
+    when a provider does not report usage.
+    """
     words = text.strip().split()
     return int(len(words) * TOKENS_PER_WORD)
 
@@ -0,0 +1,454 @@
+"""
+Work queue shared by several extraction workers.
+
+Jobs, e.g. one (model, document, generation config) extraction each,
+live in an SQLite file that every worker opens, on one host or on a
+shared filesystem with working POSIX byte-range locks (e.g. NFSv4 or
+NFSv3 with lockd; not SMB with oplocks or filesystems without locking).
+The default rollback journal is used since SQLite's WAL mode needs
+shared memory, i.e. all workers on one host: pass single_host=True
+only in that case. A worker leases a job for
+`lease_seconds` and keeps the lease alive with heartbeats while it
+runs. If the worker dies, the lease expires and another worker picks
+the job up again, up to `max_attempts` times.
+
+Every lease carries a random token. Completing or failing a job only
+succeeds with the current token, so a worker whose lease was taken
+over cannot overwrite the new owner's result, and repeating a
+completion is a no-op. run_extraction_job also checks the lease right
+before recording its run in the result store, so a job taken over is
+not recorded twice. Enqueueing is idempotent too: a job key
+(derived from the payload by default) is only inserted once.
+
+Usage:
+    python3 src/work_queue.py enqueue queue.db --models gemini_2_5_pro gpt_4o \
+        --documents data/q1.txt data/q17.txt --temperatures 0 0.7
+    python3 src/work_queue.py work queue.db --store results.db   # on every host
+    python3 src/work_queue.py status queue.db
+"""
+
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from config import Model
+from llm_chat import GenerationConfig
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    token TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, lease_expires);
+"""
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class LeaseLost(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Lease:
+    job_id: int
+    token: str
+    payload: dict
+    attempt: int
+
+
+def job_key(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class WorkQueue:
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        single_host: bool = False
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Autocommit; transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        # WAL only works when every connection is on the same host
+        self.conn.execute(f"PRAGMA journal_mode = {'WAL' if single_host else 'DELETE'}")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> "WorkQueue":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _transaction(self, func: Callable):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func()
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, payload: dict, key: Optional[str] = None) -> int:
+        """Add a job, or return the existing one with the same key."""
+        key = key or job_key(payload)
+        now = time.time()
+
+        def insert():
+            self.conn.execute(
+                """
+                INSERT OR IGNORE INTO jobs (key, payload, created_at, updated_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (key, json.dumps(payload), now, now)
+            )
+            return self.conn.execute("SELECT id FROM jobs WHERE key = ?", (key,)).fetchone()[0]
+
+        return self._transaction(insert)
+
+    def lease(self, owner: str) -> Optional[Lease]:
+        """Take the oldest pending job (or one whose lease expired)."""
+        now = time.time()
+
+        def take():
+            # Expired leases that used their last attempt are failed
+            self.conn.execute(
+                """
+                UPDATE jobs SET status = ?, error = 'lease expired', updated_at = ?
+                WHERE status = ? AND lease_expires < ? AND attempts >= ?
+                """,
+                (FAILED, now, LEASED, now, self.max_attempts)
+            )
+            row = self.conn.execute(
+                """
+                SELECT id, payload, attempts FROM jobs
+                WHERE status = ? OR (status = ? AND lease_expires < ?)
+                ORDER BY id LIMIT 1
+                """,
+                (PENDING, LEASED, now)
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, payload, attempts = row
+            token = uuid.uuid4().hex
+            self.conn.execute(
+                """
+                UPDATE jobs SET status = ?, attempts = ?, owner = ?, token = ?,
+                    lease_expires = ?, updated_at = ?
+                WHERE id = ?
+                """,
+                (LEASED, attempts + 1, owner, token, now + self.lease_seconds, now, job_id)
+            )
+            return Lease(job_id, token, json.loads(payload), attempts + 1)
+
+        return self._transaction(take)
+
+    def heartbeat(self, lease: Lease) -> bool:
+        """Extend a lease; False if it was lost to another worker."""
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                """
+                UPDATE jobs SET lease_expires = ?, updated_at = ?
+                WHERE id = ? AND token = ? AND status = ?
+                """,
+                (now + self.lease_seconds, now, lease.job_id, lease.token, LEASED)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, lease: Lease, result: Optional[dict] = None) -> bool:
+        """
+        Mark a job done. Repeating it with the same lease is a no-op;
+        a stale lease is rejected.
+        """
+        now = time.time()
+
+        def finish():
+            status, token = self.conn.execute(
+                "SELECT status, token FROM jobs WHERE id = ?", (lease.job_id,)
+            ).fetchone()
+            if token != lease.token:
+                return False
+            if status == DONE:
+                return True
+            self.conn.execute(
+                """
+                UPDATE jobs SET status = ?, result = ?, lease_expires = NULL, updated_at = ?
+                WHERE id = ?
+                """,
+                (DONE, json.dumps(result), now, lease.job_id)
+            )
+            return True
+
+        return self._transaction(finish)
+
+    def fail(self, lease: Lease, error: str) -> bool:
+        """Release a job after an error; retried until max_attempts."""
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                """
+                UPDATE jobs SET
+                    status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                    error = ?, lease_expires = NULL, updated_at = ?
+                WHERE id = ? AND token = ? AND status = ?
+                """,
+                (self.max_attempts, FAILED, PENDING, error, now, lease.job_id, lease.token, LEASED)
+            )
+            return cursor.rowcount == 1
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def jobs(self, status: Optional[str] = None) -> List[dict]:
+        query = "SELECT id, payload, status, attempts, owner, result, error FROM jobs"
+        params = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._lock:
+            rows = self.conn.execute(query + " ORDER BY id", params).fetchall()
+        return [
+            {
+                "id": job_id,
+                "payload": json.loads(payload),
+                "status": job_status,
+                "attempts": attempts,
+                "owner": owner,
+                "result": json.loads(result) if result else None,
+                "error": error,
+            }
+            for job_id, payload, job_status, attempts, owner, result, error in rows
+        ]
+
+
+class _Heartbeat:
+    """Renews a lease in the background while a job runs."""
+
+    def __init__(self, queue: WorkQueue, lease: Lease, interval: float):
+        self.queue = queue
+        self.lease = lease
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.queue.heartbeat(self.lease):
+                self.lost = True
+                return
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def extraction_job(
+    model: Model,
+    document: str,
+    generation: Optional[GenerationConfig] = None,
+    best_of_n: bool = False,
+    max_iterations: Optional[int] = None
+) -> dict:
+    """Payload of a (model, document, config) extraction job."""
+    return {
+        "model": model.value,
+        "document": document,
+        "generation": (generation or GenerationConfig()).to_dict(),
+        "best_of_n": best_of_n,
+        "max_iterations": max_iterations,
+    }
+
+
+class _LeasedStore:
+    """Result store that only records runs while the lease is still held."""
+
+    def __init__(self, store, queue: WorkQueue, lease: Lease):
+        self.store = store
+        self.queue = queue
+        self.lease = lease
+
+    def add_run(self, data: dict, source: Optional[str] = None) -> int:
+        if not self.queue.heartbeat(self.lease):
+            raise LeaseLost(f"Lease of job {self.lease.job_id} was taken over")
+        return self.store.add_run(data, source=source)
+
+
+def run_extraction_job(
+    payload: dict,
+    lease: Lease,
+    store_path: str,
+    log_dir: str,
+    queue: Optional[WorkQueue] = None,
+    single_host: bool = False
+) -> dict:
+    """
+    Run an extraction job. With the queue, the run is only recorded if
+    the lease is still held (LeaseLost otherwise).
+    """
+    # Imported here so the queue itself does not pull in the extraction stack
+    from extraction import Extractor
+    from result_store import ResultStore
+
+    with open(payload["document"], "r", encoding="utf-8") as f:
+        reference_text = f.read()
+    with ResultStore(store_path, single_host=single_host) as results:
+        store = results if queue is None else _LeasedStore(results, queue, lease)
+        extractor = Extractor(
+            Model(payload["model"]),
+            reference_text,
+            max_iterations=payload.get("max_iterations"),
+            # One log (and store source) per job, so a retry replaces it
+            log_path=os.path.join(log_dir, f"job_{lease.job_id}.json"),
+            best_of_n=payload.get("best_of_n", False),
+            generation=GenerationConfig(**payload["generation"]),
+            document=payload["document"],
+            store=store
+        )
+        extractor.extract()
+    return {
+        "phase1_successful": extractor.phase1_successful,
+        "nv_recall": getattr(extractor, "nv_recall_metrics", {}).get("nv_recall"),
+    }
+
+
+def run_worker(
+    queue: WorkQueue,
+    handler: Callable[[dict, Lease], dict],
+    owner: Optional[str] = None,
+    heartbeat_interval: Optional[float] = None,
+    max_jobs: Optional[int] = None
+) -> int:
+    """Lease and run jobs until the queue is drained. Returns jobs done."""
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    interval = heartbeat_interval or queue.lease_seconds / 3
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        lease = queue.lease(owner)
+        if lease is None:
+            break
+        with _Heartbeat(queue, lease, interval) as heartbeat:
+            try:
+                result = handler(lease.payload, lease)
+            except LeaseLost:
+                print(f"Lost the lease of job {lease.job_id}, dropping its result.")
+                continue
+            except Exception as e:
+                queue.fail(lease, f"{type(e).__name__}: {e}")
+                continue
+        if heartbeat.lost:
+            print(f"Lost the lease of job {lease.job_id}, dropping its result.")
+            continue
+        if queue.complete(lease, result):
+            done += 1
+    return done
+
+
+def _main() -> int:
+    # Deferred so that `enqueue`/`status` do not need the sweep stack
+    from sweep import generation_grid
+
+    p = argparse.ArgumentParser(description="Shared extraction work queue.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    p_enqueue = sub.add_parser("enqueue", help="Add (model, document, config) jobs")
+    p_enqueue.add_argument("db")
+    p_enqueue.add_argument("--models", nargs="+", required=True, help="Model enum names")
+    p_enqueue.add_argument("--documents", nargs="+", required=True)
+    p_enqueue.add_argument("--temperatures", type=float, nargs="+", default=[0])
+    p_enqueue.add_argument("--max_output_tokens", type=int, nargs="+", default=[None])
+    p_enqueue.add_argument("--best_of_n", action="store_true")
+    p_enqueue.add_argument("--max_iterations", type=int, default=None)
+
+    p_work = sub.add_parser("work", help="Run jobs until the queue is drained")
+    p_work.add_argument("db")
+    p_work.add_argument("--store", required=True, help="Result store (SQLite)")
+    p_work.add_argument("--log_dir", default=".")
+    p_work.add_argument("--lease_seconds", type=float, default=DEFAULT_LEASE_SECONDS)
+    p_work.add_argument("--single_host", action="store_true",
+                        help="All workers on this host: use SQLite's WAL mode")
+
+    p_status = sub.add_parser("status", help="Job counts per status")
+    p_status.add_argument("db")
+    args = p.parse_args()
+
+    if args.command == "enqueue":
+        with WorkQueue(args.db) as queue:
+            grid = generation_grid(args.temperatures, args.max_output_tokens)
+            ids = {
+                queue.enqueue(extraction_job(
+                    Model[model.upper()], document, generation,
+                    args.best_of_n, args.max_iterations
+                ))
+                for model in args.models
+                for document in args.documents
+                for generation in grid
+            }
+            print(f"{len(ids)} jobs in {args.db}")
+    elif args.command == "work":
+        os.makedirs(args.log_dir, exist_ok=True)
+        with WorkQueue(
+            args.db, lease_seconds=args.lease_seconds, single_host=args.single_host
+        ) as queue:
+            done = run_worker(
+                queue,
+                lambda payload, lease: run_extraction_job(
+                    payload, lease, args.store, args.log_dir, queue, args.single_host
+                )
+            )
+            print(f"Completed {done} jobs.")
+    else:
+        with WorkQueue(args.db) as queue:
+            print(json.dumps(queue.counts()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
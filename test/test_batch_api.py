@@ -0,0 +1,123 @@
+import pathlib
+
+import pytest
+
+import batch_api
+from batch_api import batch_completions
+from config import MAX_BEST_OF_N, Model
+from extraction import Extractor
+from llm_chat import get_completion
+from response_cache import ResponseCache
+from stub_server import StubConfig, StubServer
+
+
+BOOK_TEXT = pathlib.Path("data/frankenstein_very_short.txt").read_text(encoding="utf-8")
+CONVERSATIONS = [
+    [{"role": "user", "content": f"Continue the following text, take {i}."}]
+    for i in range(3)
+]
+MODELS = [
+    Model.GPT_4O,
+    Model.KIMI_K2_5,
+    Model.CLAUDE_SONNET_4_5,
+    Model.GEMINI_2_5_FLASH,
+]
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(batch_api, "DEFAULT_POLL_INTERVAL", 0.0)
+
+
+def _point_at(server, monkeypatch):
+    for name, value in server.base_urls().items():
+        monkeypatch.setenv(name, value)
+
+
+@pytest.mark.parametrize("model", MODELS)
+def test_batch_answers_match_synchronous_requests(monkeypatch, model):
+    with StubServer(StubConfig(response_words=12, batch_polls=3)) as server:
+        _point_at(server, monkeypatch)
+        completions = batch_completions(model, CONVERSATIONS)
+        assert server.num_batches == 1
+        # The stub keys its text on the request body, so equal answers
+        # mean the batched bodies are those of the synchronous path.
+        expected = [get_completion(model, messages) for messages in CONVERSATIONS]
+    assert [c.text for c in completions] == [c.text for c in expected]
+    assert [c.usage for c in completions] == [c.usage for c in expected]
+
+
+def test_cached_requests_are_not_batched(monkeypatch):
+    cache = ResponseCache()
+    with StubServer(StubConfig(response_words=12)) as server:
+        _point_at(server, monkeypatch)
+        first = batch_completions(Model.CLAUDE_SONNET_4_5, CONVERSATIONS[:2], cache=cache)
+        assert server.num_batches == 1
+        again = batch_completions(Model.CLAUDE_SONNET_4_5, CONVERSATIONS, cache=cache)
+        assert server.num_batches == 2
+    assert again[:2] == first
+    assert cache.hits == 2
+
+
+def test_failed_batch_items_are_retried_synchronously(monkeypatch):
+    with StubServer(StubConfig(response_words=12, batch_error_rate=1.0)) as server:
+        _point_at(server, monkeypatch)
+        completions = batch_completions(Model.GEMINI_2_5_FLASH, CONVERSATIONS)
+        # One job creation, then one synchronous request per item
+        assert server.num_requests == 1 + len(CONVERSATIONS)
+    assert all(len(c.text.split()) == 12 for c in completions)
+
+
+
+@pytest.mark.parametrize("model", [Model.GPT_4O, Model.CLAUDE_SONNET_4_5, Model.GEMINI_2_5_FLASH])
+def test_failed_batch_falls_back_to_synchronous_requests(monkeypatch, model):
+    with StubServer(StubConfig(response_words=12, batch_failure=True)) as server:
+        _point_at(server, monkeypatch)
+        completions = batch_completions(model, CONVERSATIONS)
+        expected = [get_completion(model, messages) for messages in CONVERSATIONS]
+    assert [c.text for c in completions] == [c.text for c in expected]
+
+
+def test_batch_timeout_cancels_the_job_and_falls_back(monkeypatch):
+    with StubServer(StubConfig(response_words=12, batch_polls=1000)) as server:
+        _point_at(server, monkeypatch)
+        completions = batch_completions(Model.GPT_4O, CONVERSATIONS, timeout=0.0)
+        batch, = (b for b in server._batches.values())
+        assert batch["cancelled"]
+        assert not batch["done"]
+    assert all(len(c.text.split()) == 12 for c in completions)
+
+def test_models_without_batch_api_fall_back(monkeypatch):
+    with StubServer(StubConfig(response_words=12)) as server:
+        _point_at(server, monkeypatch)
+        completions = batch_completions(Model.DEEPSEEK_CHAT, CONVERSATIONS)
+        assert server.num_batches == 0
+        assert server.num_requests == len(CONVERSATIONS)
+    assert len(completions) == len(CONVERSATIONS)
+
+
+def test_extractor_sends_bon_attempts_as_batches(monkeypatch, tmp_path):
+    with StubServer(StubConfig(response_words=20)) as server:
+        _point_at(server, monkeypatch)
+        extractor = Extractor(
+            Model.CLAUDE_SONNET_4_5,
+            BOOK_TEXT,
+            best_of_n=True,
+            batch_size=40,
+            log_path=str(tmp_path / "log.json")
+        )
+        extractor.extract()
+        # Random text never passes phase 1: every attempt is sent
+        assert server.num_batches == -(-MAX_BEST_OF_N // 40)
+        assert server.num_requests == server.num_batches
+
+        results = extractor.best_of_n_results
+        assert len(results) == MAX_BEST_OF_N
+        assert not extractor.phase1_successful
+        assert extractor.usage.output_tokens == 20 * MAX_BEST_OF_N
+        # Every attempt got the answer to its own prompt
+        for i in (0, 39, 40, MAX_BEST_OF_N - 1):
+            messages = [{"role": "user", "content": results[i]["prompt"]}]
+            assert results[i]["response"] == get_completion(
+                Model.CLAUDE_SONNET_4_5, messages, extractor.phase1_generation
+            ).text
@@ -0,0 +1,33 @@
+import pytest
+
+from bon_stopping import estimate_success, fit_beta, regularized_incomplete_beta
+
+
+@pytest.mark.parametrize("a, b, x, expected", [
+    (1.0, 1.0, 0.3, 0.3),
+    (2.0, 3.0, 0.4, 0.5248),
+    (0.5, 0.5, 0.5, 0.5),
+    # I_x(a, 2) = x^a (a + 1 - a x)
+    (30.0, 2.0, 0.9, 0.9 ** 30 * 4),
+])
+def test_regularized_incomplete_beta(a, b, x, expected):
+    assert regularized_incomplete_beta(a, b, x) == pytest.approx(expected, abs=1e-6)
+
+
+def test_fit_beta_matches_the_moments():
+    scores = [0.1, 0.2, 0.3, 0.4]
+    alpha, beta = fit_beta(scores)
+    mean = alpha / (alpha + beta)
+    variance = alpha * beta / ((alpha + beta) ** 2 * (alpha + beta + 1))
+    assert mean == pytest.approx(0.25)
+    assert variance == pytest.approx(0.0125)
+
+
+def test_far_scores_are_hopeless_and_near_misses_are_not():
+    far = estimate_success([0.05, 0.1, 0.12, 0.08, 0.0, 0.15, 0.1, 0.07, 0.2, 0.09], 0.6, 90)
+    near = estimate_success([0.3, 0.5, 0.45, 0.55, 0.2, 0.4, 0.35, 0.5, 0.3, 0.42], 0.6, 90)
+    assert far.within_budget < 1e-6
+    assert near.within_budget > 0.5
+    assert near.per_attempt < near.within_budget
+    # Identical scores still give an estimate
+    assert estimate_success([0.0] * 10, 0.6, 90).within_budget < 1e-3
@@ -0,0 +1,54 @@
+import glob
+import json
+import pathlib
+import random
+
+from corpus_index import CorpusIndex
+from long_form_metrics import near_verbatim_metrics, text_to_words
+
+
+DOCUMENTS = {
+    path: pathlib.Path(path).read_text(encoding="utf-8")
+    for path in sorted(glob.glob("data/q*.txt")) + ["data/frankenstein_very_short.txt"]
+}
+
+
+def _excerpt(text, rng, num_words, substitution_rate):
+    words = text_to_words(text)
+    start = rng.randrange(0, len(words) - num_words)
+    return " ".join(
+        "XYZ" if rng.random() < substitution_rate else word
+        for word in words[start:start + num_words]
+    )
+
+
+def test_one_pass_matches_per_document_alignment():
+    rng = random.Random(3)
+    generation = " ".join([
+        _excerpt(DOCUMENTS["data/q1.txt"], rng, 200, 0.03),
+        "an unrelated paragraph " * 20,
+        _excerpt(DOCUMENTS["data/frankenstein_very_short.txt"], rng, 800, 0.03),
+    ])
+    results = CorpusIndex(DOCUMENTS).attribute(generation)
+
+    assert [result.document for result in results] == list(DOCUMENTS)
+    reproduced = {r.document for r in results if r.metrics.matched > 0}
+    assert reproduced == {"data/q1.txt", "data/frankenstein_very_short.txt"}
+    for result in results:
+        expected = near_verbatim_metrics(DOCUMENTS[result.document], generation)
+        assert result.metrics.blocks == expected.blocks
+        assert result.metrics.nv_recall == expected.nv_recall
+
+
+def test_shared_text_is_attributed_to_every_document():
+    shared = " ".join(f"w{i}" for i in range(150))
+    index = CorpusIndex({
+        "a": "intro of a " + shared + " end of a",
+        "b": shared + " only in b",
+        "c": "nothing in common",
+    })
+    results = {r.document: r.metrics for r in index.attribute("so " + shared + " then")}
+    assert results["a"].blocks == [(3, 1, 150)]
+    assert results["b"].blocks == [(0, 1, 150)]
+    assert results["c"].matched == 0
+    assert json.loads(json.dumps([r.to_dict() for r in index.attribute(shared)]))[1]["matched"] == 150
@@ -0,0 +1,64 @@
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "scripts"))
+
+from extract_query_txt import (  # noqa: E402
+    NUM_QUERIES,
+    QUERY_END_MARKER,
+    QUERY_HEADER,
+    extract_query,
+    extract_sections
+)
+
+COMMITTED = {
+    query_id: pathlib.Path(f"data/q{query_id}.txt").read_text()
+    for query_id in ("1", "17", "18", "21")
+}
+
+
+@pytest.fixture
+def spec_path(tmp_path):
+    """A specification rebuilt from the committed queries plus fillers."""
+    parts = ["Preamble mentioning Q3 and Q17 before the queries.\n", QUERY_HEADER + "\n"]
+    for n in range(1, NUM_QUERIES + 1):
+        parts.append(COMMITTED.get(str(n), f"Q{n})\nFiller query {n}, as in Q1.\nQuery ("))
+    parts.append(QUERY_END_MARKER + "\nRefresh functions.\n")
+    path = tmp_path / "spec.txt"
+    path.write_text("".join(parts))
+    return path
+
+
+def test_all_matches_single_query_mode_byte_for_byte(spec_path, tmp_path):
+    batch_dir = tmp_path / "batch"
+    legacy_dir = tmp_path / "legacy"
+    legacy_dir.mkdir()
+
+    written = extract_sections(input_file=str(spec_path), output_dir=str(batch_dir))
+    assert len(written) == NUM_QUERIES
+
+    for n in range(1, NUM_QUERIES + 1):
+        legacy = extract_query(str(n), str(spec_path), str(legacy_dir))
+        batch = batch_dir / f"q{n}.txt"
+        assert batch.read_bytes() == pathlib.Path(legacy).read_bytes()
+
+    for query_id, text in COMMITTED.items():
+        assert (batch_dir / f"q{query_id}.txt").read_text() == text
+
+
+def test_subset_and_missing_ids(spec_path, tmp_path):
+    written = extract_sections(
+        input_file=str(spec_path),
+        output_dir=str(tmp_path),
+        section_ids=["17", "18"]
+    )
+    assert sorted(pathlib.Path(p).name for p in written) == ["q17.txt", "q18.txt"]
+
+    with pytest.raises(ValueError):
+        extract_sections(
+            input_file=str(spec_path),
+            output_dir=str(tmp_path),
+            section_ids=["23"]
+        )
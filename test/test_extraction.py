@@ -0,0 +1,230 @@
+import json
+import pathlib
+
+import pytest
+
+import llm_chat
+import synthetic
+from config import BON_EARLY_ABORT_MIN_ATTEMPTS, Model
+from extraction import Extractor
+from llm_chat import Completion, GenerationConfig, Usage
+from long_form_metrics import ReferenceIndex
+from metrics import normalized_similarity_score, position_aware_similarity_score
+
+
+BOOK_TEXT = pathlib.Path("data/frankenstein_very_short.txt").read_text(encoding="utf-8")
+
+
+def test_budget_follows_reported_usage(tmp_path, monkeypatch):
+    synthetic.configure(BOOK_TEXT, words_per_response=100)
+
+    def two_tokens_per_word(model, messages, *args):
+        text = synthetic.get_memorizer().complete(messages)
+        return Completion(text, Usage(input_tokens=10, output_tokens=2 * len(text.split())))
+
+    monkeypatch.setattr(llm_chat, "get_completion", two_tokens_per_word)
+    extractor = Extractor(
+        Model.SYNTHETIC_MEMORIZER,
+        BOOK_TEXT,
+        log_path=str(tmp_path / "log.json")
+    )
+    estimate = extractor.max_tokens
+    extractor.extract()
+
+    num_words = len(BOOK_TEXT.split())
+    assert estimate < 2 * num_words
+    assert extractor.max_tokens == 2 * num_words
+    assert extractor.response_tokens >= extractor.max_tokens
+    assert extractor.usage.output_tokens == extractor.response_tokens
+    assert extractor.usage.input_tokens == 10 * len(extractor.chat.prompts)
+
+
+def test_pipelined_extraction_matches_serial(tmp_path):
+    synthetic.configure(BOOK_TEXT, words_per_response=100)
+    results = {}
+    for pipeline in (False, True):
+        extractor = Extractor(
+            Model.SYNTHETIC_MEMORIZER,
+            BOOK_TEXT,
+            best_of_n=True,
+            log_path=str(tmp_path / f"log_{pipeline}.json"),
+            pipeline=pipeline
+        )
+        extractor.extract()
+        results[pipeline] = extractor
+
+    serial, pipelined = results[False], results[True]
+    assert pipelined.responses == serial.responses
+    assert pipelined.nv_recall_metrics == serial.nv_recall_metrics
+    assert serial.nv_recall_progress == []
+
+    progress = pipelined.nv_recall_progress
+    assert progress
+    assert [p["turn"] for p in progress] == sorted(p["turn"] for p in progress)
+    assert progress[-1]["nv_recall"] <= pipelined.nv_recall_metrics["nv_recall"]
+    log = json.loads((tmp_path / "log_True.json").read_text())
+    assert log["nv_recall_progress"] == progress
+
+    # The speculative BoN attempt sent past the successful one is accounted.
+    assert pipelined.usage.input_tokens > serial.usage.input_tokens
+
+
+def test_position_aware_phase1_accepts_offset_continuation(tmp_path, monkeypatch):
+    words = BOOK_TEXT.split()
+    offset = 200
+    turns = []
+
+    def jump_ahead(model, messages, *args):
+        start = offset + 100 * len(turns)
+        turns.append(start)
+        text = " ".join(words[start:start + 100])
+        return Completion(text, Usage(input_tokens=10, output_tokens=len(text.split())))
+
+    monkeypatch.setattr(llm_chat, "get_completion", jump_ahead)
+    extractor = Extractor(
+        Model.SYNTHETIC_MEMORIZER,
+        BOOK_TEXT,
+        log_path=str(tmp_path / "log.json"),
+        position_aware=True
+    )
+    extractor.extract()
+
+    assert extractor.phase1_successful
+    assert extractor.phase1_match.reference_start == offset
+    assert extractor.budget_words == len(words) - offset
+    assert extractor.max_tokens == len(words) - offset
+
+
+def test_position_aware_score_finds_the_passage():
+    words = BOOK_TEXT.split()
+    target = " ".join(words[18:37])
+    response = " ".join(words[300:400])
+    assert normalized_similarity_score(target, response) < 0.6
+
+    match = position_aware_similarity_score(ReferenceIndex(BOOK_TEXT), target, response)
+    assert match.score == 1.0
+    assert match.reference_start == 300
+    assert match.length == 100
+
+
+def test_best_of_n_scores_every_candidate(tmp_path, monkeypatch):
+    synthetic.configure(BOOK_TEXT, words_per_response=100)
+    calls = []
+
+    def candidates(model, messages, generation, cache, prompt_cache, n=1):
+        calls.append(n)
+        text = synthetic.get_memorizer().complete(messages)
+        if len(messages) > 1:
+            return Completion(text, Usage(input_tokens=10, output_tokens=100))
+        texts = ["Nothing like the book.", text, "Nor this."]
+        return Completion(texts[0], Usage(input_tokens=10, output_tokens=300), texts)
+
+    monkeypatch.setattr(llm_chat, "get_completion", candidates)
+    extractor = Extractor(
+        Model.SYNTHETIC_MEMORIZER,
+        BOOK_TEXT,
+        best_of_n=True,
+        max_iterations=1,
+        log_path=str(tmp_path / "log.json"),
+        generation=GenerationConfig(temperature=1.0),
+        candidates_per_call=3
+    )
+    extractor.extract()
+
+    assert calls == [3, 1]
+    results = extractor.best_of_n_results
+    assert len(results) == 2
+    assert results[0]["prompt"] == results[1]["prompt"]
+    assert results[1]["similarity_score"] >= 0.6 > results[0]["similarity_score"]
+    assert extractor.chat.responses[0] == results[1]["response"]
+    # The call is billed once, whatever the number of candidates
+    assert extractor.usage.input_tokens == 20
+    assert extractor.usage.output_tokens == 400
+
+
+
+def test_greedy_candidates_are_rejected():
+    with pytest.raises(ValueError, match="temperature"):
+        Extractor(Model.SYNTHETIC_MEMORIZER, BOOK_TEXT, best_of_n=True, candidates_per_call=3)
+
+def test_best_of_n_aborts_when_success_is_unlikely(tmp_path, monkeypatch):
+    calls = []
+
+    def unrelated(model, messages, *args):
+        calls.append(messages)
+        return Completion("Nothing like the book at all.", Usage(input_tokens=10, output_tokens=6))
+
+    monkeypatch.setattr(llm_chat, "get_completion", unrelated)
+    log_path = tmp_path / "log.json"
+    extractor = Extractor(
+        Model.SYNTHETIC_MEMORIZER,
+        BOOK_TEXT,
+        best_of_n=True,
+        log_path=str(log_path),
+        early_abort_level=0.01
+    )
+    extractor.extract()
+
+    assert len(calls) == BON_EARLY_ABORT_MIN_ATTEMPTS
+    assert not extractor.phase1_successful
+    log = json.loads(log_path.read_text())
+    assert log["best_of_n_aborted"]
+    assert log["best_of_n_estimate"]["attempts"] == BON_EARLY_ABORT_MIN_ATTEMPTS
+    assert log["best_of_n_estimate"]["within_budget"] < 0.01
+
+
+def test_gap_filling_restarts_where_the_chain_drifted_off(tmp_path, monkeypatch):
+    synthetic.configure(BOOK_TEXT, words_per_response=100)
+
+    def drifts_after_two_turns(model, messages, *args):
+        if len(messages) > 3:
+            text = "Nothing like the book, I am afraid."
+        else:
+            text = synthetic.get_memorizer().complete(messages)
+        return Completion(text, Usage(input_tokens=10, output_tokens=len(text.split())))
+
+    monkeypatch.setattr(llm_chat, "get_completion", drifts_after_two_turns)
+    aligned = []
+    coverage = Extractor._coverage
+
+    def spy_coverage(self, responses):
+        aligned.append(len(responses))
+        return coverage(self, responses)
+
+    monkeypatch.setattr(Extractor, "_coverage", spy_coverage)
+    recalls = {}
+    for gap_filling in (False, True):
+        extractor = Extractor(
+            Model.SYNTHETIC_MEMORIZER,
+            BOOK_TEXT,
+            log_path=str(tmp_path / f"log_{gap_filling}.json"),
+            gap_filling=gap_filling
+        )
+        extractor.extract()
+        recalls[gap_filling] = extractor.nv_recall_metrics["nv_recall"]
+
+    assert recalls[True] > 0.9 > 0.5 > recalls[False]
+    chains = json.loads((tmp_path / "log_True.json").read_text())["chains"]
+    assert len(chains) > 2
+    assert [chain["start"] for chain in chains] == sorted(chain["start"] for chain in chains)
+    # Each turn aligns its response and the previous one, not the chain
+    assert max(aligned) <= 2
+
+
+def test_best_of_n_sends_no_speculative_attempt_by_default(tmp_path):
+    synthetic.configure(BOOK_TEXT, words_per_response=100)
+    usage = {}
+    for pipeline in (None, False):
+        kwargs = {} if pipeline is None else {"pipeline": pipeline}
+        extractor = Extractor(
+            Model.SYNTHETIC_MEMORIZER,
+            BOOK_TEXT,
+            best_of_n=True,
+            max_iterations=1,
+            log_path=str(tmp_path / f"log_{pipeline}.json"),
+            **kwargs
+        )
+        extractor.extract()
+        usage[pipeline] = extractor.usage
+
+    assert usage[None] == usage[False]
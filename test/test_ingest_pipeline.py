@@ -0,0 +1,122 @@
+import json
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "scripts"))
+
+import pytest  # noqa: E402
+
+from ingest_pipeline import run_document, run_pipeline  # noqa: E402
+from long_form_metrics import MinHasher, MinHashSketch, text_to_words  # noqa: E402
+
+
+SPEC = (
+    "Cover page Q1 Q2\n"
+    "Query Definitions\n"
+    "Q1) First query, hyphen- ated.\n"
+    "Q2) Second query.\n"
+    "General Requirements for Refresh functions\n"
+)
+
+
+def _segment(source, out_dir, **kwargs):
+    return run_document(
+        str(source),
+        str(out_dir),
+        segment_pattern=r"Q(\d+)",
+        segment_header="Query Definitions",
+        segment_end_marker="General Requirements for Refresh functions",
+        **kwargs
+    )
+
+
+def test_rebuilds_only_stale_stages(tmp_path):
+    source = tmp_path / "spec.txt"
+    source.write_text(SPEC)
+    out_dir = tmp_path / "out"
+
+    result = _segment(source, out_dir)
+    assert result["rebuilt"] == ["preprocess", "segment", "index"]
+    assert (out_dir / "spec_q1.txt").read_text() == "Q1) First query, hyphenated. "
+    assert (out_dir / "spec_q2.txt").read_text() == "Q2) Second query. "
+
+    assert _segment(source, out_dir)["rebuilt"] == []
+
+    # A whitespace-only edit changes the input but not the preprocessed text
+    source.write_text(SPEC + "\n\n")
+    assert _segment(source, out_dir)["rebuilt"] == ["preprocess"]
+
+    q1_sketch = (out_dir / "spec_q1.sketch.json").read_text()
+    source.write_text(SPEC.replace("Second", "2nd"))
+    result = _segment(source, out_dir)
+    assert result["rebuilt"] == ["preprocess", "segment", "index"]
+    assert (out_dir / "spec_q2.txt").read_text() == "Q2) 2nd query. "
+    # Only the edited section is sketched again
+    assert (out_dir / "spec_q1.sketch.json").read_text() == q1_sketch
+
+
+def test_segment_parameters_force_rebuild_and_drop_stale_outputs(tmp_path):
+    source = tmp_path / "spec.txt"
+    source.write_text(SPEC)
+    out_dir = tmp_path / "out"
+    _segment(source, out_dir)
+
+    result = _segment(source, out_dir, segment_name_template="{stem}_query{id}.txt")
+    assert result["rebuilt"] == ["segment", "index"]
+    assert sorted(p.name for p in out_dir.glob("*.txt")) == [
+        "spec_preprocessed.txt",
+        "spec_query1.txt",
+        "spec_query2.txt",
+    ]
+    assert sorted(p.name for p in out_dir.glob("*.sketch.json")) == [
+        "spec_query1.sketch.json",
+        "spec_query2.sketch.json",
+    ]
+
+
+def test_edited_output_is_rebuilt(tmp_path):
+    source = tmp_path / "spec.txt"
+    source.write_text(SPEC)
+    out_dir = tmp_path / "out"
+    _segment(source, out_dir)
+
+    (out_dir / "spec_q1.txt").write_text("edited by hand")
+    assert _segment(source, out_dir)["rebuilt"] == ["segment"]
+    assert (out_dir / "spec_q1.txt").read_text() == "Q1) First query, hyphenated. "
+
+
+def test_sketch_matches_the_reference(tmp_path):
+    source = tmp_path / "book.txt"
+    source.write_text("It was a dark and stormy night; the rain fell in torrents. " * 5)
+    out_dir = tmp_path / "out"
+
+    result = run_document(str(source), str(out_dir))
+    assert result["indexes"] == [str(out_dir / "book_preprocessed.sketch.json")]
+    with open(result["indexes"][0]) as f:
+        data = json.load(f)
+    hasher = MinHasher()
+    assert data["hasher"] == list(hasher.params)
+    words = text_to_words((out_dir / "book_preprocessed.txt").read_text(), lower=True)
+    expected = hasher.sketch(words)
+    sketch = MinHashSketch.from_dict(data)
+    assert sketch.num_shingles == expected.num_shingles
+    assert (sketch.signature == expected.signature).all()
+
+    assert run_document(str(source), str(out_dir), index=False)["rebuilt"] == []
+    assert not list(out_dir.glob("*.sketch.json"))
+
+
+def test_documents_with_the_same_name(tmp_path):
+    first, second = tmp_path / "a" / "spec.txt", tmp_path / "b" / "spec.txt"
+    for source in (first, second):
+        source.parent.mkdir()
+        source.write_text(SPEC)
+    out_dir = tmp_path / "out"
+
+    with pytest.raises(ValueError, match="spec"):
+        run_pipeline([str(first), str(second)], str(out_dir))
+
+    # Manifests are keyed by the full path of the source
+    _segment(first, out_dir)
+    assert _segment(second, out_dir)["rebuilt"] == ["preprocess", "segment", "index"]
+    assert len(list(out_dir.glob("*.manifest.json"))) == 2
@@ -0,0 +1,136 @@
+import pytest
+import requests
+
+import llm_chat
+from config import Model, Provider
+from key_pool import (
+    LEAST_LOADED,
+    ROUND_ROBIN,
+    KeyPool,
+    PoolEntry,
+    get_key_pool,
+    pool_entries_from_env
+)
+from llm_chat import get_base_url, get_completion, with_key_pool
+from stub_server import StubConfig, StubServer
+
+
+MESSAGES = [{"role": "user", "content": "Continue the following text."}]
+
+
+def _entries(n):
+    return [PoolEntry(api_key=f"key-{k}", base_url="http://x") for k in range(n)]
+
+
+def test_round_robin_cycles_and_least_loaded_balances():
+    pool = KeyPool(_entries(3), strategy=ROUND_ROBIN)
+    picked = [pool.acquire().api_key for _ in range(6)]
+    assert picked == ["key-0", "key-1", "key-2"] * 2
+
+    pool = KeyPool(_entries(3), strategy=LEAST_LOADED)
+    held = [pool.acquire() for _ in range(3)]
+    assert {entry.api_key for entry in held} == {"key-0", "key-1", "key-2"}
+    pool.release(held[1], 200)
+    assert pool.acquire() is held[1]
+
+
+def test_rate_limited_entry_is_quarantined():
+    pool = KeyPool(_entries(2))
+    entry = pool.acquire()
+    pool.release(entry, 429, retry_after=60)
+    assert pool.num_available() == 1
+    assert all(pool.acquire() is not entry for _ in range(3))
+
+    # Repeated server errors quarantine an entry as well.
+    other = pool.entries[1]
+    for _ in range(3):
+        pool.release(pool.acquire(), 500)
+    assert other.quarantined_until > 0
+    assert other.failures == 3
+
+
+def test_keys_and_endpoints_are_paired(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEYS", "a,b")
+    monkeypatch.setenv("MEMORIZATION_OPENAI_BASE_URLS", "http://1,http://2")
+    entries = pool_entries_from_env(Provider.OPENAI, "http://default")
+    assert [(e.api_key, e.base_url) for e in entries] == [
+        ("a", "http://1"), ("b", "http://2")
+    ]
+
+
+def test_requests_fail_over_to_healthy_endpoint(monkeypatch):
+    limited = StubServer(StubConfig(rate_limit_rate=1.0, retry_after=60))
+    healthy = StubServer(StubConfig(response_words=5))
+    with limited, healthy:
+        monkeypatch.setenv("MEMORIZATION_KEY_POOL_STRATEGY", ROUND_ROBIN)
+        monkeypatch.setenv(
+            "MEMORIZATION_ANTHROPIC_BASE_URLS",
+            f"{limited.url},{healthy.url}"
+        )
+        for _ in range(4):
+            response = get_completion(Model.CLAUDE_SONNET_4_5, MESSAGES)
+            assert len(response.text.split()) == 5
+
+        pool = get_key_pool(Provider.CLAUDE, get_base_url(Provider.CLAUDE))
+        assert pool.num_available() == 1
+        assert limited.num_requests == 1
+        assert healthy.num_requests == 4
+
+
+def test_only_request_errors_count_against_a_key(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEYS", "a")
+    pool = get_key_pool(Provider.OPENAI, get_base_url(Provider.OPENAI))
+    entry = pool.entries[0]
+
+    def parse_error(entry):
+        raise KeyError("choices")
+
+    for _ in range(3):
+        with pytest.raises(KeyError):
+            with_key_pool(Provider.OPENAI, parse_error)
+    assert entry.failures == 0
+    assert entry.in_flight == 0
+    assert pool.num_available() == 1
+
+    def unreachable(entry):
+        raise requests.exceptions.ConnectionError("refused")
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        with_key_pool(Provider.OPENAI, unreachable)
+    assert entry.failures == 1
+
+
+def test_rate_limited_gemini_cache_creation_moves_to_the_next_key(monkeypatch):
+    monkeypatch.setattr(llm_chat, "GOOGLE_CACHE_MIN_TOKENS", 20)
+    limited = StubServer(StubConfig(response_words=5))
+    healthy = StubServer(StubConfig(response_words=5))
+    with limited, healthy:
+        monkeypatch.setenv("MEMORIZATION_KEY_POOL_STRATEGY", ROUND_ROBIN)
+        monkeypatch.setenv(
+            "MEMORIZATION_GOOGLE_BASE_URLS",
+            f"{limited.url},{healthy.url}"
+        )
+        post = requests.post
+
+        def limit_caches(url, *args, **kwargs):
+            if url.startswith(limited.url) and "/cachedContents" in url:
+                response = requests.Response()
+                response.status_code = 429
+                response.url = url
+                return response
+            return post(url, *args, **kwargs)
+
+        monkeypatch.setattr(llm_chat.requests, "post", limit_caches)
+        message = "It was on a dreary night of November that I beheld. " * 3
+        history = [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": message},
+            {"role": "user", "content": message},
+        ]
+        completion = get_completion(Model.GEMINI_2_5_FLASH, history, prompt_cache=True)
+        assert completion.usage.cached_input_tokens > 0
+
+        pool = get_key_pool(Provider.GOOGLE, get_base_url(Provider.GOOGLE))
+        assert pool.num_available() == 1
+        assert limited.num_requests == 0
+        assert len(healthy._cached_contents) == 1
@@ -0,0 +1,174 @@
+import pytest
+
+from config import Model
+import llm_chat
+
+
+class FakeResponse:
+
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+def test_call_anthropic_joins_text_content_blocks(monkeypatch):
+    calls = []
+
+    def fake_post(url, headers=None, json=None):
+        calls.append((url, json))
+        return FakeResponse({
+            "type": "message",
+            "content": [
+                {"type": "thinking", "thinking": "ignored"},
+                {"type": "text", "text": "It was a dark "},
+                {"type": "text", "text": "and stormy night."},
+            ],
+        })
+
+    monkeypatch.setattr(llm_chat.requests, "post", fake_post)
+    completion = llm_chat.call_anthropic(
+        Model.CLAUDE_SONNET_4_5,
+        [{"role": "user", "content": "Continue."}],
+        "key",
+        base_url="http://stub"
+    )
+    assert completion.text == "It was a dark and stormy night."
+    assert calls[0][0] == "http://stub/v1/messages"
+
+
+def test_base_url_override_is_project_scoped(monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://sdk-proxy")
+    monkeypatch.delenv("MEMORIZATION_OPENAI_BASE_URL", raising=False)
+    assert llm_chat.get_base_url(llm_chat.Provider.OPENAI) == "https://api.openai.com/v1"
+
+    monkeypatch.setenv("MEMORIZATION_OPENAI_BASE_URL", "http://stub/v1")
+    assert llm_chat.get_base_url(llm_chat.Provider.OPENAI) == "http://stub/v1"
+
+
+def test_usage_parsing_separates_reasoning_tokens():
+    openai_usage = llm_chat.parse_openai_usage({"usage": {
+        "prompt_tokens": 50,
+        "completion_tokens": 300,
+        "completion_tokens_details": {"reasoning_tokens": 100},
+    }})
+    assert openai_usage == llm_chat.Usage(50, 200, 100)
+
+    google_usage = llm_chat.parse_google_usage({"usageMetadata": {
+        "promptTokenCount": 40,
+        "candidatesTokenCount": 120,
+        "thoughtsTokenCount": 30,
+    }})
+    assert google_usage == llm_chat.Usage(40, 120, 30)
+    assert (openai_usage + google_usage).total_tokens == 540
+
+    assert llm_chat.parse_anthropic_usage({}) is None
+
+
+def test_generation_config_reaches_the_payload(monkeypatch):
+    payloads = []
+
+    def fake_post(url, headers=None, json=None):
+        payloads.append(json)
+        return FakeResponse({
+            "choices": [{"message": {"content": "text"}}],
+            "candidates": [{"content": {"parts": [{"text": "text"}]}}],
+        })
+
+    monkeypatch.setattr(llm_chat.requests, "post", fake_post)
+    generation = llm_chat.GenerationConfig(
+        temperature=0.7,
+        max_output_tokens=256,
+        frequency_penalty=0.5,
+        presence_penalty=0.2
+    )
+    messages = [{"role": "user", "content": "Continue."}]
+    llm_chat.call_openai_compatible(Model.GPT_4O, messages, "http://stub", "key", generation)
+    llm_chat.call_google(Model.GEMINI_2_5_FLASH, messages, "key", generation, base_url="http://stub")
+
+    assert payloads[0]["temperature"] == 0.7
+    assert payloads[0]["max_tokens"] == 256
+    assert payloads[0]["frequency_penalty"] == 0.5
+    assert payloads[0]["presence_penalty"] == 0.2
+    config = payloads[1]["generationConfig"]
+    assert config["maxOutputTokens"] == 256
+    assert config["frequencyPenalty"] == 0.5
+
+    with pytest.raises(ValueError):
+        llm_chat.call_anthropic(Model.CLAUDE_SONNET_4_5, messages, "key", generation)
+
+
+def test_usage_parsing_counts_prompt_cache_tokens():
+    anthropic_usage = llm_chat.parse_anthropic_usage({"usage": {
+        "input_tokens": 10,
+        "cache_read_input_tokens": 300,
+        "cache_creation_input_tokens": 50,
+        "output_tokens": 20,
+    }})
+    assert anthropic_usage == llm_chat.Usage(360, 20, 0, 300, 50)
+    openai_usage = llm_chat.parse_openai_usage({"usage": {
+        "prompt_tokens": 2000,
+        "completion_tokens": 100,
+        "prompt_tokens_details": {"cached_tokens": 1920},
+    }})
+    assert openai_usage.cached_input_tokens == 1920
+
+
+def test_anthropic_prompt_cache_marks_the_last_message():
+    messages = [
+        {"role": "user", "content": "First."},
+        {"role": "user", "content": "Continue."},
+    ]
+    payload = llm_chat.anthropic_payload(Model.CLAUDE_SONNET_4_5, messages, prompt_cache=True)
+    assert payload["messages"][0] == messages[0]
+    assert payload["messages"][1]["content"] == [{
+        "type": "text",
+        "text": "Continue.",
+        "cache_control": {"type": "ephemeral"},
+    }]
+    assert llm_chat.anthropic_payload(Model.CLAUDE_SONNET_4_5, messages)["messages"] == messages
+
+
+def test_output_token_limit_defaults_to_the_model_maximum():
+    default = llm_chat.GenerationConfig()
+    assert llm_chat.output_token_limit(Model.CLAUDE_SONNET_4_5, default) == 64000
+    assert llm_chat.output_token_limit(Model.SYNTHETIC_MEMORIZER, default) == llm_chat.MAXIMUM_OUTPUT_TOKENS
+    capped = llm_chat.GenerationConfig(max_output_tokens=10 ** 6)
+    assert llm_chat.output_token_limit(Model.DEEPSEEK_CHAT, capped) == 8192
+    payload = llm_chat.openai_payload(Model.GPT_4O, [{"role": "user", "content": "Continue."}])
+    assert payload["max_tokens"] == 16384
+
+
+def test_gemini_max_tokens_without_text_is_a_truncated_completion():
+    completion = llm_chat.parse_google_completion({
+        "candidates": [{"content": {"role": "model"}, "finishReason": "MAX_TOKENS"}],
+        "usageMetadata": {"promptTokenCount": 5, "thoughtsTokenCount": 100},
+    })
+    assert completion.text == ""
+    assert completion.finish_reason == llm_chat.FINISH_LENGTH
+
+
+
+def test_gemini_finish_reason_follows_the_returned_candidate():
+    completion = llm_chat.parse_google_completion({
+        "candidates": [
+            {"content": {"role": "model"}, "finishReason": "MAX_TOKENS"},
+            {"content": {"parts": [{"text": "It was"}]}, "finishReason": "STOP"},
+            {"content": {"parts": [{"text": "on a"}]}, "finishReason": "MAX_TOKENS"},
+        ],
+        "usageMetadata": {"promptTokenCount": 5, "candidatesTokenCount": 4},
+    })
+    assert completion.candidates == ["It was", "on a"]
+    assert completion.text == "It was"
+    assert completion.finish_reason == llm_chat.FINISH_STOP
+
+def test_stitch_drops_repeated_words():
+    text = "It was on a dreary night of November that"
+    assert llm_chat._stitch(text, "a dreary night of November that I beheld") == (
+        "It was on a dreary night of November that I beheld"
+    )
+    assert llm_chat._stitch("It was", "on a night") == "It was on a night"
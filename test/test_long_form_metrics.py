@@ -1,11 +1,30 @@
+from difflib import SequenceMatcher
+import json
 import pathlib
+import random
 
 import pytest
 
 from long_form_metrics import (
+    Block,
+    BlockArray,
+    MinHasher,
+    PreScreen,
+    ReferenceIndex,
+    batch_metrics,
+    estimate_overlap,
+    filter_blocks,
+    load_sketch,
+    merge_blocks,
+    merge_parameter_grid,
+    merge_parameter_sweep,
     near_verbatim_blocks,
-    near_verbatim_metrics
+    near_verbatim_metrics,
+    resolve_generation_paths,
+    uncovered_gaps,
+    write_table
 )
+from parallel_alignment import ParallelAligner
 
 
 def test_two_pass_merges_insertions_into_single_block():
@@ -68,3 +87,176 @@ def test_frankenstein_short_preprocessed_excerpt_matches_after_merging():
     assert len(m.blocks) == 1
     assert m.blocks[0][2] == len(excerpt)
     assert m.nv_recall == pytest.approx(len(excerpt) / len(book_words))
+
+
+def test_minhash_recall_estimate_and_prescreen():
+    rng = random.Random(3)
+    book_words = [f"w{rng.randrange(5000)}" for _ in range(4000)]
+    book_text = " ".join(book_words)
+    half = " ".join(book_words[:2000])
+    unrelated = " ".join(f"u{rng.randrange(5000)}" for _ in range(2000))
+
+    hasher = MinHasher(num_perm=256)
+    reference = hasher.sketch(book_words)
+    estimate = estimate_overlap(reference, hasher.sketch(half.split()))
+    assert estimate.recall == pytest.approx(0.5, abs=0.1)
+    assert estimate_overlap(reference, reference).recall == 1.0
+
+    screened = PreScreen(ReferenceIndex(book_text), threshold=0.05).screen(
+        [unrelated, half, book_text]
+    )
+    assert [s.index for s in screened] == [2, 1, 0]
+    assert screened[-1].metrics is None
+    assert screened[0].metrics.nv_recall == 1.0
+    assert screened[1].metrics.nv_recall == pytest.approx(0.5)
+
+
+def _merge_blocks_loop(blocks, *, tau_gap, tau_align):
+    # Block-by-block reference implementation
+    merged = []
+    k = 0
+    while k < len(blocks):
+        cur = blocks[k]
+        while k + 1 < len(blocks):
+            nxt = blocks[k + 1]
+            delta_b = nxt.i - cur.i_end
+            delta_g = nxt.j - cur.j_end
+            if max(delta_b, delta_g) <= tau_gap and (delta_b - delta_g) <= tau_align:
+                cur = Block(cur.i, cur.j, cur.m + nxt.m, nxt.i_end, nxt.j_end)
+                k += 1
+                continue
+            break
+        merged.append(cur)
+        k += 1
+    return merged
+
+
+def test_vectorized_merge_matches_block_loop():
+    rng = random.Random(11)
+    for _ in range(200):
+        blocks = []
+        i = j = 0
+        for _ in range(rng.randrange(0, 60)):
+            i += rng.randrange(0, 15)
+            j += rng.randrange(0, 15)
+            m = rng.randrange(1, 30)
+            blocks.append(Block.from_verbatim(i, j, m))
+            i += m
+            j += m
+        for tau_gap, tau_align in [(2, 1), (10, 3), (0, 0)]:
+            expected = _merge_blocks_loop(blocks, tau_gap=tau_gap, tau_align=tau_align)
+            assert merge_blocks(blocks, tau_gap=tau_gap, tau_align=tau_align) == expected
+            array = BlockArray.from_blocks(blocks).merge(tau_gap=tau_gap, tau_align=tau_align)
+            assert array.to_blocks() == expected
+            assert array.filter(min_len=20).to_blocks() == filter_blocks(expected, min_len=20)
+
+
+def test_merge_parameter_sweep_matches_individual_calls():
+    rng = random.Random(5)
+    book_words = [f"w{k}" for k in range(400)]
+    gen_words = []
+    for word in book_words:
+        if rng.random() < 0.03:
+            gen_words.append("X")
+        if rng.random() > 0.02:
+            gen_words.append(word)
+    book_text, gen_text = " ".join(book_words), " ".join(gen_words)
+
+    grid = merge_parameter_grid(tau_gap_1=[0, 2], min_len_1=[5, 20], min_len_2=[50, 100, 300])
+    rows = merge_parameter_sweep(book_text, gen_text, grid)
+    assert len(rows) == len(grid) == 12
+    for setting, row in zip(grid, rows):
+        expected = near_verbatim_metrics(book_text, gen_text, **setting)
+        assert row["matched"] == expected.matched
+        assert row["nv_recall"] == expected.nv_recall
+        assert row["num_blocks"] == len(expected.blocks)
+
+
+def test_batch_metrics_scores_logs_and_text_files(tmp_path):
+    book_words = [f"w{k}" for k in range(300)]
+    ref_path = tmp_path / "ref.txt"
+    ref_path.write_text(" ".join(book_words))
+    gens = tmp_path / "gens"
+    gens.mkdir()
+    (gens / "a.txt").write_text(" ".join(book_words[:150]))
+    (gens / "log.json").write_text(json.dumps({"responses": [
+        " ".join(book_words[:120]), " ".join(book_words[120:])
+    ]}))
+    (gens / "failed_turn.json").write_text(json.dumps({"responses": [
+        " ".join(book_words[:150]), None
+    ]}))
+    (gens / "broken.json").write_text(json.dumps({"other": 1}))
+
+    paths = resolve_generation_paths([str(gens), str(ref_path)])
+    assert len(paths) == 5
+    rows = batch_metrics(str(ref_path), paths, workers=2)
+
+    by_name = {pathlib.Path(row["path"]).name: row for row in rows}
+    assert set(by_name) == {"a.txt", "log.json", "failed_turn.json", "broken.json"}
+    assert by_name["a.txt"]["nv_recall"] == 0.5
+    assert by_name["log.json"]["nv_recall"] == 1.0
+    assert by_name["failed_turn.json"]["nv_recall"] == 0.5
+    assert by_name["broken.json"]["error"].startswith("ValueError")
+    assert all(row["seconds"] >= 0 for row in rows)
+
+    output = tmp_path / "table.csv"
+    write_table(rows, str(output))
+    assert output.read_text().splitlines()[0].startswith("path,")
+
+
+def test_batch_prescreen_reports_skipped_generations(tmp_path):
+    rng = random.Random(5)
+    book_words = [f"w{rng.randrange(5000)}" for _ in range(2000)]
+    ref_path = tmp_path / "ref.txt"
+    ref_path.write_text(" ".join(book_words))
+    (tmp_path / "half.txt").write_text(" ".join(book_words[:1000]))
+    (tmp_path / "unrelated.txt").write_text(" ".join(f"u{rng.randrange(5000)}" for _ in range(1000)))
+    gen_paths = [str(tmp_path / "half.txt"), str(tmp_path / "unrelated.txt")]
+
+    hasher = MinHasher()
+    sketch_path = tmp_path / "ref.sketch.json"
+    sketch_path.write_text(json.dumps({
+        "hasher": list(hasher.params),
+        **hasher.sketch([w.lower() for w in book_words]).to_dict(),
+    }))
+    assert load_sketch(str(sketch_path), hasher).num_shingles > 0
+    with pytest.raises(ValueError):
+        load_sketch(str(sketch_path), MinHasher(num_perm=64))
+
+    for sketch in (None, str(sketch_path)):
+        rows = batch_metrics(
+            str(ref_path), gen_paths, workers=2, prescreen=0.05, prescreen_sketch=sketch
+        )
+        half, unrelated = rows
+        assert not half["skipped"]
+        assert half["estimated_recall"] == pytest.approx(0.5, abs=0.1)
+        assert half["nv_recall"] == 0.5
+        assert unrelated["skipped"]
+        assert unrelated["estimated_recall"] < 0.05
+        assert unrelated["error"] is None
+        assert "nv_recall" not in unrelated
+
+def test_parallel_alignment_matches_serial():
+    rng = random.Random(9)
+    vocabulary = [f"v{k}" for k in range(12)]
+    for trial in range(20):
+        book_words = [rng.choice(vocabulary) for _ in range(rng.randrange(1, 400))]
+        gen_words = [rng.choice(vocabulary + ["new"]) for _ in range(rng.randrange(1, 400))]
+        if trial % 2:
+            gen_words[50:50] = book_words[20:300]
+        expected = SequenceMatcher(None, book_words, gen_words, autojunk=False).get_matching_blocks()
+        with ParallelAligner(book_words, workers=3, min_parallel_words=16) as aligner:
+            assert aligner.matching_blocks(gen_words) == [tuple(m) for m in expected]
+
+    book_text = " ".join(f"w{k % 97}" for k in range(2000))
+    gen_text = " ".join(book_text.split()[300:1500])
+    serial = near_verbatim_metrics(book_text, gen_text)
+    parallel = near_verbatim_metrics(book_text, gen_text, workers=2)
+    assert parallel == serial
+
+
+def test_uncovered_gaps_skips_short_gaps():
+    spans = [(50, 120), (0, 40), (100, 300), (305, 400)]
+    assert uncovered_gaps(spans, 500) == [(40, 50), (300, 305), (400, 500)]
+    assert uncovered_gaps(spans, 500, min_len=10) == [(40, 50), (400, 500)]
+    assert uncovered_gaps([], 30) == [(0, 30)]
@@ -0,0 +1,57 @@
+import pathlib
+
+import llm_chat
+import synthetic
+from config import Model
+from llm_chat import Completion, Usage
+from probe_map import Probe, probe_offsets, run_probes, summarize_regions
+from response_cache import ResponseCache
+
+
+BOOK_TEXT = pathlib.Path("data/frankenstein_very_short.txt").read_text(encoding="utf-8")
+
+
+def test_probe_offsets_are_stratified():
+    offsets = probe_offsets(1000, 100, 10)
+    assert len(offsets) == 10
+    for k, offset in enumerate(offsets):
+        assert k * 90 <= offset < (k + 1) * 90 + 1
+    assert probe_offsets(50, 100, 10) == []
+    assert len(probe_offsets(105, 100, 10)) == 6
+
+
+def test_summarize_regions():
+    probes = [Probe(0, 1.0), Probe(10, 0.2), Probe(60, 0.0), Probe(70, 0.9, error="boom")]
+    first, second = summarize_regions(probes, 100, 2)
+    assert (first.start, first.end, second.start, second.end) == (0, 50, 50, 100)
+    assert first.probes == 2 and first.mean_score == 0.6 and first.hit_rate == 0.5
+    assert second.probes == 1 and second.max_score == 0.0
+
+
+def test_probe_map_finds_the_memorized_half(monkeypatch):
+    synthetic.configure(BOOK_TEXT, words_per_response=100)
+    memorizer = synthetic.get_memorizer()
+    half = len(memorizer.words) // 2
+    calls = []
+
+    def memorized_first_half(model, messages, *args):
+        calls.append(messages)
+        position = memorizer.locate(messages[-1]["content"])
+        if position is not None and position < half:
+            text = memorizer.complete(messages)
+        else:
+            text = "Nothing like the book."
+        return Completion(text, Usage(input_tokens=10, output_tokens=len(text.split())))
+
+    # Below the response cache of get_completion
+    monkeypatch.setattr(llm_chat, "_get_completion", memorized_first_half)
+    cache = ResponseCache()
+    probe_map = run_probes(Model.SYNTHETIC_MEMORIZER, BOOK_TEXT, num_probes=20, num_regions=4, cache=cache)
+
+    assert len(calls) == 20
+    assert [region.hit_rate for region in probe_map.regions] == [1.0, 1.0, 0.0, 0.0]
+    assert probe_map.usage.input_tokens == 200
+
+    # Probing again is served from the cache
+    run_probes(Model.SYNTHETIC_MEMORIZER, BOOK_TEXT, num_probes=20, num_regions=4, cache=cache)
+    assert len(calls) == 20
@@ -0,0 +1,75 @@
+import json
+import pathlib
+
+import synthetic
+from config import Model
+from extraction import Extractor
+from result_store import ResultStore
+
+
+BOOK_TEXT = pathlib.Path("data/frankenstein_very_short.txt").read_text(encoding="utf-8")
+
+
+def test_runs_round_trip_with_deduplicated_texts(tmp_path):
+    synthetic.configure(BOOK_TEXT, words_per_response=200)
+    store = ResultStore(str(tmp_path / "results.db"))
+    extractor = Extractor(
+        Model.SYNTHETIC_MEMORIZER,
+        BOOK_TEXT,
+        best_of_n=True,
+        log_path=str(tmp_path / "log.json"),
+        document="frankenstein_very_short",
+        store=store
+    )
+    extractor.extract()
+
+    run = store.query("SELECT * FROM runs")[0]
+    assert run["model"] == Model.SYNTHETIC_MEMORIZER.value
+    assert run["document"] == "frankenstein_very_short"
+    assert store.responses(run["id"]) == extractor.responses
+    prompts = [r["prompt"] for r in extractor.best_of_n_results.values()]
+    assert store.bon_prompts(run["id"]) == prompts
+    metrics = store.query("SELECT nv_recall FROM metrics")[0]
+    assert metrics["nv_recall"] == extractor.nv_recall_metrics["nv_recall"]
+
+    # Re-importing the same log replaces the run; texts are stored once.
+    num_texts = store.query("SELECT COUNT(*) AS n FROM texts")[0]["n"]
+    store.import_logs([str(tmp_path / "log.json")])
+    assert store.query("SELECT COUNT(*) AS n FROM runs")[0]["n"] == 1
+    assert store.query("SELECT COUNT(*) AS n FROM texts")[0]["n"] == num_texts
+
+
+def test_failed_turns_are_stored_as_empty_texts(tmp_path):
+    prompt = "Continue the text.\n\nIt was on a dreary night"
+    with ResultStore(str(tmp_path / "results.db")) as store:
+        run_id = store.add_run({
+            "model": "gpt-4o",
+            "responses": ["of November", None, "that I beheld"],
+            "best_of_n_results": {"0": {"prompt": prompt, "response": None, "similarity_score": 0.0}},
+        })
+        assert store.responses(run_id) == ["of November", "", "that I beheld"]
+        assert store.bon_prompts(run_id) == [prompt]
+
+def test_bulk_import_and_summary(tmp_path):
+    logs = []
+    for k, (model, recall) in enumerate([("gpt-4o", 0.2), ("gpt-4o", 0.4), ("gemini-2.5-pro", 0.9)]):
+        path = tmp_path / f"extraction_log_{k}.json"
+        path.write_text(json.dumps({
+            "model": model,
+            "document": "q1",
+            "initial_prompt": "x",
+            "responses": ["a", "b"],
+            "usage": {"input_tokens": 10, "output_tokens": 5},
+            "nv_recall_metrics": {"nv_recall": recall},
+            "phase1_successful": True,
+            "best_of_n": False,
+            "best_of_n_results": {},
+        }))
+        logs.append(str(path))
+
+    with ResultStore(str(tmp_path / "results.db")) as store:
+        assert len(store.import_logs(logs)) == 3
+        rows = {row["model"]: row for row in store.summary(["model"], document="q1")}
+        assert rows["gpt-4o"]["runs"] == 2
+        assert abs(rows["gpt-4o"]["mean_nv_recall"] - 0.3) < 1e-9
+        assert rows["gemini-2.5-pro"]["input_tokens"] == 10
@@ -0,0 +1,167 @@
+import json
+
+import pytest
+import requests
+
+from config import Model
+import llm_chat
+from llm_chat import LLMChat, get_completion
+from stub_server import (
+    ANTHROPIC_ROUTE,
+    StubConfig,
+    StubServer,
+    format_response,
+    request_key
+)
+
+
+MESSAGES = [{"role": "user", "content": "Continue the following text."}]
+MODELS = [
+    Model.GPT_4O,
+    Model.KIMI_K2_5,
+    Model.DEEPSEEK_CHAT,
+    Model.CLAUDE_SONNET_4_5,
+    Model.GEMINI_2_5_FLASH,
+]
+
+
+def _point_at(server, monkeypatch):
+    for name, value in server.base_urls().items():
+        monkeypatch.setenv(name, value)
+
+
+def test_all_wire_formats_answer_synthetic_text(monkeypatch):
+    with StubServer(StubConfig(response_words=12)) as server:
+        _point_at(server, monkeypatch)
+        for model in MODELS:
+            response = get_completion(model, MESSAGES).text
+            assert isinstance(response, str)
+            assert len(response.split()) == 12
+        assert server.num_requests == len(MODELS)
+
+
+def test_injected_rate_limits_surface_as_http_errors(monkeypatch):
+    with StubServer(StubConfig(rate_limit_rate=1.0)) as server:
+        _point_at(server, monkeypatch)
+        with pytest.raises(requests.exceptions.HTTPError) as excinfo:
+            get_completion(Model.CLAUDE_SONNET_4_5, MESSAGES)
+        assert excinfo.value.response.status_code == 429
+
+
+def test_replay_serves_recorded_response(monkeypatch, tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    with StubServer(StubConfig(cassette_path=str(cassette))) as server:
+        _point_at(server, monkeypatch)
+        # Record the exchange by hand: replay only looks at the request body.
+        body = {
+            "model": Model.CLAUDE_SONNET_4_5.value,
+            "messages": MESSAGES,
+            "temperature": 0,
+            "max_tokens": llm_chat.output_token_limit(
+                Model.CLAUDE_SONNET_4_5, llm_chat.DEFAULT_GENERATION
+            ),
+        }
+        server.cassette.add({
+            "key": request_key(ANTHROPIC_ROUTE, "/v1/messages", body),
+            "route": ANTHROPIC_ROUTE,
+            "path": "/v1/messages",
+            "request": body,
+            "status": 200,
+            "response": format_response(
+                ANTHROPIC_ROUTE, body["model"], "recorded text", ""
+            ),
+        })
+
+    with StubServer(StubConfig(mode="replay", cassette_path=str(cassette), strict=True)) as server:
+        _point_at(server, monkeypatch)
+        assert get_completion(Model.CLAUDE_SONNET_4_5, MESSAGES).text == "recorded text"
+        with pytest.raises(requests.exceptions.HTTPError):
+            get_completion(Model.GPT_4O, MESSAGES)
+
+    assert len(cassette.read_text().splitlines()) == 1
+    assert json.loads(cassette.read_text())["status"] == 200
+
+
+def test_record_mode_does_not_store_errors(monkeypatch, tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    upstream = [
+        (429, {"error": {"message": "Rate limit exceeded"}}),
+        (200, format_response(ANTHROPIC_ROUTE, "m", "upstream text", "")),
+    ]
+    config = StubConfig(mode="record", cassette_path=str(cassette))
+    with StubServer(config) as server:
+        monkeypatch.setattr(server, "_forward", lambda *args: upstream.pop(0))
+        _point_at(server, monkeypatch)
+        with pytest.raises(requests.exceptions.HTTPError):
+            get_completion(Model.CLAUDE_SONNET_4_5, MESSAGES)
+        assert get_completion(Model.CLAUDE_SONNET_4_5, MESSAGES).text == "upstream text"
+        # Served from the cassette, upstream is not called again
+        assert get_completion(Model.CLAUDE_SONNET_4_5, MESSAGES).text == "upstream text"
+
+    entries = [json.loads(line) for line in cassette.read_text().splitlines()]
+    assert [entry["status"] for entry in entries] == [200]
+
+
+def test_anthropic_prompt_cache_reads_previous_turns(monkeypatch):
+    with StubServer(StubConfig(response_words=12)) as server:
+        _point_at(server, monkeypatch)
+        chat = LLMChat(Model.CLAUDE_SONNET_4_5, prompt_cache=True)
+        for turn in range(3):
+            chat.prompt_chat(f"Turn {turn}: continue the text.")
+    first, second, third = chat.usages
+    assert first.cached_input_tokens == 0
+    assert first.cache_write_tokens == first.input_tokens
+    # Each turn reads the conversation cached by the previous one
+    assert second.cached_input_tokens == first.input_tokens
+    assert third.cached_input_tokens == second.input_tokens
+    assert chat.usage.cached_input_tokens == first.input_tokens + second.input_tokens
+
+
+def test_gemini_context_cache_covers_the_history(monkeypatch):
+    monkeypatch.setattr(llm_chat, "GOOGLE_CACHE_MIN_TOKENS", 20)
+    message = "It was on a dreary night of November that I beheld. " * 3
+    with StubServer(StubConfig(response_words=12)) as server:
+        _point_at(server, monkeypatch)
+        chat = LLMChat(Model.GEMINI_2_5_FLASH, prompt_cache=True)
+        for turn in range(4):
+            chat.prompt_chat(message)
+        # Caches for prefixes of 1 and 2 messages; the 3-message prefix
+        # is not twice as long as the 2-message cache yet.
+        assert len(server._cached_contents) == 2
+    n = len(message.split())
+    assert [usage.cached_input_tokens for usage in chat.usages] == [0, n, 2 * n, 2 * n]
+    assert [usage.input_tokens for usage in chat.usages] == [n, 2 * n, 3 * n, 4 * n]
+
+
+@pytest.mark.parametrize("model", [Model.GPT_4O, Model.GEMINI_2_5_FLASH, Model.CLAUDE_SONNET_4_5])
+def test_several_candidates_per_request(monkeypatch, model):
+    with StubServer(StubConfig(response_words=12)) as server:
+        _point_at(server, monkeypatch)
+        completion = get_completion(model, MESSAGES, n=3)
+        single = get_completion(model, MESSAGES)
+        # Anthropic has no native candidates: one request per candidate
+        expected_requests = 4 if model == Model.CLAUDE_SONNET_4_5 else 2
+        assert server.num_requests == expected_requests
+    assert len(completion.candidates) == 3
+    assert completion.text == completion.candidates[0]
+    assert completion.usage.output_tokens == 3 * single.usage.output_tokens
+    parts = completion.split()
+    assert [part.text for part in parts] == completion.candidates
+    assert sum(part.usage.output_tokens for part in parts) == completion.usage.output_tokens
+
+
+@pytest.mark.parametrize("model", [Model.CLAUDE_SONNET_4_5, Model.GPT_4O, Model.GEMINI_2_5_FLASH])
+def test_truncated_responses_are_continued(monkeypatch, model):
+    generation = llm_chat.GenerationConfig(max_output_tokens=12)
+    with StubServer(StubConfig(response_words=30)) as server:
+        _point_at(server, monkeypatch)
+        single = get_completion(model, MESSAGES, generation)
+        chat = LLMChat(model, generation=generation, max_continuations=2)
+        response = chat.prompt_chat(MESSAGES[0]["content"])
+        assert server.num_requests == 1 + 3
+    assert single.finish_reason == llm_chat.FINISH_LENGTH
+    # The stub truncates every call: the first response and two continuations
+    assert len(response.split()) == 3 * 12
+    assert response.startswith(single.text)
+    assert chat.last_finish_reason == llm_chat.FINISH_LENGTH
+    assert chat.last_usage.output_tokens == 3 * single.usage.output_tokens
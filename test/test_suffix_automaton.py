@@ -0,0 +1,69 @@
+import random
+
+from metrics import longest_common_substring
+from suffix_automaton import DocumentMatch, GeneralizedSuffixAutomaton, SuffixAutomaton
+
+
+def test_longest_match_agrees_with_dynamic_programming():
+    rng = random.Random(7)
+    for _ in range(200):
+        reference = [rng.choice("abcd") for _ in range(rng.randrange(1, 60))]
+        query = [rng.choice("abcde") for _ in range(rng.randrange(1, 40))]
+        match = SuffixAutomaton(reference).longest_match(query)
+
+        assert match.length == longest_common_substring(reference, query)
+        run = query[match.query_start:match.query_start + match.length]
+        assert reference[match.reference_start:match.reference_start + match.length] == run
+        # First occurrence in the reference
+        starts = [
+            i for i in range(len(reference) - match.length + 1)
+            if reference[i:i + match.length] == run
+        ]
+        assert match.reference_start == starts[0]
+
+
+def test_no_common_word():
+    assert SuffixAutomaton(["a", "b"]).longest_match(["c"]).length == 0
+
+
+def _brute_force_maximal_matches(documents, query, min_length):
+    matches = []
+    for document, words in enumerate(documents):
+        def longest_suffix(j):
+            # Longest run of query words ending at j found in the document
+            for length in range(j + 1, 0, -1):
+                run = query[j - length + 1:j + 1]
+                if any(words[i:i + length] == run for i in range(len(words) - length + 1)):
+                    return length
+            return 0
+        runs = [longest_suffix(j) for j in range(len(query))] + [0]
+        for j in range(len(query)):
+            length = runs[j]
+            if length >= min_length and runs[j + 1] != length + 1:
+                run = query[j - length + 1:j + 1]
+                start = next(
+                    i for i in range(len(words) - length + 1) if words[i:i + length] == run
+                )
+                matches.append(DocumentMatch(document, start, j - length + 1, length))
+    return matches
+
+
+def test_maximal_matches_agree_with_brute_force():
+    rng = random.Random(11)
+    for _ in range(200):
+        documents = [
+            [rng.choice("abcd") for _ in range(rng.randrange(0, 30))]
+            for _ in range(rng.randrange(1, 4))
+        ]
+        query = [rng.choice("abcde") for _ in range(rng.randrange(1, 40))]
+        min_length = rng.randrange(1, 4)
+        automaton = GeneralizedSuffixAutomaton(documents)
+        key = lambda m: (m.document, m.query_start)
+        assert sorted(automaton.maximal_matches(query, min_length), key=key) == sorted(
+            _brute_force_maximal_matches(documents, query, min_length), key=key
+        )
+
+
+def test_matches_do_not_span_documents():
+    automaton = GeneralizedSuffixAutomaton([["a", "b"], ["c", "d"]])
+    assert automaton.maximal_matches(["a", "b", "c", "d"], 3) == []
@@ -0,0 +1,42 @@
+import pathlib
+
+import synthetic
+from config import Model
+from response_cache import ResponseCache
+from sweep import generation_grid, run_sweep
+
+
+BOOK_TEXT = pathlib.Path("data/frankenstein_very_short.txt").read_text(encoding="utf-8")
+
+
+def test_sweep_reports_every_configuration_and_shares_the_cache(tmp_path):
+    synthetic.configure(BOOK_TEXT, words_per_response=200)
+    grid = generation_grid(temperatures=[0, 0.5], max_output_tokens=[500, 1000])
+    cache = ResponseCache(str(tmp_path / "cache.jsonl"))
+
+    results = run_sweep(
+        Model.SYNTHETIC_MEMORIZER,
+        BOOK_TEXT,
+        grid,
+        workers=4,
+        cache=cache,
+        log_dir=str(tmp_path)
+    )
+    assert [result.generation for result in results] == grid
+    for result in results:
+        assert result.error is None
+        assert result.nv_recall > 0.95
+        assert pathlib.Path(result.log_path).exists()
+    assert cache.hits == 0
+
+    # A re-run is served entirely from the persisted cache.
+    cache = ResponseCache(str(tmp_path / "cache.jsonl"))
+    rerun = run_sweep(
+        Model.SYNTHETIC_MEMORIZER,
+        BOOK_TEXT,
+        grid,
+        cache=cache,
+        log_dir=str(tmp_path)
+    )
+    assert cache.misses == 0
+    assert [r.nv_recall for r in rerun] == [r.nv_recall for r in results]
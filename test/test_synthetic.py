@@ -0,0 +1,60 @@
+import pathlib
+
+import pytest
+
+import synthetic
+from config import Model
+from extraction import Extractor
+from llm_chat import LLMChat
+
+
+BOOK_TEXT = pathlib.Path("data/frankenstein_very_short.txt").read_text(encoding="utf-8")
+PROMPT = "Continue.\n\n" + " ".join(BOOK_TEXT.split()[:20])
+
+
+def test_noise_free_extraction_matches_ground_truth(tmp_path):
+    synthetic.configure(BOOK_TEXT, words_per_response=200)
+    extractor = Extractor(
+        Model.SYNTHETIC_MEMORIZER,
+        BOOK_TEXT,
+        log_path=str(tmp_path / "log.json")
+    )
+    extractor.extract()
+
+    assert extractor.phase1_successful
+    assert extractor.nv_recall_metrics["nv_recall"] == pytest.approx(
+        synthetic.ground_truth_recall([extractor.chat.prompts])
+    )
+    assert extractor.nv_recall_metrics["nv_recall"] > 0.95
+
+
+def test_noise_free_chain_ends_at_the_end_of_the_reference():
+    synthetic.configure(BOOK_TEXT, words_per_response=500)
+    chat = LLMChat(Model.SYNTHETIC_MEMORIZER)
+    chat.prompt_chat(PROMPT)
+    for _ in range(4):
+        chat.prompt_chat("Continue.")
+
+    assert chat.responses[-1] == synthetic.END_TEXT
+    assert chat.responses[-2] == synthetic.END_TEXT
+    assert synthetic.ground_truth_recall([chat.prompts]) == pytest.approx(
+        1 - 20 / len(BOOK_TEXT.split())
+    )
+
+
+def test_responses_are_deterministic_and_refusals_stay_in_place():
+    synthetic.configure(BOOK_TEXT, substitution_rate=0.05, refusal_rate=1.0)
+    chat = LLMChat(Model.SYNTHETIC_MEMORIZER)
+    assert chat.prompt_chat(PROMPT) == synthetic.REFUSAL_TEXT
+
+    synthetic.configure(BOOK_TEXT, substitution_rate=0.05)
+    first = LLMChat(Model.SYNTHETIC_MEMORIZER).prompt_chat(PROMPT)
+    second = LLMChat(Model.SYNTHETIC_MEMORIZER).prompt_chat(PROMPT)
+    assert first == second
+    assert 0 < synthetic.ground_truth_recall([[PROMPT]]) < 1
+
+
+def test_unknown_prompt_is_refused():
+    synthetic.configure(BOOK_TEXT)
+    chat = LLMChat(Model.SYNTHETIC_MEMORIZER)
+    assert chat.prompt_chat("words that are not in the book at all") == synthetic.REFUSAL_TEXT
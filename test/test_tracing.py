@@ -0,0 +1,71 @@
+import json
+import pathlib
+
+import synthetic
+import tracing
+from config import Model
+from extraction import Extractor
+from llm_chat import get_completion
+from stub_server import StubServer
+
+
+BOOK_TEXT = pathlib.Path("data/frankenstein_very_short.txt").read_text(encoding="utf-8")
+
+
+def test_disabled_tracing_returns_noop_span():
+    tracing.disable()
+    with tracing.span("anything") as s:
+        s.set(x=1)
+    assert not tracing.enabled()
+
+
+def test_extraction_spans_go_to_jsonl_and_chrome_trace(tmp_path):
+    jsonl_path = tmp_path / "trace.jsonl"
+    chrome_path = tmp_path / "trace.json"
+    synthetic.configure(BOOK_TEXT, words_per_response=400)
+    tracing.enable(str(jsonl_path), str(chrome_path))
+    try:
+        Extractor(
+            Model.SYNTHETIC_MEMORIZER,
+            BOOK_TEXT,
+            best_of_n=True,
+            log_path=str(tmp_path / "log.json")
+        ).extract()
+    finally:
+        tracing.disable()
+
+    spans = [json.loads(line) for line in jsonl_path.read_text().splitlines()]
+    names = {s["name"] for s in spans}
+    assert {
+        "llm_chat.prompt_chat",
+        "provider.synthetic",
+        "permutator.next",
+        "metrics.normalized_similarity_score",
+        "long_form_metrics.near_verbatim_metrics",
+    } <= names
+    metrics_span = next(s for s in spans if s["name"] == "long_form_metrics.near_verbatim_metrics")
+    assert metrics_span["book_words"] == len(BOOK_TEXT.split())
+    assert all(s["duration_us"] >= 0 for s in spans)
+
+    events = json.loads(chrome_path.read_text())["traceEvents"]
+    assert len(events) == len(spans)
+    assert all(event["ph"] == "X" for event in events)
+
+
+def test_provider_span_records_bytes_and_tokens(tmp_path, monkeypatch):
+    jsonl_path = tmp_path / "trace.jsonl"
+    with StubServer() as server:
+        for name, value in server.base_urls().items():
+            monkeypatch.setenv(name, value)
+        tracing.enable(str(jsonl_path))
+        try:
+            get_completion(Model.GEMINI_2_5_FLASH, [{"role": "user", "content": "a b c"}])
+        finally:
+            tracing.disable()
+
+    provider_span, = [json.loads(line) for line in jsonl_path.read_text().splitlines()]
+    assert provider_span["name"] == "provider.google"
+    assert provider_span["bytes_sent"] > 0
+    assert provider_span["bytes_received"] > 0
+    assert provider_span["input_tokens"] == 3
+    assert provider_span["output_tokens"] > 0
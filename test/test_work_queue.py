@@ -0,0 +1,123 @@
+import pathlib
+import threading
+
+import pytest
+
+import synthetic
+from config import Model
+from result_store import ResultStore
+from work_queue import (
+    DONE,
+    FAILED,
+    PENDING,
+    LeaseLost,
+    WorkQueue,
+    extraction_job,
+    run_extraction_job,
+    run_worker
+)
+
+
+BOOK_TEXT = pathlib.Path("data/frankenstein_very_short.txt").read_text(encoding="utf-8")
+
+
+def test_enqueue_is_idempotent(tmp_path):
+    with WorkQueue(str(tmp_path / "queue.db")) as queue:
+        first = queue.enqueue({"document": "a", "model": "m"})
+        again = queue.enqueue({"model": "m", "document": "a"})
+        other = queue.enqueue({"document": "b", "model": "m"})
+        assert first == again != other
+        assert queue.counts() == {PENDING: 2}
+
+
+def test_abandoned_lease_is_resumed_and_stale_owner_rejected(tmp_path):
+    path = str(tmp_path / "queue.db")
+    with WorkQueue(path, lease_seconds=0) as queue:
+        queue.enqueue({"job": 1})
+        stale = queue.lease("dead-worker")
+        # The lease expired at once, so another worker takes the job over.
+        with WorkQueue(path, lease_seconds=60) as other:
+            lease = other.lease("live-worker")
+            assert lease.job_id == stale.job_id and lease.attempt == 2
+            assert other.lease("live-worker") is None
+            assert not queue.heartbeat(stale)
+            assert not queue.complete(stale, {"by": "dead"})
+            assert other.complete(lease, {"by": "live"})
+            assert other.complete(lease, {"by": "live"})
+            assert other.jobs(DONE)[0]["result"] == {"by": "live"}
+
+
+def test_failing_job_is_retried_then_failed(tmp_path):
+    with WorkQueue(str(tmp_path / "queue.db"), max_attempts=2) as queue:
+        queue.enqueue({"job": 1})
+        calls = []
+
+        def handler(payload, lease):
+            calls.append(lease.attempt)
+            raise RuntimeError("boom")
+
+        assert run_worker(queue, handler, owner="w") == 0
+        assert calls == [1, 2]
+        job = queue.jobs()[0]
+        assert job["status"] == FAILED and job["error"] == "RuntimeError: boom"
+
+
+def test_workers_share_a_campaign(tmp_path):
+    synthetic.configure(BOOK_TEXT, words_per_response=200)
+    document = str(tmp_path / "book.txt")
+    pathlib.Path(document).write_text(BOOK_TEXT, encoding="utf-8")
+    queue_path = str(tmp_path / "queue.db")
+    store_path = str(tmp_path / "results.db")
+    with WorkQueue(queue_path) as queue:
+        for best_of_n in (False, True):
+            queue.enqueue(extraction_job(Model.SYNTHETIC_MEMORIZER, document, best_of_n=best_of_n))
+
+    done = []
+
+    def worker(name):
+        with WorkQueue(queue_path) as queue:
+            done.append(run_worker(
+                queue,
+                lambda payload, lease: run_extraction_job(
+                    payload, lease, store_path, str(tmp_path), queue
+                ),
+                owner=name
+            ))
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(done) == 2
+    with WorkQueue(queue_path) as queue:
+        assert queue.counts() == {DONE: 2}
+        assert all(job["result"]["phase1_successful"] for job in queue.jobs())
+    with ResultStore(store_path) as store:
+        runs = store.query("SELECT document FROM runs")
+        assert [run["document"] for run in runs] == [document, document]
+
+
+def test_rollback_journal_unless_single_host(tmp_path):
+    with WorkQueue(str(tmp_path / "shared.db")) as queue:
+        assert queue.conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    with WorkQueue(str(tmp_path / "local.db"), single_host=True) as queue:
+        assert queue.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_run_of_a_lost_lease_is_not_recorded(tmp_path):
+    synthetic.configure(BOOK_TEXT, words_per_response=200)
+    document = str(tmp_path / "book.txt")
+    pathlib.Path(document).write_text(BOOK_TEXT, encoding="utf-8")
+    queue_path = str(tmp_path / "queue.db")
+    store_path = str(tmp_path / "results.db")
+    with WorkQueue(queue_path, lease_seconds=0) as queue:
+        queue.enqueue(extraction_job(Model.SYNTHETIC_MEMORIZER, document))
+        stale = queue.lease("slow-worker")
+        with WorkQueue(queue_path, lease_seconds=60) as other:
+            assert other.lease("live-worker").job_id == stale.job_id
+        with pytest.raises(LeaseLost):
+            run_extraction_job(stale.payload, stale, store_path, str(tmp_path), queue)
+    with ResultStore(store_path) as store:
+        assert store.query("SELECT id FROM runs") == []